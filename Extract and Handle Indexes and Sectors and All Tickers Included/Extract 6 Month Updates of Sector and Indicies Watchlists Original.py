@@ -6,6 +6,14 @@ import datetime
 import csv
 import time
 import sys
+from pathlib import Path
+
+# Shared Oracle session pool (db_pool) lives with the resampling modules
+sys.path.insert(
+    0, str(Path(__file__).resolve().parents[1] / "Resamping Stock Data TFs Scripts")
+)
+
+from db_pool import acquire  # noqa: E402
 sqllists = ["""SELECT CASE30_COMPANIES.SYMBOL_CODE ,  SYMBOLINFO.REUTERS
                     from CASE30_COMPANIES LEFT JOIN SYMBOLINFO
                     ON CASE30_COMPANIES.SYMBOL_CODE = SYMBOLINFO.SYMBOL_CODE 
@@ -51,7 +59,7 @@ sqllists = ["""SELECT CASE30_COMPANIES.SYMBOL_CODE ,  SYMBOLINFO.REUTERS
 
 indiceslists = ["EGX30","EGX50","EGX70","EGX100","EGX30TR","EGX_Shariah","EGX35-LV"]
 
-con = cx_Oracle.connect('STOCK/P3rXdM5HbSgQRmCS@10.1.20.41:1521/STOCK')
+con = acquire()
 cursor = con.cursor()  
 for (sqlquary,indexname) in  zip(sqllists, indiceslists):
         df_sectors = pd.read_sql(sqlquary, con)
@@ -72,7 +80,6 @@ for (sqlquary,indexname) in  zip(sqllists, indiceslists):
 print("Extract Indices WatchLists From Database and Save them in the Path done (^ th-nks ^)")
 print("------------------------------------------------------------------------------------")
 print("------------------------------------------------------------------------------------")
-con = cx_Oracle.connect('STOCK/P3rXdM5HbSgQRmCS@10.1.20.41:1521/STOCK')
 sql="SELECT * FROM  STOCK.CASE_SECTOR_INDEX"
 cursor = con.cursor()     
 sectors = pd.read_sql(sql, con)
@@ -11,13 +11,20 @@ Author: Ahmad Elsayed
 import pandas as pd
 import cx_Oracle
 from pathlib import Path
+import sys
+
+# Shared Oracle session pool (db_pool) lives with the resampling modules
+sys.path.insert(
+    0, str(Path(__file__).resolve().parents[1] / "Resamping Stock Data TFs Scripts")
+)
+
+from db_pool import acquire  # noqa: E402
+from index_membership import IndexMembership  # noqa: E402
 
 
 # ------------------------------------------------------------------
 # Configuration
 # ------------------------------------------------------------------
-DB_DSN = "STOCK/P3rXdM5HbSgQRmCS@10.1.20.41:1521/STOCK"
-
 INDICES_PATH = Path(
     r"C:\AhmedElsayed-Reliable Work Space\Extract Data from DB\Extract_Indicies&Sectors\Indices WLs"
 )
@@ -26,56 +33,15 @@ SECTORS_PATH = Path(
     r"C:\AhmedElsayed-Reliable Work Space\Extract Data from DB\Extract_Indicies&Sectors\Sectors WLs"
 )
 
-INDICES_QUERIES = {
-    "EGX30": """
-        SELECT C.SYMBOL_CODE, S.REUTERS
-        FROM CASE30_COMPANIES C
-        LEFT JOIN SYMBOLINFO S
-        ON C.SYMBOL_CODE = S.SYMBOL_CODE
-        ORDER BY S.REUTERS
-    """,
-    "EGX50": """
-        SELECT E.SYMBOL_CODE, S.REUTERS
-        FROM EGX50_SYMBOLS E
-        LEFT JOIN SYMBOLINFO S
-        ON E.SYMBOL_CODE = S.SYMBOL_CODE
-        ORDER BY S.REUTERS
-    """,
-    "EGX70": """
-        SELECT E.SYMBOL_CODE, S.REUTERS
-        FROM EGX70_SYMBOLS E
-        LEFT JOIN SYMBOLINFO S
-        ON E.SYMBOL_CODE = S.SYMBOL_CODE
-        ORDER BY S.REUTERS
-    """,
-    "EGX100": """
-        SELECT E.SYMBOL_CODE, S.REUTERS
-        FROM EGX100_SYMBOLS E
-        LEFT JOIN SYMBOLINFO S
-        ON E.SYMBOL_CODE = S.SYMBOL_CODE
-        ORDER BY S.REUTERS
-    """,
-    "EGX30TR": """
-        SELECT E.SYMBOL_CODE, S.REUTERS
-        FROM EGX30_SYMBOLS_TR E
-        LEFT JOIN SYMBOLINFO S
-        ON E.SYMBOL_CODE = S.SYMBOL_CODE
-        ORDER BY S.REUTERS
-    """,
-    "EGX_Shariah": """
-        SELECT E.SYMBOL_CODE, S.REUTERS
-        FROM EGX_SHARIAH_SYMBOLS E
-        LEFT JOIN SYMBOLINFO S
-        ON E.SYMBOL_CODE = S.SYMBOL_CODE
-        ORDER BY S.REUTERS
-    """,
-    "EGX35-LV": """
-        SELECT E.SYMBOL_CODE, S.REUTERS
-        FROM EGX_VOLATILITY_SYMBOLS E
-        LEFT JOIN SYMBOLINFO S
-        ON E.SYMBOL_CODE = S.SYMBOL_CODE
-        ORDER BY S.REUTERS
-    """
+# Watchlist file → index (constituents from index_membership)
+INDEX_WATCHLISTS = {
+    "EGX30": "EGX30",
+    "EGX50": "EGX50",
+    "EGX70": "EGX70",
+    "EGX100": "EGX100",
+    "EGX30TR": "EGX30TR",
+    "EGX_Shariah": "SHARIAH",
+    "EGX35-LV": "EGX35-LV",
 }
 
 
@@ -84,9 +50,10 @@ INDICES_QUERIES = {
 # ------------------------------------------------------------------
 def create_db_connection() -> cx_Oracle.Connection:
     """
-    Create and return an Oracle database connection.
+    Take an Oracle database session from the shared pool
+    (DSN from STOCK_DB_DSN, see db_pool).
     """
-    connection = cx_Oracle.connect(DB_DSN)
+    connection = acquire()
     print(f"Connected to Oracle DB - Version: {connection.version}")
     return connection
 
@@ -116,17 +83,21 @@ def save_watchlist(symbols: pd.Series, file_path: Path) -> None:
 def extract_indices_watchlists(connection: cx_Oracle.Connection) -> None:
     """
     Extract indices symbols and save them as watchlist files.
+
+    The membership of every index is queried at once (and the shared
+    snapshot refreshed, so the loops pick up the new constituents too).
     """
-    for index_name, query in INDICES_QUERIES.items():
-        df = pd.read_sql(query, connection)
+    membership = IndexMembership()
+    membership.refresh(connection)
 
-        df["REUTERS"] = df["REUTERS"].apply(normalize_reuters_symbol)
+    for index_name, index in INDEX_WATCHLISTS.items():
+        symbols = pd.Series(membership.members(index), dtype=object)
 
         print(f"Index :: {index_name}")
-        print(f"Symbols Count :: {df['REUTERS'].count()}")
+        print(f"Symbols Count :: {symbols.count()}")
 
         save_watchlist(
-            df["REUTERS"],
+            symbols,
             INDICES_PATH / f"{index_name}.tls"
         )
 
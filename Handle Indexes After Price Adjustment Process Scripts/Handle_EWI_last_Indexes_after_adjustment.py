@@ -12,12 +12,14 @@ import pandas as pd
 import cx_Oracle
 from datetime import datetime
 from pathlib import Path
+import sys
 
+# Shared Oracle session pool (db_pool) lives with the resampling modules
+sys.path.insert(
+    0, str(Path(__file__).resolve().parents[1] / "Resamping Stock Data TFs Scripts")
+)
 
-# ------------------------------------------------------------------
-# Database Configuration
-# ------------------------------------------------------------------
-DB_DSN = "STOCK/P3rXdM5HbSgQRmCS@10.1.20.41:1521/STOCK"
+from db_pool import acquire  # noqa: E402
 
 
 # ------------------------------------------------------------------
@@ -25,9 +27,10 @@ DB_DSN = "STOCK/P3rXdM5HbSgQRmCS@10.1.20.41:1521/STOCK"
 # ------------------------------------------------------------------
 def create_db_connection() -> cx_Oracle.Connection:
     """
-    Create and return an Oracle database connection.
+    Take an Oracle database session from the shared pool
+    (DSN from STOCK_DB_DSN, see db_pool).
     """
-    connection = cx_Oracle.connect(DB_DSN)
+    connection = acquire()
     print(f"Connected to Oracle DB - Version: {connection.version}")
     return connection
 
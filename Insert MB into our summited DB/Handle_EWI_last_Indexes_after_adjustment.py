@@ -5,12 +5,20 @@ import datetime
 import csv
 import time
 import sys
+from pathlib import Path
+
+# Shared Oracle session pool (db_pool) lives with the resampling modules
+sys.path.insert(
+    0, str(Path(__file__).resolve().parents[1] / "Resamping Stock Data TFs Scripts")
+)
+
+from db_pool import acquire  # noqa: E402
 #--------------------------------------------------------------------------
 #--------------------------------------------------------------------------
 # Access on Orcale DataBase :
 def dbConnect():
     '''
-    creates a standalone connection with the database
+    takes a connection from the shared session pool (db_pool)
     parameters:
         none
         
@@ -18,7 +26,7 @@ def dbConnect():
        con: cx_oracle connection
     '''
     
-    con = cx_Oracle.connect('STOCK/P3rXdM5HbSgQRmCS@10.1.20.41:1521/STOCK')
+    con = acquire()
     print (con.version)
     return con
 #--------------------------------------------------------------------------
@@ -53,9 +61,7 @@ for file in exlfiles :
     tbIns.set_index("BARTIMESTAMP"   , inplace=True)
     tbIns.sort_index(ascending = True, inplace=True)
 
-    # insert that first set of rows
-    con=dbConnect()
-    cur = con.cursor()
+    # insert that first set of rows (same connection for every file)
     lines=[]
     for index,row in tbIns.iterrows():
         try:
@@ -5,23 +5,30 @@ Author: Ahmad Elsayed
 """
 
 import os
+import sys
 import csv
 import cx_Oracle
 import pandas as pd
 from datetime import date
+from pathlib import Path
 from typing import Dict, List
 
+# Shared Oracle session pool (db_pool) lives with the resampling modules
+sys.path.insert(
+    0, str(Path(__file__).resolve().parents[1] / "Resamping Stock Data TFs Scripts")
+)
+
+from db_pool import acquire, release  # noqa: E402
+
 
 # =========================================================
 # Database Utilities
 # =========================================================
 def get_oracle_connection() -> cx_Oracle.Connection:
     """
-    Create and return Oracle DB connection.
+    Take an Oracle DB session from the shared pool.
     """
-    connection = cx_Oracle.connect(
-        "STOCK/P3rXdM5HbSgQRmCS@10.1.20.41:1521/STOCK"
-    )
+    connection = acquire()
     print(f"Oracle Version: {connection.version}")
     return connection
 
@@ -166,6 +173,9 @@ def insert_mb_data_to_oracle(csv_path: str) -> None:
             print(f"Failed to insert record: {record}")
             print(str(exc))
 
+    # Hand the session back to the pool for the next CSV file
+    release(connection)
+
 
 # =========================================================
 # Main Workflow
@@ -10,6 +10,15 @@ Author: Ahmad Elsayed
 
 import cx_Oracle
 import datetime
+import sys
+from pathlib import Path
+
+# Shared Oracle session pool (db_pool) lives with the resampling modules
+sys.path.insert(
+    0, str(Path(__file__).resolve().parents[1] / "Resamping Stock Data TFs Scripts")
+)
+
+from db_pool import acquire  # noqa: E402
 
 
 # ------------------------------------------------------------------
@@ -27,11 +36,9 @@ ADJUST_DAY   = int(input("Set adjustment day (DD): "))
 # ------------------------------------------------------------------
 def get_db_connection() -> cx_Oracle.Connection:
     """
-    Create and return an Oracle database connection.
+    Take an Oracle database session from the shared pool.
     """
-    connection = cx_Oracle.connect(
-        "STOCK/P3rXdM5HbSgQRmCS@10.1.20.41:1521/STOCK"
-    )
+    connection = acquire()
     print(f"Connected to Oracle DB - Version: {connection.version}")
     return connection
 
@@ -4,152 +4,283 @@ Created on Wed Apr 17 14:41:08 2022
 @author: Ahmed Elsayed Ibrahim
 """
 
+import numpy as np
 import pandas as pd
-import cx_Oracle
 import time
 
+from bar_mirror import BarMirror
+from bar_sink import BarSink
+from cycle_metrics import CycleMetrics
+from db_pool import acquire, release
+from index_membership import IndexMembership
+from last_bar_cache import LastBarCache
+
 
 # ==================================================
-# Database Connection
+# EW Index Weights
 # ==================================================
-def db_connect():
+def ewi_weights(ewi_members):
     """
-    Creates a standalone connection with the Oracle database.
+    EWI × constituent weight matrix: 1 / N for the N constituents of each
+    index, 0 elsewhere. Another index is another row.
     """
-    connection = cx_Oracle.connect(
-        'STOCK/P3rXdM5HbSgQRmCS@10.1.20.41:1521/STOCK'
-    )
-    print(connection.version)
-    return connection
+
+    tickers = pd.Index(sorted(set().union(*map(set, ewi_members.values()))))
+    weights = np.zeros((len(ewi_members), len(tickers)))
+
+    for i, symbols in enumerate(ewi_members.values()):
+        if len(symbols) > 0:
+            weights[i, tickers.get_indexer(list(symbols))] = 1 / len(symbols)
+
+    return pd.DataFrame(weights, index=list(ewi_members), columns=tickers)
 
 
 # ==================================================
-# Index Constituents Fetcher
+# Gap Filling
 # ==================================================
-def index_constituents_symbols(sql_query, db_connection):
+def fill_panel(values, prior):
     """
-    Fetch index constituents symbols from database.
+    Fill the gaps of a timestamp × ticker price array column by column:
+    forward within the window, then backward, then from the prior-bar row
+    (tickers without a price in the window).
 
-    Returns:
-        list[str]: List of index constituent symbols (Reuters format)
+    Same values as the per-ticker ``ffill`` / ``bfill`` / ``fillna(prior)``
+    on the stacked grid, without a Python call per ticker.
     """
-    cursor = db_connection.cursor()
-    cursor.execute(sql_query)
-    data = cursor.fetchall()
-    symbols = [i.strip() for x in data for i in x]
-    return symbols
+
+    rows = np.arange(len(values))[:, None]
+    known = ~np.isnan(values)
+
+    # Row of the last known value at or before each row
+    last = np.maximum.accumulate(np.where(known, rows, 0), axis=0)
+    values = np.take_along_axis(values, last, axis=0)
+
+    # Row of the next known value at or after each row
+    known = ~np.isnan(values)
+    first = np.minimum.accumulate(
+        np.where(known, rows, len(values) - 1)[::-1], axis=0
+    )[::-1]
+    values = np.take_along_axis(values, first, axis=0)
+
+    return np.where(np.isnan(values), prior, values)
 
 
 # ==================================================
-# EW Index Live Update Engine
+# Constituent Prices
 # ==================================================
-def live_update_ewi_last(db_con, df_all_prices, index_symbols, last_bar_timestamp, price_columns):
+class EwiPrices:
     """
-    Build and update Equal Weighted Index (EWI) values.
+    Constituent prices of the EWI loop.
 
-    Logic preserved exactly as original implementation.
+    The latest bar of every constituent at/before the open EWI bar is kept
+    in memory (the gap-filling prior); each cycle only re-reads the bars
+    since the previous open bar, which the 5-Min loop may still be merging
+    into, and folds them into that state. The history query runs at startup
+    and for tickers entering an index only.
     """
 
-    df_ewi = pd.DataFrame()
-    df_fillna = pd.DataFrame()
-    cursor = db_con.cursor()
+    COLUMNS = ['OPEN','HIGH','LOW','CLOSE','VWAP']
 
-    for symbol in index_symbols:
+    def __init__(self):
+        self.since = None
+        self.settled = {}
 
-        # ------------------------------------------
-        # Previous prices (for filling missing data)
-        # ------------------------------------------
-        prev_prices_query = """
-            SELECT bartimestamp,ticker,open,high,low,close,vwap
-            FROM STOCK.FILL_OHLCV
-            WHERE ticker =:1 AND bartimestamp <=:2
-            ORDER BY bartimestamp DESC
+    @staticmethod
+    def _ticker_filter(tickers, timestamp, operator):
+        """
+        ``TICKER IN (...)`` on every ticker and a bound on the bar time;
+        list binds are positional, so the timestamp goes last.
+        """
+        placeholders = ",".join(f":{i + 1}" for i in range(len(tickers)))
+        sql = (
+            f"TICKER IN ({placeholders}) "
+            f"AND BARTIMESTAMP {operator} :{len(tickers) + 1}"
+        )
+        return sql, list(tickers) + [timestamp]
+
+    def load(self, db_con, tickers, since):
+        """
+        Latest bar at/before ``since`` of the given tickers, with one
+        window-function query.
+        """
+        ticker_filter, params = self._ticker_filter(tickers, since, "<=")
+        prev_prices_query = f"""
+            SELECT TICKER, OPEN, HIGH, LOW, CLOSE, VWAP
+            FROM (
+                SELECT
+                    T.TICKER, T.OPEN, T.HIGH, T.LOW, T.CLOSE, T.VWAP,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY T.TICKER
+                        ORDER BY T.BARTIMESTAMP DESC
+                    ) AS RN
+                FROM STOCK.FILL_OHLCV T
+                WHERE T.{ticker_filter}
+            )
+            WHERE RN = 1
         """
-        cursor.execute(prev_prices_query, [str(symbol), last_bar_timestamp])
 
-        prev_prices = pd.DataFrame(
-            cursor.fetchone(),
-            ['BARTIMESTAMP','TICKER','OPEN','HIGH','LOW','CLOSE','VWAP']
-        ).T
+        cursor = db_con.cursor()
+        cursor.execute(prev_prices_query, params)
+        for row in cursor.fetchall():
+            self.settled[row[0]] = [
+                np.nan if value is None else float(value) for value in row[1:]
+            ]
+        cursor.close()
 
-        df_fillna = df_fillna.append(prev_prices)
+    def update(self, db_con, tickers, since):
+        """
+        Bars of the tickers since ``since`` (the earliest open EWI bar),
+        read with one query; the bars up to it settle into the state.
 
-        # ------------------------------------------
-        # Prices used for EWI calculation
-        # ------------------------------------------
-        select_query = """
-            SELECT bartimestamp,ticker,open,high,low,close,vwap,volume
+        Returns:
+            pd.DataFrame: BARTIMESTAMP indexed bars since ``since``
+        """
+        tickers = sorted({str(symbol) for symbol in tickers})
+        if self.since is not None and since < self.since:
+            self.since = None
+            self.settled = {}
+
+        # From the previous open bar: the bars merged since then are re-read
+        # once more before they settle
+        start = since if self.since is None else self.since
+        ticker_filter, params = self._ticker_filter(tickers, start, ">=")
+        select_query = f"""
+            SELECT BARTIMESTAMP, TICKER, OPEN, HIGH, LOW, CLOSE, VWAP, VOLUME
             FROM STOCK.FILL_OHLCV
-            WHERE ticker = :1 AND bartimestamp >= :2
-            ORDER BY bartimestamp DESC
+            WHERE {ticker_filter}
+            ORDER BY BARTIMESTAMP
         """
 
-        params = [str(symbol), last_bar_timestamp]
-        df_symbol = pd.read_sql(
+        df_all_prices = pd.read_sql(
             select_query,
             db_con,
             index_col='BARTIMESTAMP',
             params=params
         )
+        df_all_prices.index = pd.to_datetime(df_all_prices.index)
 
-        df_all_prices = df_all_prices.append(df_symbol)
-        df_all_prices.sort_index(ascending=True, inplace=True)
-
-    df_fillna.set_index('TICKER', inplace=True)
+        # Tickers entering an index have no state yet; leaving ones are
+        # dropped
+        missing = [t for t in tickers if t not in self.settled]
+        self.settled = self.fold(
+            {t: self.settled[t] for t in tickers if t in self.settled},
+            df_all_prices,
+            since
+        )
+        if missing:
+            self.load(db_con, missing, since)
 
-    if not df_all_prices.empty:
+        self.since = since
+        return df_all_prices[df_all_prices.index >= since]
 
-        # ------------------------------------------
-        # Build full timestamp x ticker grid
-        # ------------------------------------------
-        df_all_dates = pd.DataFrame(
-            index=pd.MultiIndex.from_product(
-                [df_all_prices.index.unique(), index_symbols],
-                names=['BARTIMESTAMP', 'TICKER']
-            )
+    def fold(self, settled, df_all_prices, since):
+        """
+        ``settled`` advanced by the fetched bars at/before ``since`` (in
+        time order, the last one wins).
+        """
+        closed = df_all_prices[df_all_prices.index <= since]
+        settled = dict(settled)
+        settled.update(zip(
+            closed['TICKER'],
+            closed[self.COLUMNS].to_numpy(dtype=float).tolist()
+        ))
+        return settled
+
+    def prior(self, df_all_prices, since):
+        """
+        TICKER indexed latest bar per ticker at/before ``since``: the state,
+        advanced by the fetched bars up to it.
+        """
+        return pd.DataFrame.from_dict(
+            self.fold(self.settled, df_all_prices, since),
+            orient='index',
+            columns=self.COLUMNS
         )
 
-        df_all_prices = df_all_prices.set_index(
-            pd.MultiIndex.from_arrays(
-                [df_all_prices.index, df_all_prices['TICKER']],
-                names=['BARTIMESTAMP', 'TICKER']
-            )
-        )
-        del df_all_prices['TICKER']
 
-        df_total = pd.merge(
-            df_all_dates,
-            df_all_prices,
-            how='outer',
-            left_index=True,
-            right_index=True
-        )
+# ==================================================
+# EW Index Live Update Engine
+# ==================================================
+def live_update_ewi_last(ewi_members, df_all_prices, df_fillna, price_columns):
+    """
+    Build and update Equal Weighted Index (EWI) values.
 
-        df_total.sort_index(ascending=True, inplace=True)
+    The prices of the union of all constituents are filled on one
+    timestamp × ticker panel; every EWI is then the product of the panel
+    with its row of the weight matrix, over the timestamps at which one of
+    its own constituents has a bar (as computed per index before).
+
+    Parameters
+    ----------
+    ewi_members : dict
+        EWI ticker → constituents
+    df_all_prices : pd.DataFrame
+        BARTIMESTAMP indexed constituent bars since the last EWI bar
+    df_fillna : pd.DataFrame
+        TICKER indexed latest bar at/before it (``EwiPrices.prior``)
+    price_columns : list
+        Averaged price columns
 
-        # ------------------------------------------
-        # Fill missing prices
-        # ------------------------------------------
-        df_total[price_columns] = df_total[price_columns].groupby(
-            level='TICKER'
-        ).transform(lambda x: x.fillna(method='ffill'))
+    Returns:
+        dict: EWI ticker → its bars since the last EWI bar
+    """
 
-        df_total[price_columns] = df_total[price_columns].groupby(
-            level='TICKER'
-        ).transform(lambda x: x.fillna(method='bfill'))
+    df_ewi = {name: pd.DataFrame() for name in ewi_members}
+    weights = ewi_weights(ewi_members)
+    if weights.columns.empty:
+        return df_ewi
 
-        df_total[price_columns] = df_total[price_columns].fillna(df_fillna)
-        df_total['VOLUME'] = df_total['VOLUME'].fillna(0)
+    tickers = [str(symbol) for symbol in weights.columns]
+    df_all_prices = df_all_prices[df_all_prices['TICKER'].isin(tickers)]
 
-        df_total.reset_index(level='TICKER', drop=False, inplace=True)
+    if not df_all_prices.empty:
+
+        # ------------------------------------------
+        # Timestamp x ticker panels, one 2-D array per column
+        # ------------------------------------------
+        timestamps = df_all_prices.index.unique().sort_values()
+        rows = timestamps.get_indexer(df_all_prices.index)
+        columns = pd.Index(tickers).get_indexer(df_all_prices['TICKER'])
+
+        # Timestamps at which a ticker has a bar of its own
+        traded = np.zeros((len(timestamps), len(tickers)))
+        traded[rows, columns] = 1
+
+        prior = df_fillna.reindex(tickers)
+        panel = {}
+        for column in price_columns + ['VOLUME']:
+            values = np.full((len(timestamps), len(tickers)), np.nan)
+            values[rows, columns] = df_all_prices[column].to_numpy(dtype=float)
+
+            # ------------------------------------------
+            # Fill missing prices
+            # ------------------------------------------
+            if column in price_columns:
+                values = fill_panel(
+                    values, prior[column].to_numpy(dtype=float)
+                )
+            panel[column] = np.nan_to_num(values)
 
         # ------------------------------------------
         # Equal Weighted Index Calculation
         # ------------------------------------------
         scale = 1
-        df_ewi = (1 / len(index_symbols)) * df_total[price_columns]
-        df_ewi = df_ewi.groupby('BARTIMESTAMP').sum() * scale
-        df_ewi['VOLUME'] = df_total['VOLUME'].groupby('BARTIMESTAMP').sum()
+        weight_matrix = weights.to_numpy().T
+        member_matrix = (weight_matrix > 0).astype(float)
+        has_bars = traded @ member_matrix > 0
+
+        values = {
+            column: panel[column] @ weight_matrix * scale
+            for column in price_columns
+        }
+        values['VOLUME'] = panel['VOLUME'] @ member_matrix
+
+        for i, name in enumerate(weights.index):
+            rows = has_bars[:, i]
+            df_ewi[name] = pd.DataFrame(
+                {column: values[column][rows, i] for column in values},
+                index=timestamps[rows],
+            )
 
     return df_ewi
 
@@ -157,47 +288,39 @@ def live_update_ewi_last(db_con, df_all_prices, index_symbols, last_bar_timestam
 # ==================================================
 # Initialization
 # ==================================================
-con = db_connect()
-
-sql30 = "SELECT REPLACE(T2.REUTERS,'.CA','') FROM CASE30_COMPANIES T1 JOIN STOCK.SYMBOLINFO T2 ON T2.SYMBOL_CODE = T1.SYMBOL_CODE ORDER BY T2.REUTERS"
-sql70 = "SELECT REPLACE(T2.REUTERS,'.CA','') FROM EGX70_SYMBOLS T1 JOIN STOCK.SYMBOLINFO T2 ON T2.SYMBOL_CODE = T1.SYMBOL_CODE ORDER BY T2.REUTERS"
-sql100 = "SELECT REPLACE(T2.REUTERS,'.CA','') FROM EGX100_SYMBOLS T1 JOIN STOCK.SYMBOLINFO T2 ON T2.SYMBOL_CODE = T1.SYMBOL_CODE ORDER BY T2.REUTERS"
-sql34SHARIAH = "SELECT REPLACE(T2.REUTERS,'.CA','') FROM EGX_SHARIAH_SYMBOLS T1 JOIN STOCK.SYMBOLINFO T2 ON T2.SYMBOL_CODE = T1.SYMBOL_CODE ORDER BY T2.REUTERS"
-sql35_LV = "SELECT REPLACE(T2.REUTERS,'.CA','') FROM EGX_VOLATILITY_SYMBOLS T1 JOIN STOCK.SYMBOLINFO T2 ON T2.SYMBOL_CODE = T1.SYMBOL_CODE ORDER BY T2.REUTERS"
-
-egx30_symbols = index_constituents_symbols(sql30, con)
-egx70_symbols = index_constituents_symbols(sql70, con)
-egx100_symbols = index_constituents_symbols(sql100, con)
-egx34Shariah_symbols = index_constituents_symbols(sql34SHARIAH, con)
-egx35_LV_symbols = index_constituents_symbols(sql35_LV, con)
-
-egx50_symbols = [
-    "ABUK","ADIB","AMOC","ARCC","BTFH","CCAP","COMI","EAST","EFID","EFIH",
-    "EGAL","EGCH","EMFD","ETEL","FWRY","GBCO","HELI","HRHO","ISPH","JUFO",
-    "MCQE","OIH","ORAS","ORHD","ORWE","PHDC","RAYA","RMDA","TMGH","VLMR",
-    "VLMRA","MTIE","OLFI","PHAR","POUL","PRDC","SAUD","SKPC","SUGR","SWDY",
-    "TALM","ZMID","MPCO","MASR","CIEB","ALCN","DSCW","OFH","COSG","OCDI"
-]
-
-all_indices_symbols = [
-    egx30_symbols,
-    egx70_symbols,
-    egx100_symbols,
-    egx50_symbols,
-    egx35_LV_symbols,
-    egx34Shariah_symbols
-]
+con = acquire()
 
 price_columns = ['OPEN','HIGH','LOW','CLOSE','VWAP']
 
-ewi_names = [
-    'EGX30LASTEWI',
-    'EGX70LASTEWI',
-    'EGX100LASTEWI',
-    'EGX50LASTEWI',
-    'EGX35-LVLASTEWI',
-    'EGX34SHARIAHLASTEWI'
-]
+# EWI ticker → index whose constituents it weighs
+ewi_indices = {
+    'EGX30LASTEWI': 'EGX30',
+    'EGX70LASTEWI': 'EGX70',
+    'EGX100LASTEWI': 'EGX100',
+    'EGX50LASTEWI': 'EGX50',
+    'EGX35-LVLASTEWI': 'EGX35-LV',
+    'EGX34SHARIAHLASTEWI': 'SHARIAH'
+}
+
+ewi_names = list(ewi_indices)
+
+# Index constituents: one query for every index, cached with a TTL
+MEMBERSHIP = IndexMembership()
+MEMBERSHIP.update(con)
+
+# Local Parquet copy of the written bars (disabled without pyarrow)
+MIRROR = BarMirror()
+
+# Stage timers / counters: JSON log line, Prometheus textfile
+METRICS = CycleMetrics('ewi')
+
+# Constituents' latest bar at/before the open EWI bar, kept in memory
+EWI_PRICES = EwiPrices()
+
+# Latest EWI bars: one bulk query now, then kept current on write
+ewi_last_bars = LastBarCache('STOCK.FILL_OHLCV')
+ewi_last_bars.warm(con, tickers=ewi_names)
+release(con)
 
 
 # ==================================================
@@ -205,36 +328,56 @@ ewi_names = [
 # ==================================================
 while True:
 
-    con = db_connect()
-    cursor = con.cursor()
-
-    for i in range(len(ewi_names)):
+    cycle = METRICS.start()
+    con = acquire()
+    bar_sink = BarSink(
+        'STOCK.FILL_OHLCV', cache=ewi_last_bars, mirror=MIRROR
+    )
 
-        # ------------------------------------------
-        # Fetch last bar
-        # ------------------------------------------
-        last_bar_query = """
-            SELECT BARTIMESTAMP,VOLUME,OPEN,HIGH,LOW,CLOSE
-            FROM STOCK.FILL_OHLCV
-            WHERE TICKER = :1
-            ORDER BY BARTIMESTAMP DESC
-        """
-        cursor.execute(last_bar_query, [ewi_names[i]])
-        last_bar = cursor.fetchone()
+    # Constituents, re-queried only once the membership TTL expired
+    MEMBERSHIP.update(con)
+    ewi_members = {
+        name: MEMBERSHIP.members(ewi_indices[name]) for name in ewi_names
+    }
+
+    # ------------------------------------------
+    # Last bars (in-memory cache, "SELECT *" layout)
+    # ------------------------------------------
+    last_bars = {name: ewi_last_bars.get(name) for name in ewi_names}
+
+    # EWIs sharing a last bar time share one price panel (normally all)
+    panels = {}
+    for name in ewi_names:
+        panels.setdefault(last_bars[name][6], {})[name] = ewi_members[name]
+
+    # Constituent bars since the earliest open EWI bar (one query; the
+    # history is only read at startup / for new constituents)
+    with cycle.stage('fetch'):
+        window = EWI_PRICES.update(
+            con, set().union(*ewi_members.values()), min(panels)
+        )
+    cycle.count('rows_fetched', len(window))
+
+    ewi_bars = {}
+    with cycle.stage('compute'):
+        for last_time, members in panels.items():
+            ewi_bars.update(live_update_ewi_last(
+                members,
+                window[window.index >= last_time],
+                EWI_PRICES.prior(window, last_time),
+                price_columns
+            ))
+    cycle.count('symbols', len(set().union(*ewi_members.values())))
+    cycle.count('indices', len(ewi_names))
 
-        all_prices = pd.DataFrame()
+    for i in range(len(ewi_names)):
 
-        df_ewi = live_update_ewi_last(
-            con,
-            all_prices,
-            all_indices_symbols[i],
-            last_bar[0],
-            price_columns
-        )
+        last_bar = last_bars[ewi_names[i]]
+        df_ewi = ewi_bars[ewi_names[i]]
 
         if not df_ewi.empty:
-            tb_insert = df_ewi[df_ewi.index > last_bar[0]]
-            tb_update = df_ewi[df_ewi.index == last_bar[0]]
+            tb_insert = df_ewi[df_ewi.index > last_bar[6]]
+            tb_update = df_ewi[df_ewi.index == last_bar[6]]
         else:
             tb_insert = df_ewi.copy()
             tb_update = []
@@ -242,19 +385,11 @@ while True:
         # ------------------------------------------
         # Update
         # ------------------------------------------
-        if len(tb_update) > 0 and tb_update['VOLUME'][0] != last_bar[1]:
-            update_query = """
-                UPDATE STOCK.FILL_OHLCV
-                SET VOLUME=:1
-                WHERE Ticker = :2 AND BARTIMESTAMP=:3
-            """
-            cursor.execute(
-                update_query,
-                [
-                    tb_update['VOLUME'].values[0].astype(float),
-                    ewi_names[i],
-                    tb_update.index.to_pydatetime()[0]
-                ]
+        if len(tb_update) > 0 and tb_update['VOLUME'].iloc[0] != last_bar[5]:
+            bar_sink.update(
+                ewi_names[i],
+                tb_update.index[0],
+                VOLUME=tb_update['VOLUME'].values[0].astype(float)
             )
             print(ewi_names[i], 'is being updated')
         else:
@@ -289,23 +424,24 @@ while True:
                         line[7] = 0
                         line[8] = row['VWAP'] * 1000
 
-                    cursor.execute(
-                        """
-                        INSERT INTO FILL_OHLCV
-                        (TICKER,OPEN,HIGH,LOW,CLOSE,VOLUME,BARTIMESTAMP,ASSET,VWAP)
-                        VALUES (:stock,:open,:high,:low,:close,:vol,:time,:1,:2)
-                        """,
-                        line
+                    bar_sink.insert(
+                        line[0], line[6],
+                        line[1], line[2], line[3], line[4], line[5],
+                        line[7], line[8]
                     )
-
-                    con.commit()
                     print(ewi_names[i], 'is being inserted')
                     print(line)
 
                 except Exception as e:
+                    cycle.error()
                     print(str(e))
         else:
             print("...")
 
-    con.close()
+    # All six indices written with array DML and a single commit
+    with cycle.stage('write'):
+        counts = bar_sink.flush(con)
+    cycle.count_sink(counts)
+    release(con)
+    METRICS.finish(cycle)
     time.sleep(60)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-Timeframe Resampling Daemon
+---------------------------------
+Single process replacing the separate 1-Min and 5-Min loops: new trades
+are read once per cycle, turned into 1-minute OHLCV + VWAP bars and rolled
+up in memory into every higher timeframe listed in TIMEFRAME_TABLES.
+CASEINDEX bars are written to the same tables as before.
+
+The loop itself is ``trade_pipeline.TradeBarLoop`` (pipelined fetch /
+compute / write stages); the 1-Min and 5-Min scripts run the same loop
+with a single timeframe.
+
+Author: Ahmad Elsayed
+"""
+
+from bar_aggregator import ClosedBarFeed
+from bar_mirror import BarMirror
+from index_membership import IndexMembership
+from sharded_bars import default_workers
+from trade_pipeline import TradeBarLoop
+from trading_calendar import TradingCalendar
+
+
+# =============================================================================
+# Configuration
+# =============================================================================
+
+# Bar frequency → target table (same layout as FILL_OHLCV, the 15, 30 and
+# 60-minute and daily ones are created by timeframe_tables.sql); None
+# disables the timeframe. Disabled timeframes and tables missing from the
+# database are reported and skipped at startup.
+TIMEFRAME_TABLES = {
+    "1Min": "STOCK.FILL_OHLCV_1MIN",
+    "5Min": "STOCK.FILL_OHLCV",
+    "15Min": "STOCK.FILL_OHLCV_15MIN",
+    "30Min": "STOCK.FILL_OHLCV_30MIN",
+    "60Min": "STOCK.FILL_OHLCV_60MIN",
+    "1D": "STOCK.FILL_OHLCV_1D",
+}
+
+# Tables receiving the 5-minute CASEINDEX bars (as the 1-Min / 5-Min loops did)
+INDEX_TABLES = ["STOCK.FILL_OHLCV_1MIN", "STOCK.FILL_OHLCV"]
+
+POLL_SECONDS = 2
+INDEX_POLL_SECONDS = 30
+
+# Worker processes for symbol-sharded bar building (1 = in-process)
+BAR_WORKERS = default_workers()
+
+# EGX sessions: polling stops outside them, bars anchor to the open
+CALENDAR = TradingCalendar.load()
+
+# Local Parquet copy of the written bars (disabled without pyarrow)
+MIRROR = BarMirror()
+
+# Index constituents: one query for every index, cached with a TTL
+MEMBERSHIP = IndexMembership()
+
+# Bars of every timeframe published as they close (feeds/multi_tf-<day>.jsonl)
+CLOSED_BARS = ClosedBarFeed("multi_tf")
+
+
+# =============================================================================
+# Main
+# =============================================================================
+
+def main():
+    """
+    Warm the cascade and caches, then run the pipeline until stopped.
+    """
+    TradeBarLoop(
+        "multi_tf",
+        TIMEFRAME_TABLES,
+        INDEX_TABLES,
+        calendar=CALENDAR,
+        mirror=MIRROR,
+        membership=MEMBERSHIP,
+        workers=BAR_WORKERS,
+        poll_seconds=POLL_SECONDS,
+        index_poll_seconds=INDEX_POLL_SECONDS,
+        publish=CLOSED_BARS,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
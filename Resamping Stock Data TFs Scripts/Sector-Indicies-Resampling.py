@@ -4,26 +4,15 @@ Created on Wed Apr 17 14:41:08 2022
 @author: Ahmed Elsayed Ibrahim
 """
 
-import pandas as pd
-import cx_Oracle
 import time
 
-
-# --------------------------------------------------
-# Database Connection
-# --------------------------------------------------
-def db_connect():
-    """
-    Establish a standalone connection with the Oracle database.
-
-    Returns:
-        cx_Oracle.Connection: Active database connection
-    """
-    connection = cx_Oracle.connect(
-        'STOCK/P3rXdM5HbSgQRmCS@10.1.20.41:1521/STOCK'
-    )
-    print(connection.version)
-    return connection
+from bar_mirror import BarMirror
+from bar_sink import BarSink, stored
+from cycle_metrics import CycleMetrics
+from db_pool import acquire, release
+from index_ticks import IndexTickStream
+from last_bar_cache import LastBarCache
+from trading_calendar import TradingCalendar
 
 
 # --------------------------------------------------
@@ -48,55 +37,85 @@ def normalize_sector_codes(df):
     return df
 
 
+# EGX sessions: polling stops outside them, bars anchor to the open
+CALENDAR = TradingCalendar.load()
+
+# Local Parquet copy of the written bars (disabled without pyarrow)
+MIRROR = BarMirror()
+
+# Stage timers / counters: JSON log line, Prometheus textfile
+METRICS = CycleMetrics('sector')
+
+
+# --------------------------------------------------
+# Sector Ticks (only those after the per-sector watermarks)
+# --------------------------------------------------
+SECTOR_TICKS_SQL = """
+    SELECT
+        REPLACE(SECTOR_DESC,' ','') AS SECTOR_CODE,
+        INDEXTIME,
+        INDEXVALUE
+    FROM CASE_SECTOR_INDEX
+    WHERE INDEXTIME >= :since
+    ORDER BY INDEXTIME
+"""
+
+# New ticks are folded into the open 5-minute session-anchored OHLC bars
+sector_ticks = IndexTickStream(
+    'sector_index_ticks',
+    SECTOR_TICKS_SQL,
+    '5Min',
+    columns=['SECTOR_CODE', 'time', 'INDEXVALUE'],
+    code_column='SECTOR_CODE',
+    value_column='INDEXVALUE',
+    prepare=normalize_sector_codes,
+    calendar=CALENDAR
+)
+
+
+# --------------------------------------------------
+# Last Bar Cache (warmed once, kept current on write)
+# --------------------------------------------------
+last_bars = LastBarCache('STOCK.FILL_OHLCV')
+startup_connection = acquire()
+last_bars.warm(startup_connection)
+release(startup_connection)
+
+
 # --------------------------------------------------
 # Main Loop
 # --------------------------------------------------
 while True:
 
-    connection = db_connect()
-    cursor = connection.cursor()
-
-    # Fetch sector index data
-    sql_sectors = """
-        SELECT
-            REPLACE(SECTOR_DESC,' ','') AS SECTOR_CODE,
-            INDEXTIME,
-            INDEXVALUE
-        FROM CASE_SECTOR_INDEX
-    """
-    df_sectors = pd.read_sql(sql_sectors, connection)
+    # Nights, weekends and holidays: sleep until the next session
+    idle = CALENDAR.idle_seconds()
+    if idle:
+        time.sleep(idle)
+        continue
 
-    # Normalize sector codes
-    df_sectors = normalize_sector_codes(df_sectors)
+    cycle = METRICS.start()
+    connection = acquire()
 
-    # Prepare dataframe
-    df_sectors.set_index('INDEXTIME', inplace=True)
-    df_sectors.index = pd.to_datetime(df_sectors.index)
-    df_sectors.dropna(inplace=True)
+    # New sector ticks → bars they touched plus every sector's open bar
+    # (session ticks only, normalized sector codes)
+    with cycle.stage('fetch'):
+        sector_bars = sector_ticks.fetch(connection.cursor())
+    cycle.count('rows_fetched', sector_ticks.rows)
 
-    sector_list = df_sectors['SECTOR_CODE'].unique()
+    bar_sink = BarSink('STOCK.FILL_OHLCV', cache=last_bars, mirror=MIRROR)
+    lookup_started = time.monotonic()
 
     # --------------------------------------------------
     # Process each sector
     # --------------------------------------------------
-    for sector in sector_list:
-
-        # Resample to 5-minute OHLC
-        ohlc_df = (
-            df_sectors[df_sectors['SECTOR_CODE'] == sector]['INDEXVALUE']
-            .resample('5Min')
-            .ohlc()
-        )
-
-        # Get last stored bar
-        sql_last_bar = """
-            SELECT *
-            FROM STOCK.FILL_OHLCV
-            WHERE Ticker = :ticker
-            ORDER BY BARTIMESTAMP DESC
-        """
-        cursor.execute(sql_last_bar, [sector.upper()])
-        last_record = cursor.fetchone()
+    for sector, ohlc_df in sector_bars.groupby(level='code', sort=False):
+
+        cycle.count('symbols')
+
+        ohlc_df = ohlc_df.droplevel('code')
+
+        # Last stored bar, served from the in-memory cache
+        last_record = last_bars.get(sector.upper())
 
         if last_record:
             bars_to_insert = ohlc_df[ohlc_df.index > last_record[6]]
@@ -109,56 +128,42 @@ while True:
 
         # Update existing bar
         if len(bars_to_update) > 0:
-            update_sql = """
-                UPDATE STOCK.FILL_OHLCV
-                SET OPEN=:1, HIGH=:2, LOW=:3, CLOSE=:4, VOLUME=:5
-                WHERE Ticker=:6 AND BARTIMESTAMP=:7
-            """
-            cursor.execute(
-                update_sql,
-                [
-                    bars_to_update['open'].values[0],
-                    bars_to_update['high'].values[0],
-                    bars_to_update['low'].values[0],
-                    bars_to_update['close'].values[0],
-                    0,
-                    sector.upper(),
-                    bars_to_update.index.to_pydatetime()[0]
-                ]
+            bar_sink.update(
+                sector.upper(),
+                bars_to_update.index[0],
+                OPEN=bars_to_update['open'].values[0],
+                HIGH=bars_to_update['high'].values[0],
+                LOW=bars_to_update['low'].values[0],
+                CLOSE=bars_to_update['close'].values[0],
+                VOLUME=0
+            )
+
+        # Queue new bars (sectors carry no volume / VWAP)
+        for timestamp, row in bars_to_insert.iterrows():
+            bar_sink.insert(
+                sector.upper(),
+                timestamp,
+                row['open'],
+                row['high'],
+                row['low'],
+                row['close'],
+                0,
+                0,
+                0
             )
 
-        # Insert new bars
-        if len(bars_to_insert) > 0:
-            for timestamp, row in bars_to_insert.iterrows():
-                try:
-                    insert_data = [
-                        sector.upper(),
-                        row['open'],
-                        row['high'],
-                        row['low'],
-                        row['close'],
-                        0,
-                        timestamp.to_pydatetime(),
-                        0,
-                        0
-                    ]
-
-                    cursor.execute(
-                        """
-                        INSERT INTO FILL_OHLCV
-                        (TICKER, OPEN, HIGH, LOW, CLOSE, VOLUME,
-                         BARTIMESTAMP, ASSET, VWAP)
-                        VALUES (:stock, :open, :high, :low, :close,
-                                :vol, :time, :1, :2)
-                        """,
-                        insert_data
-                    )
-
-                    connection.commit()
-                    print(sector.upper())
-
-                except Exception as error:
-                    print(str(error))
-
-    connection.close()
+    cycle.add_time('lookup', time.monotonic() - lookup_started)
+
+    # Write all sectors with array DML and a single commit
+    with cycle.stage('write'):
+        counts = bar_sink.flush(connection)
+    cycle.count_sink(counts)
+
+    # The watermarks move once every bar is stored
+    if stored(counts):
+        sector_ticks.commit()
+    print(f"Sectors: {counts['inserted']} inserted, {counts['updated']} updated")
+
+    release(connection)
+    METRICS.finish(cycle)
     time.sleep(30)
@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+"""
+Bar Aggregator
+--------------
+Stateful, trade-by-trade bar building for live feeds.
+
+One open bar is kept per (symbol, timeframe) and every trade updates it in
+constant time (open / high / low / close / volume plus the session's
+running price x volume). A bar is emitted as closed as soon as a trade of
+a later bucket arrives, or when ``advance`` is called with a wall-clock
+time past the bucket end, so bars can be published seconds after they
+close instead of on the next rescan of STOCK.TRADES.
+
+Buckets are anchored like ``bar_engine.bucket_starts``: to the session
+open with a ``TradingCalendar`` (trades outside a session are left out and
+a print at the close joins the last bucket), else the pandas floor. Closed
+bars therefore line up with the stored bars.
+
+The trade loop (``trade_pipeline``) feeds it the trades of every cycle and
+publishes the closed bars once their cycle is committed, e.g. through a
+``ClosedBarFeed``:
+
+    feeds/<loop>-YYYY-MM-DD.jsonl    one JSON line per closed bar
+
+Author: Ahmad Elsayed
+"""
+
+import copy
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from bar_engine import BAR_COLUMNS
+
+
+DAY_NS = pd.Timedelta("1D").value
+MICROSECOND_NS = pd.Timedelta(1, "us").value
+
+FEED_DIR = Path(__file__).resolve().parent / "feeds"
+
+
+# ==================================================
+# Bar Aggregator
+# ==================================================
+class BarAggregator:
+    """
+    Open bars per symbol and timeframe, updated one trade at a time.
+    """
+
+    def __init__(
+        self,
+        freqs: list,
+        vwap_base=None,
+        calendar=None,
+        grace_seconds: float = 0.0
+    ):
+        """
+        Parameters
+        ----------
+        freqs : list
+            Fixed pandas frequencies to build (e.g. ["1Min", "5Min"])
+        vwap_base : callable, optional
+            code -> (price x volume, volume) of the symbol's session before
+            its first trade seen here (e.g.
+            ``TradeWatermarkStore.vwap_base``); a symbol that already
+            traded has its first bucket left unpublished, since the
+            trades before it were never seen
+        calendar : TradingCalendar, optional
+            Anchor buckets to the session open (see ``trading_calendar``)
+        grace_seconds : float
+            Extra time ``advance`` waits after a bucket end before closing
+            the bar, for trades reported slightly late
+        """
+        self.freqs = list(freqs)
+        self.steps = {freq: pd.Timedelta(freq).value for freq in self.freqs}
+        self.vwap_base = vwap_base
+        self.calendar = calendar
+        self.grace = pd.Timedelta(seconds=grace_seconds).value
+
+        # (symbol, freq) → open bar dict
+        self.open = {}
+        # (symbol, freq) → start of the last bucket closed (or skipped)
+        self.closed_until = {}
+        # symbol → [session day, cum price x volume, cum volume]
+        self.sessions = {}
+        # session day → (open, close) in ns, None without a session
+        self.session_bounds = {}
+
+        self.late_trades = 0
+
+    # ------------------------------------------
+    # Buckets
+    # ------------------------------------------
+    def _session(self, day: int):
+        """
+        (open, close) of a day in ns, looked up once per day.
+        """
+        if day not in self.session_bounds:
+            session = self.calendar.session(pd.Timestamp(day * DAY_NS))
+            self.session_bounds[day] = session and (
+                session[0].value, session[1].value
+            )
+        return self.session_bounds[day]
+
+    def _bucket(self, time_ns: int, freq: str, bounds) -> tuple:
+        """
+        (start, end) in ns of the bucket of a trade, as
+        ``TradingCalendar.floor``: counted from the open, the close print
+        in the last bucket; daily buckets keep the plain floor.
+        """
+        step = self.steps[freq]
+        if bounds is None:
+            start = time_ns - time_ns % step
+            return start, start + step
+
+        session_open, session_close = bounds
+        if step >= DAY_NS:
+            start = time_ns - time_ns % step
+            return start, min(start + step, session_close + 1)
+
+        start = session_open + (time_ns - session_open) // step * step
+        last = session_open + (
+            (session_close - session_open - MICROSECOND_NS) // step * step
+        )
+        if start >= last:
+            return last, session_close + 1
+        return start, start + step
+
+    # ------------------------------------------
+    # Per-Trade Update
+    # ------------------------------------------
+    def update(self, symbol: str, time, price: float, volume: float) -> list:
+        """
+        Apply one trade to every timeframe of the symbol.
+
+        Trades must arrive in time order per symbol; a trade falling in a
+        bucket that was already closed is left out of that bar (it still
+        counts for the session VWAP) and counted in ``late_trades``.
+
+        Returns:
+            list: bars closed by this trade (see ``_emit``)
+        """
+        return self._update(
+            symbol, pd.Timestamp(time).value, float(price), float(volume)
+        )
+
+    def _update(
+        self,
+        symbol: str,
+        time_ns: int,
+        price: float,
+        volume: float
+    ) -> list:
+        day = time_ns // DAY_NS
+
+        bounds = None
+        if self.calendar is not None:
+            bounds = self._session(day)
+            if bounds is None or not bounds[0] <= time_ns <= bounds[1]:
+                return []
+
+        session = self.sessions.get(symbol)
+        partial = False
+        if session is None or session[0] != day:
+            base = (0.0, 0.0)
+            if session is None and self.vwap_base is not None:
+                base = self.vwap_base(symbol)
+            # Trades of this symbol before the first one seen here
+            partial = base[1] > 0
+            session = self.sessions[symbol] = [day, base[0], base[1]]
+
+        session[1] += price * volume
+        session[2] += volume
+
+        closed = []
+        touched = []
+        late = False
+
+        for freq in self.freqs:
+            key = (symbol, freq)
+            bucket, end = self._bucket(time_ns, freq, bounds)
+            if partial:
+                self.closed_until[key] = bucket
+
+            done = self.closed_until.get(key)
+            bar = self.open.get(key)
+            if (done is not None and bucket <= done) or (
+                bar is not None and bucket < bar["bucket"]
+            ):
+                late = True
+                continue
+
+            if bar is not None and bucket > bar["bucket"]:
+                closed.append(self._close(key))
+                bar = None
+
+            if bar is None:
+                bar = self.open[key] = {
+                    "bucket": bucket,
+                    "end": end,
+                    "open": price,
+                    "high": price,
+                    "low": price,
+                    "close": price,
+                    "volume": volume,
+                }
+            else:
+                bar["high"] = max(bar["high"], price)
+                bar["low"] = min(bar["low"], price)
+                bar["close"] = price
+                bar["volume"] += volume
+
+            touched.append(bar)
+
+        if late and not partial:
+            self.late_trades += 1
+
+        # Session VWAP at the bar's last trade, as in resample_trades
+        vwap = session[1] / session[2] if session[2] else price
+        for bar in touched:
+            bar["vwap"] = vwap
+
+        return closed
+
+    def update_frame(self, trades_df: pd.DataFrame) -> list:
+        """
+        Apply a time-indexed trades frame (code / price / volume columns)
+        row by row.
+
+        Returns:
+            list: bars closed while applying the trades
+        """
+        closed = []
+        for time, code, price, volume in zip(
+            pd.DatetimeIndex(trades_df.index).as_unit("ns").asi8,
+            trades_df["code"].to_numpy(),
+            trades_df["price"].to_numpy(),
+            trades_df["volume"].to_numpy(),
+        ):
+            closed.extend(
+                self._update(code, int(time), float(price), float(volume))
+            )
+        return closed
+
+    # ------------------------------------------
+    # Timer
+    # ------------------------------------------
+    def advance(self, now) -> list:
+        """
+        Close every open bar whose bucket (plus grace) ended by ``now``.
+
+        Returns:
+            list: bars closed by the clock
+        """
+        now_ns = pd.Timestamp(now).value
+
+        expired = [
+            key for key, bar in self.open.items()
+            if bar["end"] + self.grace <= now_ns
+        ]
+        return [self._close(key) for key in expired]
+
+    def open_bars(self, freq: str = None) -> list:
+        """
+        Snapshot of the bars still open (all timeframes or one).
+        """
+        return [
+            self._emit(key, bar)
+            for key, bar in self.open.items()
+            if freq is None or key[1] == freq
+        ]
+
+    # ------------------------------------------
+    # State
+    # ------------------------------------------
+    def state(self) -> tuple:
+        """
+        Copy of the open bars and session totals, to ``restore`` after a
+        rewind.
+        """
+        return copy.deepcopy(
+            (self.open, self.closed_until, self.sessions, self.late_trades)
+        )
+
+    def restore(self, state: tuple) -> None:
+        """
+        Return to a ``state`` (e.g. the one of the last stored cycle).
+        """
+        self.open, self.closed_until, self.sessions, self.late_trades = (
+            copy.deepcopy(state)
+        )
+
+    def restate(self, symbol: str, stats) -> None:
+        """
+        Adopt a rebuilt symbol (``DirtyBarTracker.commit``): its session
+        totals are replaced and its open bars dropped. Trades after the
+        rebuild open new bars; the bucket of its last rebuilt trade is
+        not published.
+
+        Parameters
+        ----------
+        stats : dict | None
+            Watermark inputs of the rebuilt trades (``last_time``,
+            ``cum_pv``, ``cum_volume``), None when none is left
+        """
+        for freq in self.freqs:
+            self.open.pop((symbol, freq), None)
+            self.closed_until.pop((symbol, freq), None)
+
+        if stats is None:
+            self.sessions.pop(symbol, None)
+            return
+
+        time_ns = pd.Timestamp(stats["last_time"]).value
+        day = time_ns // DAY_NS
+        bounds = self._session(day) if self.calendar is not None else None
+        self.sessions[symbol] = [day, stats["cum_pv"], stats["cum_volume"]]
+        for freq in self.freqs:
+            self.closed_until[(symbol, freq)] = self._bucket(
+                time_ns, freq, bounds
+            )[0]
+
+    # ------------------------------------------
+    # Output
+    # ------------------------------------------
+    def _close(self, key: tuple) -> dict:
+        bar = self.open.pop(key)
+        self.closed_until[key] = bar["bucket"]
+        return self._emit(key, bar)
+
+    @staticmethod
+    def _emit(key: tuple, bar: dict) -> dict:
+        """
+        Public form of a bar: code, freq, time and BAR_COLUMNS.
+        """
+        emitted = {
+            "code": key[0],
+            "freq": key[1],
+            "time": pd.Timestamp(bar["bucket"]),
+        }
+        for column in BAR_COLUMNS:
+            emitted[column] = bar[column]
+        return emitted
+
+
+def bars_frame(bars: list, freq: str = None) -> pd.DataFrame:
+    """
+    Emitted bars (optionally of one timeframe) as a (code, time) indexed
+    frame, ready for ``BarSink.insert_bars``.
+    """
+    rows = [bar for bar in bars if freq is None or bar["freq"] == freq]
+    frame = pd.DataFrame(rows, columns=["code", "time"] + BAR_COLUMNS)
+    frame["time"] = pd.to_datetime(frame["time"])
+    return frame.set_index(["code", "time"]).sort_index()
+
+
+# ==================================================
+# Closed Bar Feed
+# ==================================================
+class ClosedBarFeed:
+    """
+    Publishes closed bars as JSON lines, one file per loop and day, for
+    readers that tail it (charts, alerts).
+    """
+
+    def __init__(self, name: str, feed_dir: Path = FEED_DIR):
+        """
+        Parameters
+        ----------
+        name : str
+            Loop name, prefix of the feed files
+        feed_dir : Path, optional
+            Folder of the feed files
+        """
+        self.name = name
+        self.feed_dir = Path(feed_dir)
+
+    def __call__(self, bars: list) -> None:
+        """
+        Append emitted bars (``BarAggregator._emit``) to the feed of their
+        day.
+        """
+        days = {}
+        for bar in bars:
+            line = dict(bar, time=bar["time"].isoformat())
+            days.setdefault(bar["time"].date(), []).append(json.dumps(line))
+
+        self.feed_dir.mkdir(parents=True, exist_ok=True)
+        for day, lines in days.items():
+            path = self.feed_dir / f"{self.name}-{day.isoformat()}.jsonl"
+            with open(path, "a", encoding="utf-8") as feed_file:
+                feed_file.write("\n".join(lines) + "\n")
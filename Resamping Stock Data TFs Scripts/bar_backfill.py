@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+Bar Backfill
+------------
+Rebuilds FILL_OHLCV_1MIN / FILL_OHLCV for a past date range.
+
+The live loops only follow today's STOCK.TRADES. This command replays the
+trades of every session day in a range from an archive table (same columns
+as STOCK.TRADES) or from a Parquet trade dataset, one day per worker
+process:
+
+    fetch    the day's trades, streamed in bounded chunks
+    build    the bars with the live loops' builder (``StreamingBarBuilder``,
+             session-anchored buckets, cumulative session VWAP)
+    load     one array-DML MERGE batch and a single commit per table and day
+
+    python bar_backfill.py 2025-01-01 2025-12-31 --table STOCK.TRADES_ARCHIVE
+    python bar_backfill.py 2025-03-02 2025-03-31 --files /data/trades \\
+        --timeframes 1Min --replace
+
+``--replace`` also deletes stored stock bars of the day that the rebuilt
+bars no longer contain (e.g. after a bug fix), in the same transaction.
+Days are independent, so a failed day is reported and can simply be run
+again. Today is never backfilled: it belongs to the live loops.
+
+Author: Ahmad Elsayed
+"""
+
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from bar_mirror import BarMirror, compact
+from bar_sink import BarSink
+from dirty_bars import stock_ticker
+from sharded_bars import default_workers
+from trade_stream import TRADE_COLUMNS, StreamingBarBuilder, iter_frames
+from trading_calendar import TradingCalendar, market_now
+
+
+# Bar frequency → table rebuilt from the trades
+BACKFILL_TABLES = {
+    "1Min": "STOCK.FILL_OHLCV_1MIN",
+    "5Min": "STOCK.FILL_OHLCV",
+}
+
+# Same session rules as the live loops
+CALENDAR = TradingCalendar.load()
+
+# One day of an archive table with the STOCK.TRADES columns
+ARCHIVE_TRADES_SQL = """
+    SELECT
+        T2.REUTERS,
+        T1.EXEC_TIME,
+        T1.TRADE_PRICE,
+        T1.VOLUME_TRADED
+    FROM {table} T1
+    JOIN STOCK.SYMBOLINFO T2
+        ON T2.SYMBOL_CODE = T1.SYMBOL_CODE
+    WHERE T1.EXEC_TIME >= :start_time
+      AND T1.EXEC_TIME < :end_time
+      AND T2.REUTERS IS NOT NULL
+    ORDER BY T1.EXEC_TIME
+"""
+
+STORED_KEYS_SQL = """
+    SELECT TICKER, BARTIMESTAMP
+    FROM {table}
+    WHERE ASSET = 1
+      AND BARTIMESTAMP >= :start_time
+      AND BARTIMESTAMP < :end_time
+"""
+
+DAY = pd.Timedelta("1D")
+
+# Per worker process, created on its first day
+_mirror = None
+
+
+# ==================================================
+# Helpers
+# ==================================================
+def session_days(start, end, calendar: TradingCalendar = CALENDAR) -> list:
+    """
+    Trading days in [start, end], today and later left out.
+    """
+    last = min(pd.Timestamp(end), market_now().normalize() - DAY)
+    days = pd.date_range(pd.Timestamp(start).normalize(), last, freq="D")
+    return [day for day in days if calendar.session(day) is not None]
+
+
+def file_trades(path: str, day: pd.Timestamp) -> pd.DataFrame:
+    """
+    One day of a Parquet trade dataset (columns code, time, price, volume;
+    code being the REUTERS code), ordered by time.
+    """
+    trades = pd.read_parquet(
+        path,
+        columns=TRADE_COLUMNS,
+        filters=[
+            ("time", ">=", day.to_pydatetime()),
+            ("time", "<", (day + DAY).to_pydatetime()),
+        ],
+    )
+    trades["time"] = pd.to_datetime(trades["time"])
+    trades = trades.sort_values("time", kind="stable").set_index("time")
+    return trades.dropna()
+
+
+def _get_mirror() -> BarMirror:
+    global _mirror
+    if _mirror is None:
+        _mirror = BarMirror()
+    return _mirror
+
+
+# ==================================================
+# One Day (worker process)
+# ==================================================
+def build_day(cursor, source: tuple, day: pd.Timestamp, freqs) -> dict:
+    """
+    Bars of one day for every frequency.
+
+    Parameters
+    ----------
+    source : tuple
+        ("table", archive table) or ("files", Parquet dataset path)
+
+    Returns:
+        dict: freq → StreamingBarBuilder fed with the day's trades
+    """
+    builders = {
+        freq: StreamingBarBuilder(freq, workers=1, calendar=CALENDAR)
+        for freq in freqs
+    }
+
+    kind, location = source
+    if kind == "table":
+        chunks = iter_frames(
+            cursor,
+            ARCHIVE_TRADES_SQL.format(table=location),
+            {
+                "start_time": day.to_pydatetime(),
+                "end_time": (day + DAY).to_pydatetime(),
+            },
+        )
+    else:
+        chunks = [file_trades(location, day)]
+
+    for chunk in chunks:
+        for builder in builders.values():
+            builder.feed(chunk)
+
+    return builders
+
+
+def queue_stale(cursor, sink: BarSink, bars: pd.DataFrame, day) -> None:
+    """
+    Queue the deletion of stored stock bars of the day missing from the
+    rebuilt ones.
+    """
+    cursor.execute(STORED_KEYS_SQL.format(table=sink.table), {
+        "start_time": day.to_pydatetime(),
+        "end_time": (day + DAY).to_pydatetime(),
+    })
+    rebuilt = set(zip(
+        bars.index.get_level_values("code"),
+        bars.index.get_level_values("time"),
+    ))
+    for ticker, timestamp in cursor.fetchall():
+        if (ticker, pd.Timestamp(timestamp)) not in rebuilt:
+            sink.delete(ticker, timestamp)
+
+
+def backfill_day(
+    day: pd.Timestamp,
+    source: tuple,
+    freqs: list,
+    replace: bool = False
+) -> dict:
+    """
+    Rebuild and store the bars of one day.
+
+    Returns:
+        dict: day, trades read, per-table counts and ``error`` (None if
+        every table was committed)
+    """
+    from db_pool import acquire, release
+
+    started = time.monotonic()
+    result = {"day": day, "trades": 0, "tables": {}, "error": None}
+    mirror = _get_mirror()
+
+    con = acquire()
+    try:
+        cursor = con.cursor()
+        builders = build_day(cursor, source, day, freqs)
+
+        for freq, builder in builders.items():
+            # No trades usually means a missing archive day: keep the bars
+            result["trades"] = builder.rows
+            if not builder.rows:
+                continue
+
+            bars = builder.result()
+            bars.index = pd.MultiIndex.from_arrays(
+                [
+                    bars.index.get_level_values("code").map(stock_ticker),
+                    bars.index.get_level_values("time"),
+                ],
+                names=["code", "time"],
+            )
+
+            sink = BarSink(BACKFILL_TABLES[freq], mode="upsert", mirror=mirror)
+            if replace:
+                queue_stale(cursor, sink, bars, day)
+            sink.insert_bars(bars, asset=1)
+
+            counts = sink.flush(con)
+            result["tables"][sink.table] = counts
+            if not counts["committed"]:
+                result["error"] = f"{sink.table} batch rolled back"
+            elif counts["errors"]:
+                result["error"] = (
+                    f"{sink.table}: {counts['errors']} bars rejected"
+                )
+
+    except Exception as error:
+        result["error"] = str(error)
+
+    finally:
+        release(con)
+
+    # Past days are final: write and compact their mirror files right away
+    if mirror.enabled:
+        mirror.flush()
+        for table in result["tables"]:
+            compact(table, day, mirror.mirror_dir)
+
+    result["seconds"] = time.monotonic() - started
+    return result
+
+
+# ==================================================
+# Date Range (parent process)
+# ==================================================
+def backfill(
+    start,
+    end,
+    source: tuple,
+    freqs=tuple(BACKFILL_TABLES),
+    workers: int = None,
+    replace: bool = False
+) -> list:
+    """
+    Rebuild every session day in [start, end] on a pool of processes.
+
+    Returns:
+        list: the days that failed
+    """
+    days = session_days(start, end)
+    if not days:
+        print("No session days to backfill")
+        return []
+
+    workers = min(default_workers() if workers is None else workers, len(days))
+
+    print(f"Backfilling {len(days)} days on {workers} workers ...")
+    started = time.monotonic()
+    failed = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(backfill_day, day, source, list(freqs), replace)
+            for day in days
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            day = f"{result['day']:%Y-%m-%d}"
+
+            if result["error"]:
+                failed.append(result["day"])
+                print(f"{day}: FAILED ({result['error']})")
+                continue
+
+            written = ", ".join(
+                f"{table} {counts['upserted']} merged"
+                + (f" / {counts['deleted']} deleted" if counts["deleted"] else "")
+                for table, counts in result["tables"].items()
+            )
+            print(
+                f"{day}: {result['trades']} trades → "
+                f"{written or 'no trades'} ({result['seconds']:.1f}s)"
+            )
+
+    print(
+        f"Backfill done in {time.monotonic() - started:.0f}s: "
+        f"{len(days) - len(failed)} days stored, {len(failed)} failed"
+    )
+    for day in sorted(failed):
+        print(f"  rerun: {day:%Y-%m-%d}")
+
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rebuild stock bars for a past date range"
+    )
+    parser.add_argument("start", help="first day (YYYY-MM-DD)")
+    parser.add_argument("end", help="last day, inclusive (YYYY-MM-DD)")
+
+    trades_source = parser.add_mutually_exclusive_group(required=True)
+    trades_source.add_argument(
+        "--table", help="archive table with the STOCK.TRADES columns"
+    )
+    trades_source.add_argument(
+        "--files", help="Parquet trade dataset (code, time, price, volume)"
+    )
+
+    parser.add_argument(
+        "--timeframes",
+        nargs="+",
+        choices=list(BACKFILL_TABLES),
+        default=list(BACKFILL_TABLES),
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="worker processes (default: BAR_WORKERS / cores - 1)",
+    )
+    parser.add_argument(
+        "--replace", action="store_true",
+        help="delete stored stock bars the rebuild no longer produces",
+    )
+
+    args = parser.parse_args()
+    source = ("table", args.table) if args.table else ("files", args.files)
+
+    failed_days = backfill(
+        args.start,
+        args.end,
+        source,
+        freqs=args.timeframes,
+        workers=args.workers,
+        replace=args.replace,
+    )
+    raise SystemExit(1 if failed_days else 0)
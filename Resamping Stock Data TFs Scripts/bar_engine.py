@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Bar Engine
+----------
+Vectorized multi-symbol bar building shared by the resampling scripts.
+
+All symbols are aggregated in a single pass: the trades are sorted once by
+(symbol, time), split at every (symbol, bucket) change and reduced with
+NumPy ``reduceat``. This replaces the per-symbol boolean filter followed by
+one ``resample`` call per column.
+
+Author: Ahmad Elsayed
+"""
+
+import numpy as np
+import pandas as pd
+
+
+BAR_COLUMNS = ["open", "high", "low", "close", "volume", "vwap"]
+OHLC_COLUMNS = ["open", "high", "low", "close"]
+
+
+# ==================================================
+# Helpers
+# ==================================================
+def bucket_starts(
+    times: pd.DatetimeIndex,
+    freq: str,
+    calendar=None
+) -> pd.DatetimeIndex:
+    """
+    Bucket start of every timestamp: session-anchored with a
+    ``TradingCalendar``, else the plain pandas floor.
+    """
+    if calendar is not None:
+        return calendar.floor(times, freq)
+    return times.floor(freq)
+
+
+def _sorted_groups(
+    codes: np.ndarray,
+    times: pd.DatetimeIndex,
+    freq: str,
+    calendar=None
+):
+    """
+    Sort rows by (code, time) and locate every (code, bucket) group.
+
+    Returns:
+        tuple: (sort order, sorted code ids, code values,
+                sorted bucket timestamps, group start offsets)
+    """
+    code_ids, code_values = pd.factorize(codes, sort=True)
+
+    # lexsort is stable, so trades sharing a timestamp keep their order
+    order = np.lexsort((times.asi8, code_ids))
+    code_ids = code_ids[order]
+    buckets = bucket_starts(times, freq, calendar)[order]
+    bucket_keys = buckets.asi8
+
+    changed = np.empty(len(order), dtype=bool)
+    changed[:1] = True
+    changed[1:] = (
+        (code_ids[1:] != code_ids[:-1])
+        | (bucket_keys[1:] != bucket_keys[:-1])
+    )
+    starts = np.flatnonzero(changed)
+
+    return order, code_ids, code_values, buckets, starts
+
+
+def _ohlc(values: np.ndarray, starts: np.ndarray) -> dict:
+    """
+    Open / high / low / close of every group of sorted values.
+    """
+    ends = np.append(starts[1:], len(values)) - 1
+    return {
+        "open": values[starts],
+        "high": np.maximum.reduceat(values, starts),
+        "low": np.minimum.reduceat(values, starts),
+        "close": values[ends],
+    }
+
+
+def _bars_frame(data: dict, codes, buckets, columns) -> pd.DataFrame:
+    """
+    Wrap reduced arrays in a (code, time) indexed frame.
+    """
+    index = pd.MultiIndex.from_arrays(
+        [codes, pd.DatetimeIndex(buckets)], names=["code", "time"]
+    )
+    bars = pd.DataFrame(data, index=index, columns=columns)
+    return bars.dropna()
+
+
+# ==================================================
+# Trades → OHLCV + VWAP
+# ==================================================
+def resample_trades(
+    trades_df: pd.DataFrame,
+    freq: str,
+    vwap_base: dict = None,
+    calendar=None
+) -> pd.DataFrame:
+    """
+    Build OHLCV + VWAP bars for every symbol at once.
+
+    VWAP keeps the scripts' original meaning: the cumulative session VWAP
+    at the last trade of the bar.
+
+    Parameters
+    ----------
+    trades_df : pd.DataFrame
+        Trades indexed by time with ``code``, ``price`` and ``volume``
+    freq : str
+        Pandas bar frequency (e.g. "1Min", "5Min")
+    vwap_base : dict, optional
+        code -> (price x volume, volume) already accumulated before these
+        trades, for incremental runs
+    calendar : TradingCalendar, optional
+        Anchor buckets to the session open (see ``trading_calendar``)
+
+    Returns:
+        pd.DataFrame: bars indexed by (code, time) with BAR_COLUMNS
+    """
+    if trades_df.empty:
+        return _bars_frame({}, [], [], BAR_COLUMNS)
+
+    order, code_ids, code_values, buckets, starts = _sorted_groups(
+        trades_df["code"].to_numpy(),
+        pd.DatetimeIndex(trades_df.index),
+        freq,
+        calendar
+    )
+
+    price = trades_df["price"].to_numpy(dtype=float)[order]
+    volume = trades_df["volume"].to_numpy(dtype=float)[order]
+
+    data = _ohlc(price, starts)
+    data["volume"] = np.add.reduceat(volume, starts)
+
+    # Per-symbol running totals: global cumsum minus the total at symbol start
+    cum_pv = np.cumsum(price * volume)
+    cum_volume = np.cumsum(volume)
+    symbol_starts = np.flatnonzero(np.r_[True, code_ids[1:] != code_ids[:-1]])
+    symbol_len = np.diff(np.append(symbol_starts, len(order)))
+    offset_pv = np.repeat(
+        np.r_[0.0, cum_pv][symbol_starts], symbol_len
+    )
+    offset_volume = np.repeat(
+        np.r_[0.0, cum_volume][symbol_starts], symbol_len
+    )
+    cum_pv = cum_pv - offset_pv
+    cum_volume = cum_volume - offset_volume
+
+    if vwap_base:
+        base = np.array(
+            [vwap_base.get(code, (0.0, 0.0)) for code in code_values],
+            dtype=float
+        ).reshape(-1, 2)
+        cum_pv = cum_pv + base[code_ids, 0]
+        cum_volume = cum_volume + base[code_ids, 1]
+
+    ends = np.append(starts[1:], len(order)) - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        data["vwap"] = cum_pv[ends] / cum_volume[ends]
+    data["vwap"][~np.isfinite(data["vwap"])] = np.nan
+
+    return _bars_frame(
+        data, code_values[code_ids[starts]], buckets[starts], BAR_COLUMNS
+    )
+
+
+# ==================================================
+# Index Ticks → OHLC
+# ==================================================
+def resample_ticks(
+    ticks_df: pd.DataFrame,
+    freq: str,
+    code_column: str = "code",
+    value_column: str = "price",
+    calendar=None
+) -> pd.DataFrame:
+    """
+    Build OHLC bars for every index/sector tick series at once.
+
+    Returns:
+        pd.DataFrame: bars indexed by (code, time) with OHLC_COLUMNS
+    """
+    if ticks_df.empty:
+        return _bars_frame({}, [], [], OHLC_COLUMNS)
+
+    order, code_ids, code_values, buckets, starts = _sorted_groups(
+        ticks_df[code_column].to_numpy(),
+        pd.DatetimeIndex(ticks_df.index),
+        freq,
+        calendar
+    )
+
+    values = ticks_df[value_column].to_numpy(dtype=float)[order]
+
+    return _bars_frame(
+        _ohlc(values, starts),
+        code_values[code_ids[starts]],
+        buckets[starts],
+        OHLC_COLUMNS
+    )
+
+
+# ==================================================
+# Bars → Higher Timeframe Bars
+# ==================================================
+def rollup_bars(
+    bars_df: pd.DataFrame,
+    freq: str,
+    calendar=None
+) -> pd.DataFrame:
+    """
+    Roll (code, time) indexed bars up into a coarser timeframe.
+
+    Open is the first bar's open, high / low the extremes, close and VWAP
+    the last bar's values (VWAP is cumulative for the session) and volume
+    the sum.
+
+    Returns:
+        pd.DataFrame: bars indexed by (code, time) with BAR_COLUMNS
+    """
+    if bars_df.empty:
+        return _bars_frame({}, [], [], BAR_COLUMNS)
+
+    order, code_ids, code_values, buckets, starts = _sorted_groups(
+        bars_df.index.get_level_values("code").to_numpy(),
+        pd.DatetimeIndex(bars_df.index.get_level_values("time")),
+        freq,
+        calendar
+    )
+    ends = np.append(starts[1:], len(order)) - 1
+
+    def column(name):
+        return bars_df[name].to_numpy(dtype=float)[order]
+
+    data = {
+        "open": column("open")[starts],
+        "high": np.maximum.reduceat(column("high"), starts),
+        "low": np.minimum.reduceat(column("low"), starts),
+        "close": column("close")[ends],
+        "volume": np.add.reduceat(column("volume"), starts),
+        "vwap": column("vwap")[ends],
+    }
+
+    return _bars_frame(
+        data, code_values[code_ids[starts]], buckets[starts], BAR_COLUMNS
+    )
+
+
+# ==================================================
+# Trades → Per-Bucket Totals
+# ==================================================
+TOTAL_COLUMNS = ["trades", "volume", "pv"]
+
+
+def trade_totals(trades_df: pd.DataFrame, freq: str = "1Min") -> pd.DataFrame:
+    """
+    Trade count, volume and price x volume per (code, bucket), used to
+    check stored bars against the trades table (see ``dirty_bars``).
+
+    Returns:
+        pd.DataFrame: (code, time) indexed TOTAL_COLUMNS
+    """
+    if trades_df.empty:
+        index = pd.MultiIndex.from_arrays(
+            [[], pd.DatetimeIndex([])], names=["code", "time"]
+        )
+        return pd.DataFrame(columns=TOTAL_COLUMNS, index=index, dtype=float)
+
+    price = trades_df["price"].to_numpy(dtype=float)
+    volume = trades_df["volume"].to_numpy(dtype=float)
+    frame = pd.DataFrame({
+        "code": trades_df["code"].to_numpy(),
+        "time": pd.DatetimeIndex(trades_df.index).floor(freq),
+        "trades": 1.0,
+        "volume": volume,
+        "pv": price * volume,
+    })
+    return frame.groupby(["code", "time"]).sum()
+
+
+def add_totals(totals: pd.DataFrame, more: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sum two ``trade_totals`` frames (either may be None).
+    """
+    if totals is None:
+        return more
+    if more is None:
+        return totals
+    return totals.add(more, fill_value=0.0)
+
+
+# ==================================================
+# Partial Bars → Combined Bars
+# ==================================================
+MERGE_RULES = {
+    "open": "first",
+    "high": "max",
+    "low": "min",
+    "close": "last",
+    "volume": "sum",
+    "vwap": "last",
+}
+
+
+def merge_bars(earlier: pd.DataFrame, later: pd.DataFrame) -> pd.DataFrame:
+    """
+    Combine two (code, time) indexed bar frames built from consecutive
+    slices of the same ordered trade/tick stream.
+
+    Bars present in both (a bucket cut by the slice boundary) are merged;
+    the others are kept as they are.
+
+    Returns:
+        pd.DataFrame: combined bars, sorted by (code, time)
+    """
+    if earlier is None or earlier.empty:
+        return later
+    if later.empty:
+        return earlier
+
+    shared = later.index.isin(earlier.index)
+    if not shared.any():
+        return pd.concat([earlier, later]).sort_index()
+
+    keys = later.index[shared]
+    rules = {c: MERGE_RULES[c] for c in later.columns if c in MERGE_RULES}
+    merged = (
+        pd.concat([earlier.loc[keys], later.loc[shared]])
+        .groupby(level=["code", "time"], sort=False)
+        .agg(rules)
+    )
+
+    return pd.concat([
+        earlier.loc[~earlier.index.isin(keys)],
+        merged,
+        later.loc[~shared],
+    ]).sort_index()
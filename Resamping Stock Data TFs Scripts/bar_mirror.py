@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+"""
+Bar Mirror
+----------
+Local Parquet copy of FILL_OHLCV and FILL_OHLCV_1MIN for research reads.
+
+The loops hand every committed bar write to the mirror (``BarSink`` with
+``mirror=``); it buffers them and appends them every MIRROR_FLUSH_SECONDS
+to a Parquet dataset partitioned by date and ticker:
+
+    mirror/<table>/date=YYYY-MM-DD/ticker=<ticker>/part-<seq>.parquet
+
+Rows carry a write sequence: a bar written again (upsert, update) simply
+gets a newer row, a deleted bar a ``deleted`` tombstone, and readers keep
+the latest version of every (ticker, time). Finished days are compacted to
+one file per ticker.
+
+    read_bars("STOCK.FILL_OHLCV_1MIN", ["COMI"], "2020-01-01", "2026-01-01")
+    read_arrays("STOCK.FILL_OHLCV", "COMI")
+
+History already in Oracle is copied once with:
+
+    python bar_mirror.py sync STOCK.FILL_OHLCV_1MIN 2020-01-01 2026-10-18
+
+Requires pyarrow; without it the mirror is disabled and the loops run
+unchanged.
+
+Author: Ahmad Elsayed
+"""
+
+import argparse
+import atexit
+import os
+import threading
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from bar_engine import BAR_COLUMNS
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ds = pq = None
+
+
+MIRROR_DIR = Path(os.environ.get(
+    "BAR_MIRROR_DIR", Path(__file__).resolve().parent / "mirror"
+))
+
+# Tables copied by the loops
+MIRROR_TABLES = ("STOCK.FILL_OHLCV", "STOCK.FILL_OHLCV_1MIN")
+
+# Buffered rows are written at least this often (and when the buffer fills)
+MIRROR_FLUSH_SECONDS = 300
+MIRROR_FLUSH_ROWS = 200000
+
+ROW_COLUMNS = ["time"] + BAR_COLUMNS + ["asset", "deleted", "seq"]
+
+# Oracle column → mirror column
+DB_COLUMNS = {
+    "OPEN": "open",
+    "HIGH": "high",
+    "LOW": "low",
+    "CLOSE": "close",
+    "VOLUME": "volume",
+    "VWAP": "vwap",
+    "ASSET": "asset",
+}
+
+
+# ==================================================
+# Helpers
+# ==================================================
+def require_pyarrow() -> None:
+    """
+    Fail with a clear message when pyarrow is missing.
+    """
+    if pa is None:
+        raise ImportError("The Parquet bar mirror needs pyarrow")
+
+
+def table_dir(table: str, mirror_dir: Path = MIRROR_DIR) -> Path:
+    """
+    Dataset folder of one Oracle table.
+    """
+    return Path(mirror_dir) / table.replace(".", "_")
+
+
+def resolve(rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Latest version of every (ticker, time) bar, tombstones removed.
+
+    Returns:
+        pd.DataFrame: (code, time) indexed BAR_COLUMNS plus ``asset``
+    """
+    columns = BAR_COLUMNS + ["asset"]
+    if rows.empty:
+        index = pd.MultiIndex.from_arrays(
+            [[], pd.DatetimeIndex([])], names=["code", "time"]
+        )
+        return pd.DataFrame(columns=columns, index=index, dtype=float)
+
+    # last() skips NaN: partial updates only override the columns they set
+    latest = (
+        rows.sort_values("seq", kind="stable")
+        .groupby(["ticker", "time"], sort=True)
+        .last()
+    )
+    latest = latest.loc[~latest["deleted"].astype(bool)]
+    latest.index = latest.index.set_names(["code", "time"])
+    return latest[columns]
+
+
+# ==================================================
+# Writer
+# ==================================================
+class BarMirror:
+    """
+    Buffered Parquet appender fed by ``BarSink``.
+    """
+
+    def __init__(
+        self,
+        mirror_dir: Path = MIRROR_DIR,
+        tables=MIRROR_TABLES,
+        flush_seconds: float = MIRROR_FLUSH_SECONDS
+    ):
+        self.mirror_dir = Path(mirror_dir)
+        self.tables = set(tables)
+        self.flush_seconds = flush_seconds
+        self.enabled = pa is not None
+        self.buffers = {}
+        self.rows = 0
+        self.last_flush = time.monotonic()
+        self.open_days = {}
+        self.lock = threading.Lock()
+
+        if self.enabled:
+            atexit.register(self.close)
+        else:
+            print("pyarrow not installed: Parquet bar mirror disabled")
+
+    # ------------------------------------------
+    # Collecting
+    # ------------------------------------------
+    def record(self, table: str, written: list) -> None:
+        """
+        Buffer the rows a ``BarSink`` just committed.
+
+        Parameters
+        ----------
+        written : list
+            (columns, row) pairs: columns None for a full row in
+            INSERT_COLUMNS order, "delete" for [ticker, timestamp], else
+            the updated column names followed by ticker and timestamp
+        """
+        if not self.enabled or table not in self.tables or not written:
+            return
+
+        seq = time.time_ns()
+        records = []
+        for offset, (columns, row) in enumerate(written):
+            if columns is None:
+                record = {
+                    "ticker": row[0],
+                    "time": row[6],
+                    "open": row[1],
+                    "high": row[2],
+                    "low": row[3],
+                    "close": row[4],
+                    "volume": row[5],
+                    "asset": row[7],
+                    "vwap": row[8],
+                    "deleted": False,
+                }
+            elif columns == "delete":
+                record = {"ticker": row[0], "time": row[1], "deleted": True}
+            else:
+                record = {"ticker": row[-2], "time": row[-1], "deleted": False}
+                for column, value in zip(columns, row):
+                    if column in DB_COLUMNS:
+                        record[DB_COLUMNS[column]] = value
+            record["seq"] = seq + offset
+            records.append(record)
+
+        with self.lock:
+            self.buffers.setdefault(table, []).extend(records)
+            self.rows += len(records)
+
+        if (
+            self.rows >= MIRROR_FLUSH_ROWS
+            or time.monotonic() - self.last_flush >= self.flush_seconds
+        ):
+            self.flush()
+
+    # ------------------------------------------
+    # Writing
+    # ------------------------------------------
+    def flush(self) -> None:
+        """
+        Append the buffered rows to the dataset; days no longer written
+        to are compacted.
+        """
+        with self.lock:
+            buffers, self.buffers = self.buffers, {}
+            self.rows = 0
+            self.last_flush = time.monotonic()
+
+        for table, records in buffers.items():
+            try:
+                frame = pd.DataFrame(records)
+                write_rows(table, frame, self.mirror_dir)
+            except Exception as error:
+                print(f"Bar mirror write failed for {table}: {error}")
+                continue
+
+            days = set(frame["time"].map(lambda t: t.date()))
+            newest = max(days)
+            for day in self.open_days.get(table, set()) | days:
+                if day < newest:
+                    try:
+                        compact(table, day, self.mirror_dir)
+                    except Exception as error:
+                        print(f"Bar mirror compaction failed ({day}): {error}")
+            self.open_days[table] = {newest}
+
+    def close(self) -> None:
+        """
+        Write whatever is still buffered (end of run).
+        """
+        if self.enabled:
+            self.flush()
+
+
+def write_rows(table: str, frame: pd.DataFrame, mirror_dir: Path = MIRROR_DIR):
+    """
+    Append mirror rows (ticker, time, bar columns, deleted, seq) as one
+    Parquet file per (date, ticker).
+    """
+    require_pyarrow()
+
+    frame = frame.reindex(columns=["ticker"] + ROW_COLUMNS)
+    frame["time"] = pd.to_datetime(frame["time"]).astype("datetime64[us]")
+    frame["deleted"] = frame["deleted"].fillna(False).astype(bool)
+    frame["seq"] = frame["seq"].astype(np.int64)
+    for column in BAR_COLUMNS + ["asset"]:
+        frame[column] = frame[column].astype(float)
+
+    root = table_dir(table, mirror_dir)
+    dates = frame["time"].dt.strftime("%Y-%m-%d")
+
+    for (day, ticker), part in frame.groupby([dates, "ticker"], sort=False):
+        folder = root / f"date={day}" / f"ticker={quote(str(ticker), safe='')}"
+        folder.mkdir(parents=True, exist_ok=True)
+        _write_part(folder, part, int(part["seq"].min()))
+
+
+def _write_part(folder: Path, rows: pd.DataFrame, seq: int) -> None:
+    """
+    Write one part file atomically (readers never see a partial file).
+    """
+    path = folder / f"part-{seq}.parquet"
+    tmp_path = path.with_suffix(".tmp")
+    pq.write_table(
+        pa.Table.from_pandas(rows[ROW_COLUMNS], preserve_index=False),
+        tmp_path,
+    )
+    tmp_path.replace(path)
+
+
+def compact(table: str, day, mirror_dir: Path = MIRROR_DIR) -> None:
+    """
+    Rewrite every ticker of one date as a single resolved file.
+    """
+    require_pyarrow()
+
+    day = pd.Timestamp(day)
+    folder = table_dir(table, mirror_dir) / f"date={day:%Y-%m-%d}"
+    if not folder.exists():
+        return
+
+    for ticker_dir in folder.iterdir():
+        parts = sorted(ticker_dir.glob("part-*.parquet"))
+        if len(parts) <= 1:
+            continue
+
+        rows = pd.concat([pq.read_table(p).to_pandas() for p in parts])
+        rows["ticker"] = ticker_dir.name
+        bars = resolve(rows).reset_index()
+        bars["deleted"] = False
+        bars["seq"] = seq = int(rows["seq"].max())
+
+        # The compacted rows replace the newest part first: until the older
+        # parts are gone readers resolve the duplicates to the same bars
+        _write_part(ticker_dir, bars, seq)
+        for part in parts:
+            if part.name != f"part-{seq}.parquet":
+                part.unlink()
+
+
+# ==================================================
+# Reader API
+# ==================================================
+def read_bars(
+    table: str,
+    tickers: list = None,
+    start=None,
+    end=None,
+    mirror_dir: Path = MIRROR_DIR
+) -> pd.DataFrame:
+    """
+    Bars of a ticker / date range from the mirror.
+
+    Parameters
+    ----------
+    table : str
+        Mirrored Oracle table (e.g. "STOCK.FILL_OHLCV_1MIN")
+    tickers : list, optional
+        Stored tickers (default: all)
+    start, end : date-like, optional
+        Inclusive bar time range
+
+    Returns:
+        pd.DataFrame: (code, time) indexed BAR_COLUMNS plus ``asset``
+    """
+    require_pyarrow()
+
+    root = table_dir(table, mirror_dir)
+    if not root.exists():
+        return resolve(pd.DataFrame())
+
+    partitioning = ds.partitioning(
+        pa.schema([("date", pa.string()), ("ticker", pa.string())]),
+        flavor="hive",
+    )
+    dataset = ds.dataset(root, format="parquet", partitioning=partitioning)
+
+    # Partition pruning first (whole folders skipped), then exact times
+    condition = None
+
+    def both(expression):
+        return expression if condition is None else condition & expression
+
+    if tickers is not None:
+        condition = both(ds.field("ticker").isin([str(t) for t in tickers]))
+    if start is not None:
+        start = pd.Timestamp(start)
+        condition = both(ds.field("date") >= f"{start:%Y-%m-%d}")
+        condition = both(ds.field("time") >= start.to_pydatetime())
+    if end is not None:
+        end = pd.Timestamp(end)
+        if end == end.normalize():
+            end = end + pd.Timedelta("1D") - pd.Timedelta(1, "us")
+        condition = both(ds.field("date") <= f"{end:%Y-%m-%d}")
+        condition = both(ds.field("time") <= end.to_pydatetime())
+
+    rows = dataset.to_table(filter=condition).to_pandas()
+    if "date" in rows:
+        rows = rows.drop(columns="date")
+    rows["ticker"] = rows["ticker"].astype(str)
+    return resolve(rows)
+
+
+def read_arrays(
+    table: str,
+    ticker: str,
+    start=None,
+    end=None,
+    mirror_dir: Path = MIRROR_DIR
+) -> dict:
+    """
+    One ticker's bars as NumPy arrays (for vectorized research code).
+
+    Returns:
+        dict: "time" (datetime64) plus one float array per BAR_COLUMNS
+    """
+    bars = read_bars(table, [ticker], start, end, mirror_dir)
+    arrays = {"time": bars.index.get_level_values("time").to_numpy()}
+    for column in BAR_COLUMNS:
+        arrays[column] = bars[column].to_numpy(dtype=np.float64)
+    return arrays
+
+
+# ==================================================
+# History Sync (one-off)
+# ==================================================
+SYNC_SQL = """
+    SELECT TICKER, OPEN, HIGH, LOW, CLOSE, VOLUME, BARTIMESTAMP, ASSET, VWAP
+    FROM {table}
+    WHERE BARTIMESTAMP >= :start_time
+      AND BARTIMESTAMP < :end_time
+    ORDER BY BARTIMESTAMP
+"""
+
+
+def sync(connection, table: str, start, end, mirror_dir: Path = MIRROR_DIR):
+    """
+    Copy the stored bars of [start, end) from Oracle into the mirror.
+    """
+    from trade_stream import iter_frames
+
+    require_pyarrow()
+
+    start = pd.Timestamp(start)
+    end = pd.Timestamp(end)
+    columns = [
+        "ticker", "open", "high", "low", "close",
+        "volume", "time", "asset", "vwap",
+    ]
+
+    days = set()
+    rows = 0
+    for chunk in iter_frames(
+        connection.cursor(),
+        SYNC_SQL.format(table=table),
+        {"start_time": start.to_pydatetime(), "end_time": end.to_pydatetime()},
+        columns=columns,
+    ):
+        frame = chunk.reset_index()
+        frame["deleted"] = False
+        frame["seq"] = time.time_ns()
+        write_rows(table, frame, mirror_dir)
+        days.update(frame["time"].dt.date)
+        rows += len(frame)
+
+    for day in sorted(days):
+        compact(table, day, mirror_dir)
+
+    print(f"{table}: {rows} bars mirrored over {len(days)} days")
+
+
+if __name__ == "__main__":
+    from db_pool import close_pool, pooled_connection
+
+    parser = argparse.ArgumentParser(
+        description="Local Parquet mirror of the bar tables"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sync_parser = commands.add_parser("sync", help="copy history from Oracle")
+    sync_parser.add_argument("table")
+    sync_parser.add_argument("start")
+    sync_parser.add_argument("end")
+
+    compact_parser = commands.add_parser("compact", help="compact one day")
+    compact_parser.add_argument("table")
+    compact_parser.add_argument("day")
+
+    args = parser.parse_args()
+
+    if args.command == "sync":
+        with pooled_connection() as con:
+            sync(con, args.table, args.start, args.end)
+        close_pool()
+    else:
+        compact(args.table, args.day)
@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+Bar Sink
+--------
+Collects the bar inserts and updates of one processing cycle and writes
+them with array DML (``executemany``) followed by a single commit.
+
+Rows rejected by Oracle (e.g. duplicate keys) are reported per row through
+batch errors instead of aborting the whole batch; the rest is committed,
+and ``stored`` tells the loops whether every queued row made it (only
+then may their watermarks move past those bars).
+
+In "upsert" mode the queued bars are merged on (TICKER, BARTIMESTAMP) in a
+single statement (MERGE on Oracle, INSERT ... ON CONFLICT on the local
+SQLite stand-in, whose table needs a UNIQUE (TICKER, BARTIMESTAMP) key),
+so re-running a cycle is idempotent and needs no read-before-write.
+
+Author: Ahmad Elsayed
+"""
+
+import sqlite3
+
+import pandas as pd
+
+
+INSERT_COLUMNS = [
+    "TICKER", "OPEN", "HIGH", "LOW", "CLOSE",
+    "VOLUME", "BARTIMESTAMP", "ASSET", "VWAP"
+]
+KEY_COLUMNS = ["TICKER", "BARTIMESTAMP"]
+
+# Refreshed on a key match; ASSET is fixed when the bar is first written
+UPSERT_COLUMNS = ["OPEN", "HIGH", "LOW", "CLOSE", "VOLUME", "VWAP"]
+
+WRITE_MODES = ("insert", "upsert")
+
+
+# ==================================================
+# Helpers
+# ==================================================
+def to_db_value(value):
+    """
+    Convert pandas / NumPy scalars to plain Python values for binding.
+    """
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def is_sqlite(connection) -> bool:
+    """
+    True for a sqlite3 connection (local stand-in database).
+    """
+    return isinstance(connection, sqlite3.Connection)
+
+
+def stored(counts: dict) -> bool:
+    """
+    True when a ``flush`` committed every queued row (none rolled back or
+    rejected through batch errors).
+    """
+    return counts["committed"] and not counts["errors"]
+
+
+# ==================================================
+# Bar Sink
+# ==================================================
+class BarSink:
+    """
+    Buffered bar writer for one FILL_OHLCV* table.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        cache=None,
+        mode: str = "insert",
+        mirror=None
+    ):
+        """
+        Parameters
+        ----------
+        table : str
+            Target table (e.g. "STOCK.FILL_OHLCV_1MIN")
+        cache : LastBarCache, optional
+            Last-bar cache kept current with every committed row
+        mode : str
+            "insert" (plain INSERT, duplicates rejected) or "upsert"
+        mirror : BarMirror, optional
+            Local Parquet mirror receiving every committed row
+        """
+        if mode not in WRITE_MODES:
+            raise ValueError(f"Unknown bar write mode: {mode}")
+
+        self.table = table
+        self.cache = cache
+        self.mode = mode
+        self.mirror = mirror
+        self.inserts = []
+        self.updates = {}
+        self.deletes = []
+
+    def __len__(self) -> int:
+        return (
+            len(self.inserts)
+            + sum(len(rows) for rows in self.updates.values())
+            + len(self.deletes)
+        )
+
+    # ------------------------------------------
+    # Collecting
+    # ------------------------------------------
+    def insert(
+        self,
+        ticker: str,
+        timestamp,
+        open_,
+        high,
+        low,
+        close,
+        volume,
+        asset: int,
+        vwap
+    ) -> None:
+        """
+        Queue one new bar (inserted, or merged in "upsert" mode).
+        """
+        self.inserts.append([
+            to_db_value(v) for v in (
+                ticker, open_, high, low, close,
+                volume, timestamp, asset, vwap
+            )
+        ])
+
+    def insert_frame(
+        self,
+        ticker: str,
+        bars_df: pd.DataFrame,
+        asset: int,
+        vwap_column: str = "vwap"
+    ) -> None:
+        """
+        Queue every bar of a time-indexed open/high/low/close/volume frame.
+        """
+        for timestamp, row in bars_df.iterrows():
+            self.insert(
+                ticker,
+                timestamp,
+                row["open"],
+                row["high"],
+                row["low"],
+                row["close"],
+                row["volume"],
+                asset,
+                row[vwap_column],
+            )
+
+    def insert_bars(
+        self,
+        bars_df: pd.DataFrame,
+        asset: int,
+        vwap_column: str = "vwap"
+    ) -> None:
+        """
+        Queue every bar of a (code, time) indexed frame, code being the
+        stored ticker.
+        """
+        for (ticker, timestamp), row in zip(
+            bars_df.index,
+            bars_df[["open", "high", "low", "close", "volume", vwap_column]]
+            .itertuples(index=False)
+        ):
+            self.insert(ticker, timestamp, *row[:5], asset, row[5])
+
+    def update(self, ticker: str, timestamp, **columns) -> None:
+        """
+        Queue an update of an existing bar.
+
+        Example:
+            sink.update("COMI", ts, OPEN=1.0, HIGH=1.2, LOW=0.9,
+                        CLOSE=1.1, VOLUME=1000.0)
+        """
+        key = tuple(columns)
+        row = [to_db_value(v) for v in columns.values()]
+        row += [to_db_value(ticker), to_db_value(timestamp)]
+        self.updates.setdefault(key, []).append(row)
+
+    def delete(self, ticker: str, timestamp) -> None:
+        """
+        Queue the removal of a stored bar (e.g. one whose trades were
+        busted).
+        """
+        self.deletes.append([to_db_value(ticker), to_db_value(timestamp)])
+
+    # ------------------------------------------
+    # Writing
+    # ------------------------------------------
+    def _execute_batch(
+        self,
+        cursor,
+        sql: str,
+        rows: list,
+        action: str,
+        ticker_bind: int = 0
+    ) -> set:
+        """
+        Run one array DML statement and report rejected rows.
+
+        Returns:
+            set: offsets of the rejected rows
+        """
+        if hasattr(cursor, "getbatcherrors"):
+            cursor.executemany(sql, rows, batcherrors=True)
+            errors = cursor.getbatcherrors()
+        else:
+            cursor.executemany(sql, rows)
+            errors = []
+
+        for error in errors:
+            print(
+                f"{self.table} {action} failed for "
+                f"{rows[error.offset][ticker_bind]}: {error.message}"
+            )
+        return {error.offset for error in errors}
+
+    def _insert_sql(self, connection) -> str:
+        """
+        INSERT, MERGE or INSERT ... ON CONFLICT statement for queued bars.
+        """
+        columns = ", ".join(INSERT_COLUMNS)
+        binds = ", ".join(f":{i + 1}" for i in range(len(INSERT_COLUMNS)))
+
+        if self.mode == "insert":
+            return f"""
+                INSERT INTO {self.table}
+                ({columns})
+                VALUES ({binds})
+            """
+
+        if is_sqlite(connection):
+            assignments = ", ".join(
+                f"{column} = excluded.{column}" for column in UPSERT_COLUMNS
+            )
+            return f"""
+                INSERT INTO {self.table}
+                ({columns})
+                VALUES ({binds})
+                ON CONFLICT ({", ".join(KEY_COLUMNS)})
+                DO UPDATE SET {assignments}
+            """
+
+        source = ", ".join(
+            f":{i + 1} AS {column}" for i, column in enumerate(INSERT_COLUMNS)
+        )
+        matches = " AND ".join(f"T.{column} = S.{column}" for column in KEY_COLUMNS)
+        assignments = ", ".join(
+            f"T.{column} = S.{column}" for column in UPSERT_COLUMNS
+        )
+        return f"""
+            MERGE INTO {self.table} T
+            USING (SELECT {source} FROM DUAL) S
+            ON ({matches})
+            WHEN MATCHED THEN
+                UPDATE SET {assignments}
+            WHEN NOT MATCHED THEN
+                INSERT ({columns})
+                VALUES ({", ".join(f"S.{column}" for column in INSERT_COLUMNS)})
+        """
+
+    def flush(self, connection) -> dict:
+        """
+        Write every queued bar and commit once.
+
+        Returns:
+            dict: counts of inserted, upserted, updated, deleted and rejected
+            (``errors``) rows, plus ``committed`` (False when the whole
+            batch was rolled back); see ``stored``
+        """
+        counts = {
+            "inserted": 0,
+            "upserted": 0,
+            "updated": 0,
+            "deleted": 0,
+            "errors": 0,
+            "committed": True,
+        }
+        if not len(self):
+            return counts
+
+        insert_sql = self._insert_sql(connection)
+        written_key = "inserted" if self.mode == "insert" else "upserted"
+
+        cursor = connection.cursor()
+        written = []
+
+        try:
+            if self.deletes:
+                delete_sql = f"""
+                    DELETE FROM {self.table}
+                    WHERE TICKER=:1
+                      AND BARTIMESTAMP=:2
+                """
+                errors = self._execute_batch(
+                    cursor, delete_sql, self.deletes, "delete"
+                )
+                counts["deleted"] += len(self.deletes) - len(errors)
+                counts["errors"] += len(errors)
+                written += [
+                    ("delete", row) for i, row in enumerate(self.deletes)
+                    if i not in errors
+                ]
+
+            for columns, rows in self.updates.items():
+                assignments = ", ".join(
+                    f"{column}=:{i + 1}" for i, column in enumerate(columns)
+                )
+                update_sql = f"""
+                    UPDATE {self.table}
+                    SET {assignments}
+                    WHERE TICKER=:{len(columns) + 1}
+                      AND BARTIMESTAMP=:{len(columns) + 2}
+                """
+                errors = self._execute_batch(
+                    cursor, update_sql, rows, "update", ticker_bind=-2
+                )
+                counts["updated"] += len(rows) - len(errors)
+                counts["errors"] += len(errors)
+                written += [
+                    (columns, row) for i, row in enumerate(rows)
+                    if i not in errors
+                ]
+
+            if self.inserts:
+                errors = self._execute_batch(
+                    cursor, insert_sql, self.inserts, self.mode
+                )
+                counts[written_key] += len(self.inserts) - len(errors)
+                counts["errors"] += len(errors)
+                written += [
+                    (None, row) for i, row in enumerate(self.inserts)
+                    if i not in errors
+                ]
+
+            connection.commit()
+
+            if self.cache is not None:
+                for columns, row in written:
+                    if columns == "delete":
+                        self.cache.record_delete(*row)
+                    elif columns is None:
+                        self.cache.record_insert(row)
+                    else:
+                        self.cache.record_update(
+                            row[-2], row[-1], dict(zip(columns, row))
+                        )
+
+        except Exception as error:
+            connection.rollback()
+            print(f"{self.table} batch write failed: {error}")
+            counts = {
+                "inserted": 0,
+                "upserted": 0,
+                "updated": 0,
+                "deleted": 0,
+                "errors": len(self),
+                "committed": False,
+            }
+
+        finally:
+            cursor.close()
+            self.inserts = []
+            self.updates = {}
+            self.deletes = []
+
+        # Committed rows only; mirror failures never affect the database
+        if counts["committed"] and self.mirror is not None:
+            self.mirror.record(self.table, written)
+
+        return counts
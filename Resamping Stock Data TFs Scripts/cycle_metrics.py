@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Cycle Metrics
+-------------
+Per-cycle stage timers and counters for the resampling loops.
+
+Every cycle records how long each stage took (fetch, resample, lookup,
+write, index, repair, ...) and what it did (rows fetched, symbols, bars
+inserted / updated / merged / deleted, errors). When the cycle finishes:
+
+    - one JSON log line is printed:
+        {"loop": "5min", "status": "ok", "duration": 4.21,
+         "stages": {"fetch": 1.9, ...}, "counts": {"rows_fetched": ...}}
+    - the Prometheus text exposition of the loop is rewritten atomically
+      to CYCLE_METRICS_DIR/<loop>.prom (node_exporter textfile collector)
+    - and served on http://<host>:<port>/metrics when CYCLE_METRICS_PORT
+      is set.
+
+``egx_resampler_last_cycle_timestamp_seconds`` and
+``egx_resampler_cycle_duration_seconds`` are the ones to alert on for
+lag during market hours.
+
+    metrics = CycleMetrics("5min")
+    with metrics.cycle() as cycle:
+        for chunk in cycle.timed("fetch", iter_frames(...)):
+            with cycle.stage("resample"):
+                builder.feed(chunk)
+        cycle.count_sink(bar_sink.flush(con))
+
+Author: Ahmad Elsayed
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+METRICS_DIR = Path(os.environ.get(
+    "CYCLE_METRICS_DIR", Path(__file__).resolve().parent / "metrics"
+))
+
+# HTTP /metrics endpoint, off unless a port is configured
+METRICS_PORT = int(os.environ.get("CYCLE_METRICS_PORT", 0)) or None
+
+PREFIX = "egx_resampler"
+
+# BarSink.flush counts → cycle counters
+SINK_COUNTS = {
+    "inserted": "bars_inserted",
+    "updated": "bars_updated",
+    "upserted": "bars_upserted",
+    "deleted": "bars_deleted",
+    "errors": "rows_rejected",
+}
+
+
+# ==================================================
+# Helpers
+# ==================================================
+def _labels(**labels) -> str:
+    """
+    Prometheus label set, values escaped.
+    """
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+# ==================================================
+# One Cycle
+# ==================================================
+class Cycle:
+    """
+    Stage timings and counters of one loop cycle.
+
+    A cycle may be handed from thread to thread: pipeline stages can record
+    into it concurrently as long as each uses its own stage / counter names.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.wall_started = time.time()
+        self.stages = {}
+        self.counts = {}
+        self.gauges = {}
+        self.failed = False
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        ``with cycle.stage("write"):`` adds the block's time to a stage.
+        """
+        started = time.monotonic()
+        try:
+            yield self
+        finally:
+            self.add_time(name, time.monotonic() - started)
+
+    def timed(self, name: str, iterable):
+        """
+        Iterate while charging the time spent waiting for each item (e.g.
+        cursor round trips) to a stage.
+        """
+        iterator = iter(iterable)
+        while True:
+            started = time.monotonic()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.monotonic() - started)
+                return
+            self.add_time(name, time.monotonic() - started)
+            yield item
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name: str, value: float = 1) -> None:
+        """
+        Add to a counter (rows_fetched, symbols, errors, ...).
+        """
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def count_sink(self, counts: dict) -> None:
+        """
+        Add the counts returned by ``BarSink.flush``.
+        """
+        for key, name in SINK_COUNTS.items():
+            if counts.get(key):
+                self.count(name, counts[key])
+        if not counts.get("committed", True):
+            self.error()
+
+    def gauge(self, name: str, value: float) -> None:
+        """
+        Set a point-in-time value (e.g. watermark_lag_seconds).
+        """
+        self.gauges[name] = value
+
+    def error(self) -> None:
+        """
+        Mark the cycle as failed (or partly failed).
+        """
+        self.failed = True
+        self.count("errors")
+
+    def duration(self) -> float:
+        return time.monotonic() - self.started
+
+
+# ==================================================
+# Loop Metrics
+# ==================================================
+class CycleMetrics:
+    """
+    Cycle history of one loop, exported after every cycle.
+    """
+
+    def __init__(
+        self,
+        loop: str,
+        metrics_dir: Path = METRICS_DIR,
+        port: int = METRICS_PORT
+    ):
+        """
+        Parameters
+        ----------
+        loop : str
+            Loop name, the ``loop`` label of every metric
+        metrics_dir : Path, optional
+            Folder of the Prometheus textfile (None: no textfile)
+        port : int, optional
+            Serve /metrics over HTTP on this port
+        """
+        self.loop = loop
+        self.path = Path(metrics_dir) / f"{loop}.prom" if metrics_dir else None
+        self.lock = threading.Lock()
+
+        self.cycles = 0
+        self.failed_cycles = 0
+        self.totals = {}
+        self.stage_totals = {}
+        self.last = None
+        self.last_finished = None
+        self.text = ""
+
+        if port:
+            self.serve(port)
+
+    # ------------------------------------------
+    # Recording
+    # ------------------------------------------
+    def start(self) -> Cycle:
+        """
+        A new cycle; hand it to ``finish`` once it is done.
+        """
+        return Cycle()
+
+    @contextmanager
+    def cycle(self):
+        """
+        ``with metrics.cycle() as cycle:`` — start, and finish on exit
+        (an exception marks the cycle failed and is re-raised).
+        """
+        cycle = self.start()
+        try:
+            yield cycle
+        except BaseException:
+            cycle.error()
+            raise
+        finally:
+            self.finish(cycle)
+
+    def finish(self, cycle: Cycle) -> None:
+        """
+        Fold a finished cycle into the totals, then log and export it.
+        """
+        duration = cycle.duration()
+
+        with self.lock:
+            self.cycles += 1
+            self.failed_cycles += int(cycle.failed)
+            for name, value in cycle.counts.items():
+                self.totals[name] = self.totals.get(name, 0) + value
+            for name, seconds in cycle.stages.items():
+                self.stage_totals[name] = (
+                    self.stage_totals.get(name, 0.0) + seconds
+                )
+            self.last = {
+                "loop": self.loop,
+                "time": round(cycle.wall_started, 3),
+                "status": "failed" if cycle.failed else "ok",
+                "duration": round(duration, 4),
+                "stages": {k: round(v, 4) for k, v in cycle.stages.items()},
+                "counts": dict(cycle.counts),
+                "gauges": dict(cycle.gauges),
+            }
+            self.last_finished = time.time()
+            self.text = self.render()
+
+        print(json.dumps(self.last))
+        self.write_textfile()
+
+    # ------------------------------------------
+    # Prometheus Exposition
+    # ------------------------------------------
+    def render(self) -> str:
+        """
+        Prometheus text format of the loop's metrics.
+        """
+        loop = _labels(loop=self.loop)
+        last = self.last
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{PREFIX}_{name}{labels} {value}")
+
+        metric("cycles_total", "counter", "Finished cycles.",
+               [(loop, self.cycles)])
+        metric("failed_cycles_total", "counter",
+               "Cycles with an error or a rolled-back write.",
+               [(loop, self.failed_cycles)])
+        metric("last_cycle_timestamp_seconds", "gauge",
+               "Unix time the last cycle finished.",
+               [(loop, round(self.last_finished, 3))])
+        metric("cycle_duration_seconds", "gauge",
+               "Duration of the last cycle.",
+               [(loop, last["duration"])])
+        metric("stage_duration_seconds", "gauge",
+               "Time spent per stage in the last cycle.",
+               [(_labels(loop=self.loop, stage=stage), seconds)
+                for stage, seconds in sorted(last["stages"].items())])
+        metric("stage_seconds_total", "counter",
+               "Time spent per stage since start.",
+               [(_labels(loop=self.loop, stage=stage), round(seconds, 4))
+                for stage, seconds in sorted(self.stage_totals.items())])
+        metric("events_total", "counter",
+               "Rows fetched, symbols, bars written and errors since start.",
+               [(_labels(loop=self.loop, event=name), value)
+                for name, value in sorted(self.totals.items())])
+        metric("last_cycle_events", "gauge",
+               "Rows fetched, symbols, bars written and errors in the last "
+               "cycle.",
+               [(_labels(loop=self.loop, event=name), value)
+                for name, value in sorted(last["counts"].items())])
+        for name, value in sorted(last["gauges"].items()):
+            metric(name, "gauge", "Loop gauge set by the last cycle.",
+                   [(loop, value)])
+
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self) -> None:
+        """
+        Atomically replace the .prom file (collectors never see half of it).
+        """
+        if self.path is None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(self.text, encoding="utf-8")
+            tmp_path.replace(self.path)
+        except OSError as error:
+            print(f"Metrics textfile write failed: {error}")
+
+    def serve(self, port: int) -> None:
+        """
+        Serve the latest exposition on /metrics from a daemon thread.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                with metrics.lock:
+                    body = metrics.text.encode("utf-8")
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4; charset=utf-8"
+                )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("", port), Handler)
+        threading.Thread(
+            target=server.serve_forever,
+            name=f"{self.loop}-metrics",
+            daemon=True,
+        ).start()
+        print(f"[{self.loop}] metrics on http://0.0.0.0:{port}/metrics")
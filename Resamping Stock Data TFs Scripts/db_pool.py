@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+DB Pool
+-------
+One Oracle session pool per process, shared by every loop iteration.
+
+Scripts used to call ``cx_Oracle.connect`` (``db_connect`` and its copies)
+every cycle, paying the full logon to the database server each time. Here
+sessions are created once, pinged before they are handed out (dead ones are
+dropped and replaced) and keep their statement cache between cycles.
+
+The DSN comes from the ``STOCK_DB_DSN`` environment variable
+("user/password@host:port/service"), falling back to the production
+database.
+
+Author: Ahmad Elsayed
+"""
+
+import os
+from contextlib import contextmanager
+
+import cx_Oracle
+
+
+DEFAULT_DSN = "STOCK/P3rXdM5HbSgQRmCS@10.1.20.41:1521/STOCK"
+
+POOL_MIN = int(os.environ.get("STOCK_DB_POOL_MIN", 1))
+POOL_MAX = int(os.environ.get("STOCK_DB_POOL_MAX", 4))
+
+# Parsed statements kept per session (the loops reuse a handful of SQLs)
+STMT_CACHE_SIZE = int(os.environ.get("STOCK_DB_STMT_CACHE", 50))
+
+_pool = None
+
+
+# ==================================================
+# Helpers
+# ==================================================
+def parse_dsn(dsn: str):
+    """
+    Split "user/password@host:port/service" into its parts.
+
+    Returns:
+        tuple: (user, password, connect string)
+    """
+    credentials, _, address = dsn.partition("@")
+    user, _, password = credentials.partition("/")
+    if not address or not password:
+        raise ValueError("DSN must look like user/password@host:port/service")
+    return user, password, address
+
+
+def get_pool() -> cx_Oracle.SessionPool:
+    """
+    The process-wide session pool, created on first use.
+    """
+    global _pool
+
+    if _pool is None:
+        user, password, address = parse_dsn(
+            os.environ.get("STOCK_DB_DSN", DEFAULT_DSN)
+        )
+        _pool = cx_Oracle.SessionPool(
+            user=user,
+            password=password,
+            dsn=address,
+            min=POOL_MIN,
+            max=POOL_MAX,
+            increment=1,
+            threaded=True,
+            getmode=cx_Oracle.SPOOL_ATTRVAL_WAIT,
+        )
+        _pool.stmtcachesize = STMT_CACHE_SIZE
+        print(f"Oracle session pool ready ({address}, max {POOL_MAX})")
+
+    return _pool
+
+
+# ==================================================
+# Acquire / Release
+# ==================================================
+def acquire() -> cx_Oracle.Connection:
+    """
+    Take a healthy session from the pool.
+
+    A session that fails a ping (network drop, server restart) is dropped
+    from the pool and a fresh one is taken instead.
+    """
+    pool = get_pool()
+
+    connection = pool.acquire()
+    try:
+        connection.ping()
+    except cx_Oracle.Error as error:
+        print(f"Dropping dead pooled session: {error}")
+        pool.drop(connection)
+        connection = pool.acquire()
+
+    return connection
+
+
+def release(connection: cx_Oracle.Connection) -> None:
+    """
+    Return a session to the pool (uncommitted work is rolled back).
+    """
+    pool = get_pool()
+    try:
+        pool.release(connection)
+    except cx_Oracle.Error as error:
+        print(f"Dropping pooled session on release: {error}")
+        try:
+            pool.drop(connection)
+        except cx_Oracle.Error:
+            pass
+
+
+@contextmanager
+def pooled_connection():
+    """
+    ``with pooled_connection() as con:`` — acquire and always release.
+    """
+    connection = acquire()
+    try:
+        yield connection
+    finally:
+        release(connection)
+
+
+def close_pool() -> None:
+    """
+    Close every session of the pool (end of a one-shot script).
+    """
+    global _pool
+
+    if _pool is not None:
+        _pool.close(force=True)
+        _pool = None
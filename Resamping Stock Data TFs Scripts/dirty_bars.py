@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+"""
+Dirty Bars
+----------
+Finds and rebuilds the bars invalidated by late or corrected trades.
+
+The loops only read trades at/after their watermark, so a trade printed
+late (EXEC_TIME before the watermark), corrected or busted never reached
+its bar. The tracker keeps a per-minute ledger (trade count, volume,
+price x volume) of every trade turned into bars and, every
+RECONCILE_SECONDS, compares it with the same totals aggregated by the
+database. Minutes that differ are dirty:
+
+    - the affected symbols are rebuilt from STOCK.TRADES starting at the
+      bucket of their earliest dirty minute (later bars too: the session
+      VWAP is cumulative) up to the bound of the fetch in flight,
+    - bars left without trades are deleted,
+    - the symbol watermarks are restated from the rebuilt trades.
+
+Stopping at the fetch bound keeps a repair and the fetch running next to
+it apart: the repair owns the trades before the bound, the fetch (and the
+restated watermark, always before the bound) every trade from it on.
+
+Only dirty symbols are re-read, so corrections cost close to an
+incremental cycle instead of a full rebuild. The comparison itself only
+reads the minutes since the last clean one, less LATE_TRADE_LOOKBACK:
+trades printed or corrected further back than that are fixed by
+running bar_backfill.py for the day once it is over.
+
+Author: Ahmad Elsayed
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from bar_engine import (
+    TOTAL_COLUMNS,
+    add_totals,
+    bucket_starts,
+    resample_trades,
+    trade_totals,
+)
+from trade_stream import iter_frames
+
+
+# Seconds between two ledger / database comparisons
+RECONCILE_SECONDS = 60
+
+# How far before the last clean comparison a comparison starts
+LATE_TRADE_LOOKBACK = pd.Timedelta("15Min")
+
+# Per-minute totals of STOCK.TRADES (rows the loops would drop excluded)
+CHECKSUM_SQL = """
+    SELECT
+        T2.REUTERS,
+        TRUNC(T1.EXEC_TIME, 'MI'),
+        COUNT(*),
+        SUM(T1.VOLUME_TRADED),
+        SUM(T1.TRADE_PRICE * T1.VOLUME_TRADED)
+    FROM STOCK.TRADES T1
+    JOIN STOCK.SYMBOLINFO T2
+        ON T2.SYMBOL_CODE = T1.SYMBOL_CODE
+    WHERE T1.EXEC_TIME >= :start_time
+      AND T1.EXEC_TIME <= :end_time
+      AND T1.EXEC_TIME < :until
+      AND T2.REUTERS IS NOT NULL
+      AND T1.TRADE_PRICE IS NOT NULL
+      AND T1.VOLUME_TRADED IS NOT NULL
+    GROUP BY T2.REUTERS, TRUNC(T1.EXEC_TIME, 'MI')
+"""
+
+SYMBOL_TRADES_SQL = """
+    SELECT
+        T2.REUTERS,
+        T1.EXEC_TIME,
+        T1.TRADE_PRICE,
+        T1.VOLUME_TRADED
+    FROM STOCK.TRADES T1
+    JOIN STOCK.SYMBOLINFO T2
+        ON T2.SYMBOL_CODE = T1.SYMBOL_CODE
+    WHERE T2.REUTERS = :symbol
+      AND T2.REUTERS IS NOT NULL
+      AND T1.EXEC_TIME >= :start_time
+      AND T1.EXEC_TIME <= :end_time
+      AND T1.EXEC_TIME < :until
+    ORDER BY T1.EXEC_TIME
+"""
+
+
+# ==================================================
+# Helpers
+# ==================================================
+def stock_ticker(symbol: str) -> str:
+    """
+    Stored FILL_OHLCV* ticker of a REUTERS code, as the loops write it.
+    """
+    return symbol.replace(".CA", "").strip()
+
+
+def stock_bars(bars: pd.DataFrame) -> pd.DataFrame:
+    """
+    (code, time) indexed bars keyed by stored ticker instead of REUTERS
+    code.
+    """
+    index = bars.index
+    tickers = pd.Index(index.levels[0].map(stock_ticker)).take(index.codes[0])
+    return bars.set_axis(
+        pd.MultiIndex.from_arrays(
+            [tickers, index.get_level_values("time")], names=["code", "time"]
+        )
+    )
+
+
+def _empty_bars() -> pd.DataFrame:
+    return resample_trades(pd.DataFrame(), "1Min")
+
+
+# ==================================================
+# Dirty Bar Tracker
+# ==================================================
+class DirtyBarTracker:
+    """
+    Per-minute trade ledger of one loop and the repair of dirty bars.
+    """
+
+    def __init__(
+        self,
+        freq: str,
+        calendar=None,
+        reconcile_seconds: float = RECONCILE_SECONDS,
+        lookback: pd.Timedelta = LATE_TRADE_LOOKBACK
+    ):
+        """
+        Parameters
+        ----------
+        freq : str
+            Bar frequency the loop builds (e.g. "1Min")
+        calendar : TradingCalendar, optional
+            Session calendar the loop's bar builder uses
+        reconcile_seconds : float
+            Minimum time between two comparisons (``due``)
+        lookback : pd.Timedelta
+            How far before the last clean minute a comparison starts
+        """
+        self.freq = freq
+        self.calendar = calendar
+        self.reconcile_seconds = reconcile_seconds
+        self.lookback = lookback
+        self.ledger = None
+        self.seeded = False
+        self.clean_until = None
+        self.last_check = None
+
+    # ------------------------------------------
+    # Ledger
+    # ------------------------------------------
+    def record(self, minute_totals: pd.DataFrame) -> None:
+        """
+        Add the per-minute totals of trades just turned into bars
+        (``StreamingBarBuilder.minute_totals``).
+        """
+        if minute_totals is not None and not minute_totals.empty:
+            self.ledger = add_totals(self.ledger, minute_totals)
+
+    def state(self) -> tuple:
+        """
+        Ledger state to ``restore`` after a rewind (ledger frames are
+        replaced, never modified, so no copy is needed).
+        """
+        return self.ledger, self.seeded, self.clean_until
+
+    def restore(self, state: tuple) -> None:
+        """
+        Return to a ``state`` (e.g. the one of the last stored cycle after
+        a rewind), so the minutes found dirty since are compared again.
+        """
+        self.ledger, self.seeded, self.clean_until = state
+
+    def due(self) -> bool:
+        """
+        True once RECONCILE_SECONDS have passed since the last comparison.
+        """
+        return (
+            self.last_check is None
+            or time.monotonic() - self.last_check >= self.reconcile_seconds
+        )
+
+    def _window(self, until: pd.Timestamp):
+        """
+        Session bounds of the watermark's day.
+        """
+        if self.calendar is not None:
+            session = self.calendar.session(until)
+            if session is not None:
+                return session
+
+        day = until.normalize()
+        return day, day + pd.Timedelta("1D") - pd.Timedelta(1, "us")
+
+    # ------------------------------------------
+    # Detection
+    # ------------------------------------------
+    def find_dirty(self, cursor, until) -> dict:
+        """
+        Compare the ledger with the database for the complete minutes
+        before the watermark, from LATE_TRADE_LOOKBACK before the last
+        clean comparison on (the whole session until one was clean).
+
+        The first comparison (fresh start, or a rewind before any cycle was
+        stored) adopts the
+        database totals of the session for minutes missing from the ledger
+        instead.
+
+        Parameters
+        ----------
+        until : datetime | None
+            Bound of the fetch in flight (the loop watermark it read)
+
+        Returns:
+            dict: symbol → earliest dirty minute
+        """
+        self.last_check = time.monotonic()
+        if until is None:
+            return {}
+
+        until = pd.Timestamp(until).floor("1Min")
+        session_start, end = self._window(until)
+
+        start = session_start
+        if self.clean_until is not None:
+            start = max(start, self.clean_until - self.lookback)
+
+        cursor.execute(CHECKSUM_SQL, {
+            "start_time": start.to_pydatetime(),
+            "end_time": end.to_pydatetime(),
+            "until": until.to_pydatetime(),
+        })
+        stored = pd.DataFrame(
+            cursor.fetchall(), columns=["code", "time"] + TOTAL_COLUMNS
+        )
+        stored["time"] = pd.to_datetime(stored["time"])
+        stored = stored.set_index(["code", "time"]).astype(float)
+
+        ledger = self.ledger
+        if ledger is not None:
+            # Earlier sessions are settled
+            ledger = ledger.loc[
+                ledger.index.get_level_values("time") >= session_start
+            ]
+        self.ledger = ledger
+
+        if not self.seeded:
+            self.seeded = True
+            if ledger is not None:
+                stored = stored.loc[~stored.index.isin(ledger.index)]
+            self.ledger = add_totals(ledger, stored)
+            return {}
+
+        if ledger is None:
+            ledger = stored.iloc[:0]
+        times = ledger.index.get_level_values("time")
+        ledger = ledger.loc[(times >= start) & (times < until)]
+
+        both = stored.join(ledger, how="outer", rsuffix="_ledger").fillna(0.0)
+        clean = np.ones(len(both), dtype=bool)
+        for column in TOTAL_COLUMNS:
+            clean &= np.isclose(
+                both[column].to_numpy(),
+                both[f"{column}_ledger"].to_numpy(),
+                rtol=1e-9,
+                atol=1e-6,
+            )
+
+        dirty = both.index[~clean]
+        if dirty.empty:
+            self.clean_until = until
+            return {}
+
+        earliest = pd.Series(
+            dirty.get_level_values("time"),
+            index=dirty.get_level_values("code"),
+        ).groupby(level=0).min()
+        return earliest.to_dict()
+
+    # ------------------------------------------
+    # Repair
+    # ------------------------------------------
+    def rebuild(self, cursor, dirty: dict, until) -> dict:
+        """
+        Rebuild the bars of every dirty symbol from its earliest dirty
+        bucket on, from the trades before ``until`` (the bound of the
+        fetch in flight, which reads the rest).
+
+        Returns:
+            dict: ``bars`` ((code, time) indexed rebuilt bars), ``stale``
+            (list of (code, bucket) bars left without trades), ``stats``
+            (symbol → watermark inputs, None when no trade is left) and
+            ``totals`` (symbol → (first bucket, new ledger rows))
+        """
+        repair = {"bars": [], "stale": [], "stats": {}, "totals": {}}
+        until = pd.Timestamp(until) if dirty else None
+
+        for symbol, first_minute in dirty.items():
+            session_start, session_end = self._window(first_minute)
+            start = bucket_starts(
+                pd.DatetimeIndex([first_minute]), self.freq, self.calendar
+            )[0]
+            start = max(start, session_start)
+
+            trades = self._symbol_trades(
+                cursor, symbol, start, session_end, until
+            )
+            if trades.empty and start > session_start:
+                # Trades after ``start`` all busted: the watermark must
+                # come from the last trade before it
+                start = session_start
+                trades = self._symbol_trades(
+                    cursor, symbol, start, session_end, until
+                )
+
+            minutes = self._symbol_ledger(symbol)
+            before = minutes.loc[minutes.index < start]
+            base = (float(before["pv"].sum()), float(before["volume"].sum()))
+
+            bars = resample_trades(
+                trades,
+                self.freq,
+                vwap_base={symbol: base},
+                calendar=self.calendar,
+            )
+            repair["bars"].append(bars)
+
+            # Buckets that had trades in the ledger but have none now
+            # (the fetch in flight re-reads the minutes from ``until``)
+            old = minutes.loc[
+                (minutes.index >= start) & (minutes.index < until)
+            ].index
+            if not old.empty:
+                old_buckets = bucket_starts(old, self.freq, self.calendar)
+                new_buckets = bars.index.get_level_values("time")
+                gone = old_buckets[~old_buckets.isin(new_buckets)].unique()
+                repair["stale"] += [(symbol, bucket) for bucket in gone]
+
+            repair["totals"][symbol] = (start, trade_totals(trades))
+            repair["stats"][symbol] = self._trade_stats(trades, base)
+
+        if repair["bars"]:
+            repair["bars"] = pd.concat(repair["bars"]).sort_index()
+        else:
+            repair["bars"] = _empty_bars()
+
+        return repair
+
+    def commit(self, repair: dict, watermarks) -> None:
+        """
+        Adopt a repair once its bars are stored: ledger rows and symbol
+        watermarks are replaced by the rebuilt ones.
+        """
+        bars = repair["bars"]
+        codes = bars.index.get_level_values("code")
+
+        for symbol, (start, totals) in repair["totals"].items():
+            if self.ledger is not None:
+                codes_l = self.ledger.index.get_level_values("code")
+                times_l = self.ledger.index.get_level_values("time")
+                self.ledger = self.ledger.loc[
+                    (codes_l != symbol) | (times_l < start)
+                ]
+            self.ledger = add_totals(self.ledger, totals)
+
+            watermarks.restate(
+                symbol,
+                repair["stats"][symbol],
+                bars.loc[codes == symbol].droplevel("code"),
+            )
+
+    def _symbol_ledger(self, symbol: str) -> pd.DataFrame:
+        """
+        Ledger rows of one symbol, indexed by minute.
+        """
+        if self.ledger is None:
+            return trade_totals(pd.DataFrame()).droplevel("code")
+        codes = self.ledger.index.get_level_values("code")
+        return self.ledger.loc[codes == symbol].droplevel("code")
+
+    def _symbol_trades(
+        self,
+        cursor,
+        symbol: str,
+        start,
+        end,
+        until
+    ) -> pd.DataFrame:
+        """
+        Session trades of one symbol from ``start`` on, before ``until``.
+        """
+        chunks = list(iter_frames(cursor, SYMBOL_TRADES_SQL, {
+            "symbol": symbol,
+            "start_time": start.to_pydatetime(),
+            "end_time": end.to_pydatetime(),
+            "until": until.to_pydatetime(),
+        }))
+        if not chunks:
+            return pd.DataFrame(columns=["code", "price", "volume"])
+
+        trades = pd.concat(chunks)
+        if self.calendar is not None:
+            trades = self.calendar.session_frame(trades)
+        return trades
+
+    @staticmethod
+    def _trade_stats(trades: pd.DataFrame, base: tuple):
+        """
+        Watermark inputs of a rebuilt symbol (as
+        ``StreamingBarBuilder.trade_stats``).
+        """
+        if trades.empty:
+            return None
+
+        price = trades["price"].to_numpy(dtype=float)
+        volume = trades["volume"].to_numpy(dtype=float)
+        last_time = trades.index.max()
+
+        return {
+            "last_time": last_time,
+            "last_count": int((trades.index == last_time).sum()),
+            "cum_pv": base[0] + float((price * volume).sum()),
+            "cum_volume": base[1] + float(volume.sum()),
+        }
+
+
+# ==================================================
+# Writing
+# ==================================================
+def repair_frames(repair: dict):
+    """
+    Rebuilt and stale bars of a repair keyed by stored ticker.
+
+    Returns:
+        tuple: ((code, time) indexed bars, (code, time) index of the bars
+        to delete)
+    """
+    bars = stock_bars(repair["bars"])
+    stale = pd.MultiIndex.from_arrays(
+        [
+            [stock_ticker(symbol) for symbol, _ in repair["stale"]],
+            pd.DatetimeIndex([bucket for _, bucket in repair["stale"]]),
+        ],
+        names=["code", "time"],
+    )
+    return bars, stale
+
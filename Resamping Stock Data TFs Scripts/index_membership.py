@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Index Membership
+----------------
+One resolver for the constituents of every EGX index, shared by the
+resampling loops, the EWI loop, the watchlist extractor and the NetFlow
+export.
+
+All index → constituent sets are loaded with a single query (one
+``UNION ALL`` branch per constituents table) and kept in memory for
+INDEX_MEMBERSHIP_TTL seconds. The last load is also written to
+state/index_membership.json, so a restart within the TTL needs no query at
+all, a loop whose TTL expires first picks up a newer snapshot saved by
+another process, and a failed refresh keeps serving the last known
+membership.
+
+    MEMBERSHIP = IndexMembership()
+    MEMBERSHIP.update(connection)      # queries only once the TTL expired
+    symbols = MEMBERSHIP.members("EGX30")
+
+Constituents are stored tickers: the REUTERS code without ".CA".
+
+Author: Ahmad Elsayed
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+from trade_watermark import STATE_DIR
+
+
+# Index name → constituents table
+INDEX_TABLES = {
+    "EGX30": "CASE30_COMPANIES",
+    "EGX30 Capped": "EGX30_CAP_SYMBOLS",
+    "EGX30TR": "EGX30_SYMBOLS_TR",
+    "EGX50": "EGX50_SYMBOLS",
+    "EGX70": "EGX70_SYMBOLS",
+    "EGX70 EWI": "EGX70_SYMBOLS_EWI",
+    "EGX100": "EGX100_SYMBOLS",
+    "SHARIAH": "EGX_SHARIAH_SYMBOLS",
+    "EGX35-LV": "EGX_VOLATILITY_SYMBOLS",
+}
+
+# Seconds a loaded membership is served before it is queried again
+MEMBERSHIP_TTL = float(os.environ.get("INDEX_MEMBERSHIP_TTL", 3600))
+
+SNAPSHOT_PATH = STATE_DIR / "index_membership.json"
+
+MEMBERS_SQL = """
+    SELECT '{table}', T2.REUTERS
+    FROM {table} T1
+    JOIN STOCK.SYMBOLINFO T2
+        ON T2.SYMBOL_CODE = T1.SYMBOL_CODE
+"""
+
+
+# ==================================================
+# Membership Resolver
+# ==================================================
+class IndexMembership:
+    """
+    TTL-cached constituents of every index, backed by an on-disk snapshot.
+    """
+
+    def __init__(
+        self,
+        tables: dict = INDEX_TABLES,
+        ttl: float = MEMBERSHIP_TTL,
+        snapshot_path: Path = SNAPSHOT_PATH
+    ):
+        """
+        Parameters
+        ----------
+        tables : dict
+            Index name → constituents table
+        ttl : float
+            Seconds before the membership is queried again
+        snapshot_path : Path
+            JSON snapshot of the last load (None: no snapshot)
+        """
+        self.tables = dict(tables)
+        self.ttl = ttl
+        self.path = Path(snapshot_path) if snapshot_path else None
+
+        self.members_of = {}
+        self.loaded_at = None
+        self.load()
+
+    # ------------------------------------------
+    # Snapshot
+    # ------------------------------------------
+    def load(self) -> None:
+        """
+        Load the snapshot, if it covers every table.
+        """
+        if self.path is None or not self.path.exists():
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as snapshot_file:
+                saved = json.load(snapshot_file)
+        except (OSError, ValueError) as error:
+            print(f"Ignoring unreadable membership file {self.path}: {error}")
+            return
+
+        tables = saved.get("tables", {})
+        if not set(self.tables.values()) <= set(tables):
+            return
+
+        self.members_of = {table: tuple(tables[table]) for table in tables}
+        self.loaded_at = saved["loaded_at"]
+
+    def save(self) -> None:
+        """
+        Atomically write the snapshot (one temporary file per process).
+        """
+        if self.path is None:
+            return
+
+        payload = {
+            "loaded_at": self.loaded_at,
+            "tables": {t: list(s) for t, s in self.members_of.items()},
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as snapshot_file:
+            json.dump(payload, snapshot_file)
+        tmp_path.replace(self.path)
+
+    # ------------------------------------------
+    # Loading
+    # ------------------------------------------
+    def refresh(self, connection) -> None:
+        """
+        Query the constituents of every index at once and save them.
+        """
+        sql = " UNION ALL ".join(
+            MEMBERS_SQL.format(table=table)
+            for table in sorted(set(self.tables.values()))
+        )
+
+        cursor = connection.cursor()
+        cursor.execute(sql)
+        rows = cursor.fetchall()
+        cursor.close()
+
+        members_of = {table: set() for table in self.tables.values()}
+        for table, reuters in rows:
+            if reuters:
+                members_of[table].add(reuters.replace(".CA", "").strip())
+
+        self.members_of = {
+            table: tuple(sorted(symbols))
+            for table, symbols in members_of.items()
+        }
+        self.loaded_at = time.time()
+        self.save()
+
+    def expired(self) -> bool:
+        return self.loaded_at is None or time.time() - self.loaded_at >= self.ttl
+
+    def update(self, connection) -> None:
+        """
+        Refresh once the TTL expired, unless another process already saved
+        a newer snapshot. A failed refresh keeps the last known membership
+        (and is retried on the next call).
+        """
+        if not self.expired():
+            return
+
+        self.load()
+        if not self.expired():
+            return
+
+        try:
+            self.refresh(connection)
+        except Exception as error:
+            if self.loaded_at is None:
+                raise
+            print(f"Index membership refresh failed, kept the last: {error}")
+
+    # ------------------------------------------
+    # Lookups
+    # ------------------------------------------
+    def table_members(self, table: str) -> tuple:
+        """
+        Stored tickers listed in a constituents table, sorted.
+        """
+        return self.members_of[table]
+
+    def members(self, index_name: str) -> tuple:
+        """
+        Stored tickers of an index, sorted.
+        """
+        return self.members_of[self.tables[index_name]]
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+Index Resampling
+----------------
+CASEINDEX processing shared by the resampling loops: index ticks become
+5-minute OHLC bars whose volume is the summed volume of the index
+constituents in the target bar table.
+
+The ticks are read incrementally (``caseindex_stream``): each cycle only
+fetches the ticks after the per-index watermarks and folds them into the
+open bars kept in memory.
+
+The loops keep that volume in memory (``IndexVolumeRollup``): the session's
+constituent bars are loaded once at startup, then every bar the process
+writes adjusts the per-index totals of its timestamp, instead of summing
+each index's whole history in the database every cycle.
+
+Author: Ahmad Elsayed
+"""
+
+import sys
+
+import pandas as pd
+
+from index_membership import IndexMembership
+from index_ticks import IndexTickStream
+from trade_stream import iter_frames
+from trading_calendar import market_now
+
+
+# Index name (as stored in FILL_OHLCV*) → constituents table (resolved by
+# index_membership.IndexMembership)
+INDEX_SQL_MAP = {
+    "EGX30": "CASE30_COMPANIES",
+    "EGX70": "EGX70_SYMBOLS_EWI",
+    "EGX100": "EGX100_SYMBOLS",
+    "EGX50": "EGX50_SYMBOLS",
+    "EGX30 Capped": "EGX30_CAP_SYMBOLS",
+    "SHARIAH": "EGX_SHARIAH_SYMBOLS",
+    "EGX35-LV": "EGX_VOLATILITY_SYMBOLS",
+}
+
+
+# Column layout of CASEINDEX: (time, code, price)
+CASEINDEX_LAYOUT_SQL = "SELECT * FROM CASEINDEX WHERE 1 = 0"
+
+# Stock bars of the current session, loaded once to seed the rollup
+SESSION_VOLUME_SQL = """
+    SELECT TICKER, BARTIMESTAMP, VOLUME
+    FROM {table}
+    WHERE ASSET = 1
+      AND BARTIMESTAMP >= :session_start
+"""
+
+
+# ==================================================
+# Helpers
+# ==================================================
+def index_ticker(index_code: str):
+    """
+    Map a CASEINDEX code to its FILL_OHLCV* ticker.
+
+    Returns:
+        str | None: ticker, or None for indices without constituents
+    """
+    index_name = index_code.replace("EWI", "").strip()
+
+    if index_name == "EGX30 TR":
+        index_name = "EGX30TR"
+
+    if index_name not in INDEX_SQL_MAP:
+        return None
+    return index_name
+
+
+def caseindex_stream(
+    connection,
+    name: str,
+    freq: str = "5Min",
+    calendar=None
+) -> IndexTickStream:
+    """
+    Incremental OHLC bars of every CASEINDEX series (session ticks only,
+    session-anchored, when a calendar is given).
+
+    The table is read with ``SELECT *``; its time column is looked up once
+    so the fetch can be bounded by the watermark.
+
+    Parameters
+    ----------
+    name : str
+        State file of the loop's index watermarks
+    """
+    cursor = connection.cursor()
+    cursor.execute(CASEINDEX_LAYOUT_SQL)
+    time_column = cursor.description[0][0]
+    cursor.close()
+
+    return IndexTickStream(
+        name,
+        f"""
+        SELECT *
+        FROM CASEINDEX
+        WHERE {time_column} >= :since
+        ORDER BY {time_column}
+        """,
+        freq,
+        columns=["time", "code", "price"],
+        calendar=calendar,
+    )
+
+
+# ==================================================
+# Incremental Constituent Volume
+# ==================================================
+class IndexVolumeRollup:
+    """
+    Per-index constituent volume by bar timestamp for one bar table.
+
+    Each stock bar updates the totals of the indices holding its ticker by
+    the change of its volume, so an index costs one dictionary update per
+    new or changed bar. Membership is taken from every ``index_volume``
+    call; an index whose member set changed is summed again from the
+    session's bars.
+    """
+
+    def __init__(self, table: str):
+        """
+        Parameters
+        ----------
+        table : str
+            Bar table of the constituent bars (e.g. "STOCK.FILL_OHLCV")
+        """
+        self.table = table
+        self.day = None
+        self.volumes = {}
+        self.members = {}
+        self.member_of = {}
+        self.totals = {}
+
+    def warm(self, connection, session_start=None) -> None:
+        """
+        Load the stored stock bars of the session with one query.
+        """
+        if session_start is None:
+            session_start = market_now().normalize()
+
+        cursor = connection.cursor()
+        for chunk in iter_frames(
+            cursor,
+            SESSION_VOLUME_SQL.format(table=self.table),
+            {"session_start": pd.Timestamp(session_start).to_pydatetime()},
+            columns=["code", "time", "volume"],
+        ):
+            self.record(chunk.reset_index().set_index(["code", "time"]))
+        cursor.close()
+
+        print(
+            f"{self.table}: constituent volume loaded for "
+            f"{len(self.volumes)} tickers"
+        )
+
+    # ------------------------------------------
+    # Constituent Bars
+    # ------------------------------------------
+    def _new_day(self, day: pd.Timestamp) -> None:
+        """
+        Forget the previous session once bars of a later day arrive.
+        """
+        self.day = day
+        self.volumes = {}
+        self.totals = {name: {} for name in self.members}
+
+    def _apply(self, ticker: str, time, volume) -> None:
+        """
+        Set (or with None remove) one bar's volume and adjust the totals
+        of the indices holding its ticker.
+        """
+        bars = self.volumes.setdefault(ticker, {})
+        previous = bars.pop(time, None)
+        if volume is not None:
+            bars[time] = volume
+
+        delta = (volume or 0.0) - (previous or 0.0)
+        count = (volume is not None) - (previous is not None)
+
+        for index_name in self.member_of.get(ticker, ()):
+            totals = self.totals[index_name]
+            total, members = totals.get(time, (0.0, 0))
+            members += count
+            if members:
+                totals[time] = (total + delta, members)
+            else:
+                totals.pop(time, None)
+
+    def record(self, bars: pd.DataFrame) -> None:
+        """
+        Track stored stock bars: (code, time) indexed with a ``volume``
+        column, code being the stored ticker.
+        """
+        if bars.empty:
+            return
+
+        times = bars.index.get_level_values("time")
+        last_day = times.max().normalize()
+        if self.day is None or last_day > self.day:
+            self._new_day(last_day)
+
+        for (ticker, time), volume in zip(
+            bars.index, bars["volume"].to_numpy(dtype=float)
+        ):
+            if time >= self.day:
+                self._apply(ticker, time, float(volume))
+
+    def remove(self, keys) -> None:
+        """
+        Forget deleted stock bars ((ticker, time) pairs).
+        """
+        for ticker, time in keys:
+            if time in self.volumes.get(ticker, {}):
+                self._apply(ticker, time, None)
+
+    # ------------------------------------------
+    # Index Volume
+    # ------------------------------------------
+    def index_volume(self, index_name: str, symbols) -> pd.DataFrame:
+        """
+        Summed constituent volume of an index per bar timestamp.
+
+        Returns:
+            pd.DataFrame: time indexed ``volume``
+        """
+        symbols = frozenset(symbols)
+
+        if self.members.get(index_name) != symbols:
+            for ticker in self.members.get(index_name, ()):
+                self.member_of[ticker].discard(index_name)
+            for ticker in symbols:
+                self.member_of.setdefault(ticker, set()).add(index_name)
+            self.members[index_name] = symbols
+
+            totals = {}
+            for ticker in symbols:
+                for time, volume in self.volumes.get(ticker, {}).items():
+                    total, members = totals.get(time, (0.0, 0))
+                    totals[time] = (total + volume, members + 1)
+            self.totals[index_name] = totals
+
+        totals = self.totals[index_name]
+        return pd.DataFrame(
+            {"volume": [total for total, _ in totals.values()]},
+            index=pd.DatetimeIndex(list(totals), name="time"),
+        )
+
+
+# ==================================================
+# Index Bars
+# ==================================================
+def queue_index_bars(
+    cursor,
+    index_bars,
+    table: str,
+    sink,
+    last_bars,
+    membership: IndexMembership,
+    volumes: IndexVolumeRollup = None
+) -> bool:
+    """
+    Attach constituent volume to the 5-minute index bars and queue the new
+    ones on the sink.
+
+    Parameters
+    ----------
+    cursor : cx_Oracle.Cursor
+        Cursor used for the database volume sum
+    index_bars : pd.DataFrame
+        (code, time) indexed OHLC bars of every CASEINDEX series
+    table : str
+        Bar table holding the constituent bars (and receiving index bars)
+    sink : BarSink
+        Sink collecting the cycle's index bars
+    last_bars : LastBarCache
+        Last stored bar per ticker of ``table``
+    membership : IndexMembership
+        Constituents of every index (kept current by the loop)
+    volumes : IndexVolumeRollup, optional
+        In-memory constituent volume of ``table``; without it the volume
+        is summed by the database
+
+    Returns:
+        bool: False if an index failed (its bars are not all queued)
+    """
+    try:
+        for index_code, ohlc_5m in index_bars.groupby(level="code", sort=False):
+
+            index_name = index_ticker(index_code)
+            if index_name is None:
+                continue
+
+            symbols = membership.table_members(INDEX_SQL_MAP[index_name])
+
+            if volumes is not None:
+                volume_df = volumes.index_volume(index_name, symbols)
+            else:
+                placeholders = ",".join(f":{i}" for i in range(len(symbols)))
+                cursor.execute(
+                    f"""
+                    SELECT BARTIMESTAMP, SUM(VOLUME)
+                    FROM {table}
+                    WHERE Ticker IN ({placeholders})
+                    GROUP BY BARTIMESTAMP
+                    ORDER BY BARTIMESTAMP DESC
+                    """,
+                    list(symbols),
+                )
+
+                volume_df = pd.DataFrame(
+                    cursor.fetchall(),
+                    columns=["time", "volume"]
+                )
+                volume_df.set_index("time", inplace=True)
+                volume_df.index = pd.to_datetime(volume_df.index)
+
+            final_df = pd.concat(
+                [ohlc_5m.droplevel("code"), volume_df], axis=1
+            ).dropna()
+
+            last_row = last_bars.get(index_name)
+
+            if last_row and sink.mode == "upsert":
+                # Re-merge the stored last bar too, it may still be open
+                to_insert = final_df.loc[
+                    final_df.index.to_pydatetime() >= last_row[6]
+                ]
+            elif last_row:
+                to_insert = final_df.loc[
+                    final_df.index.to_pydatetime() > last_row[6]
+                ]
+            else:
+                to_insert = final_df.copy()
+
+            sink.insert_frame(
+                index_name, to_insert, asset=0, vwap_column="close"
+            )
+
+    except Exception as e:
+        exc_type, exc_obj, exc_tb = sys.exc_info()
+        print(str(e), exc_tb.tb_lineno)
+        return False
+
+    return True
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Index Tick Stream
+-----------------
+Incremental OHLC bars from an index tick table (CASEINDEX,
+CASE_SECTOR_INDEX).
+
+Instead of re-reading and re-resampling the whole tick history every
+cycle, the stream keeps per index code:
+    - the last tick time consumed and how many ticks carried that time
+    - the open (last) bar those ticks built
+
+Each ``fetch`` only reads the ticks at/after the oldest watermark of the
+day, drops the ones already consumed, folds the rest into the open bars
+and returns the bars they touched plus every open bar (which the loops
+re-merge as the last stored bar). ``commit`` keeps the new state once the
+bars are written; without it the next fetch starts from the same
+watermarks again.
+
+    stream = IndexTickStream("5min_index_ticks", sql, "5Min", calendar=...)
+    bars = stream.fetch(cursor)
+    if stored(sink.flush(con)):
+        stream.commit()
+
+The state is saved as JSON next to the trade watermarks and is reset per
+code when its ticks roll over to a new day.
+
+Author: Ahmad Elsayed
+"""
+
+import copy
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from bar_engine import OHLC_COLUMNS, merge_bars, resample_ticks
+from trade_stream import iter_frames
+from trade_watermark import STATE_DIR
+from trading_calendar import market_now
+
+
+# ==================================================
+# Tick Stream
+# ==================================================
+class IndexTickStream:
+    """
+    Persisted per-index tick watermarks and open bars for one tick query.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        sql: str,
+        freq: str = "5Min",
+        columns: list = ("time", "code", "price"),
+        code_column: str = "code",
+        value_column: str = "price",
+        prepare=None,
+        calendar=None,
+        state_dir: Path = STATE_DIR
+    ):
+        """
+        Parameters
+        ----------
+        name : str
+            State file name (without extension), one per loop
+        sql : str
+            Tick query with a ``:since`` lower bound on the tick time,
+            ordered by time
+        freq : str
+            Pandas bar frequency (e.g. "5Min")
+        columns : list
+            Result column names; must contain "time"
+        code_column, value_column : str
+            Columns holding the index code and its value
+        prepare : callable, optional
+            Applied to every fetched chunk first (e.g. code normalization)
+        calendar : TradingCalendar, optional
+            Build bars from session ticks only, anchored to the open
+        state_dir : Path
+            Folder holding the JSON state files
+        """
+        self.sql = sql
+        self.freq = freq
+        self.columns = list(columns)
+        self.code_column = code_column
+        self.value_column = value_column
+        self.prepare = prepare
+        self.calendar = calendar
+        self.path = Path(state_dir) / f"{name}.json"
+
+        self.codes = {}
+        self.pending = None
+        self.rows = 0
+        self.load()
+
+    # ------------------------------------------
+    # Persistence
+    # ------------------------------------------
+    def load(self) -> None:
+        """
+        Load the saved watermarks, if any.
+        """
+        if not self.path.exists():
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as state_file:
+                saved = json.load(state_file)
+        except (OSError, ValueError) as error:
+            print(f"Ignoring unreadable watermark file {self.path}: {error}")
+            return
+
+        if saved.get("freq") != self.freq:
+            return
+
+        for code, state in saved.get("codes", {}).items():
+            state["last_time"] = pd.Timestamp(state["last_time"])
+            if state.get("open_bar"):
+                state["open_bar"]["time"] = pd.Timestamp(
+                    state["open_bar"]["time"]
+                )
+            self.codes[code] = state
+
+    def save(self) -> None:
+        """
+        Atomically write the watermarks to disk.
+        """
+        payload = {"freq": self.freq, "codes": {}}
+
+        for code, state in self.codes.items():
+            entry = dict(state)
+            entry["last_time"] = state["last_time"].isoformat()
+            if state.get("open_bar"):
+                entry["open_bar"] = dict(state["open_bar"])
+                entry["open_bar"]["time"] = state["open_bar"]["time"].isoformat()
+            payload["codes"][code] = entry
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as state_file:
+            json.dump(payload, state_file)
+        tmp_path.replace(self.path)
+
+    # ------------------------------------------
+    # Fetch Window
+    # ------------------------------------------
+    def since(self, day: pd.Timestamp):
+        """
+        Lower tick time bound covering every code: the oldest watermark of
+        the day, or the start of the day.
+        """
+        times = [
+            state["last_time"] for state in self.codes.values()
+            if state["last_time"] >= day
+        ]
+        return min(times, default=day).to_pydatetime()
+
+    def _new_ticks(
+        self,
+        ticks: pd.DataFrame,
+        states: dict,
+        skipped: dict
+    ) -> pd.DataFrame:
+        """
+        Drop the ticks already consumed. The fetch uses ">=" on the
+        watermark, so ticks sharing the last consumed time come back; the
+        stored count skips them, even across fetched chunks.
+        """
+        if not states or ticks.empty:
+            return ticks
+
+        codes = ticks[self.code_column]
+        last_times = pd.DatetimeIndex(codes.map(
+            {code: state["last_time"] for code, state in states.items()}
+        ))
+        last_counts = codes.map(
+            {code: state["last_count"] for code, state in states.items()}
+        )
+
+        same = ticks.index == last_times
+        keep = last_times.isna() | (ticks.index > last_times)
+
+        if same.any():
+            # Position of each tick among its code's ticks at the watermark
+            same_codes = codes[same]
+            seen = same_codes.map(skipped).fillna(0).to_numpy(dtype=int)
+            position = same_codes.groupby(same_codes).cumcount().to_numpy()
+            keep[same] = position + seen >= last_counts[same].to_numpy()
+
+            for code, count in same_codes.value_counts().items():
+                skipped[code] = min(
+                    skipped.get(code, 0) + count, states[code]["last_count"]
+                )
+
+        return ticks.loc[keep]
+
+    def _advance(self, ticks: pd.DataFrame, pending: dict) -> None:
+        """
+        Move the watermarks past new ticks.
+        """
+        times = pd.Series(ticks.index, index=ticks[self.code_column].to_numpy())
+        last = times.groupby(level=0, sort=False).max()
+        at_last = times[times.to_numpy() == last.reindex(times.index).to_numpy()]
+
+        for code, last_count in at_last.groupby(level=0, sort=False).size().items():
+            last_time = last[code]
+            state = pending.get(code)
+            if state is not None and state["last_time"] == last_time:
+                last_count += state["last_count"]
+
+            pending[code] = {
+                "last_time": last_time,
+                "last_count": int(last_count),
+                "open_bar": state.get("open_bar") if state else None,
+            }
+
+    def _open_bars(self, states: dict) -> pd.DataFrame:
+        """
+        The stored open bars as a (code, time) indexed frame.
+        """
+        open_bars = {
+            (code, state["open_bar"]["time"]): state["open_bar"]
+            for code, state in states.items()
+            if state.get("open_bar")
+        }
+        if not open_bars:
+            return None
+
+        return pd.DataFrame(
+            [[bar[c] for c in OHLC_COLUMNS] for bar in open_bars.values()],
+            index=pd.MultiIndex.from_tuples(
+                list(open_bars), names=["code", "time"]
+            ),
+            columns=OHLC_COLUMNS,
+        )
+
+    # ------------------------------------------
+    # Cycle
+    # ------------------------------------------
+    def fetch(self, cursor, now=None) -> pd.DataFrame:
+        """
+        Read the new ticks of the day and fold them into the open bars.
+
+        Returns:
+            pd.DataFrame: (code, time) indexed OHLC bars touched by the new
+            ticks and the open bar of every other code
+        """
+        day = (market_now() if now is None else pd.Timestamp(now)).normalize()
+        states = {
+            code: state for code, state in self.codes.items()
+            if state["last_time"] >= day
+        }
+        pending = copy.deepcopy(states)
+        skipped = {}
+        new_bars = None
+        self.rows = 0
+
+        for chunk in iter_frames(
+            cursor, self.sql, {"since": self.since(day)}, columns=self.columns
+        ):
+            if self.prepare is not None:
+                chunk = self.prepare(chunk)
+
+            chunk = self._new_ticks(chunk, states, skipped)
+            if chunk.empty:
+                continue
+            self.rows += len(chunk)
+            self._advance(chunk, pending)
+
+            if self.calendar is not None:
+                chunk = self.calendar.session_frame(chunk)
+            new_bars = merge_bars(new_bars, resample_ticks(
+                chunk, self.freq,
+                code_column=self.code_column,
+                value_column=self.value_column,
+                calendar=self.calendar,
+            ))
+
+        if new_bars is None:
+            new_bars = resample_ticks(pd.DataFrame(), self.freq)
+
+        bars = merge_bars(self._open_bars(states), new_bars).sort_index()
+
+        # The last bar of every code is the next open bar
+        last_bars = bars.groupby(level="code").tail(1)
+        for (code, time), values in zip(
+            last_bars.index, last_bars[OHLC_COLUMNS].to_numpy(dtype=float)
+        ):
+            pending[code]["open_bar"] = {
+                "time": time, **dict(zip(OHLC_COLUMNS, values.tolist()))
+            }
+
+        self.pending = pending
+        return bars
+
+    def commit(self) -> None:
+        """
+        Keep the state of the last fetch (its bars are stored) and save it.
+        """
+        if self.pending is None:
+            return
+        self.codes = self.pending
+        self.pending = None
+        self.save()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Last Bar Cache
+--------------
+In-memory "latest stored bar per ticker" for one FILL_OHLCV* table.
+
+The cache is warmed once at startup with a single window-function query and
+is then kept current from the bars this process writes itself (through
+``BarSink``). It replaces the per-ticker
+``SELECT * ... ORDER BY BARTIMESTAMP DESC`` + ``fetchone()`` lookups.
+
+Each loop script owns a disjoint set of tickers in its table, so no other
+process moves these bars behind the cache's back.
+
+Author: Ahmad Elsayed
+"""
+
+from bar_sink import INSERT_COLUMNS
+
+
+# Row layout matches "SELECT *" on FILL_OHLCV*, so last_row[5] is VOLUME
+# and last_row[6] is BARTIMESTAMP, as the scripts already expect
+VOLUME = INSERT_COLUMNS.index("VOLUME")
+BARTIMESTAMP = INSERT_COLUMNS.index("BARTIMESTAMP")
+
+
+# ==================================================
+# Last Bar Cache
+# ==================================================
+class LastBarCache:
+    """
+    Latest bar per ticker of one bar table.
+    """
+
+    def __init__(self, table: str):
+        """
+        Parameters
+        ----------
+        table : str
+            Bar table (e.g. "STOCK.FILL_OHLCV")
+        """
+        self.table = table
+        self.bars = {}
+
+    def warm(self, connection, tickers: list = None) -> None:
+        """
+        Load the latest bar of every ticker (or of the given tickers only)
+        with one query.
+        """
+        ticker_filter = ""
+        params = []
+        if tickers:
+            ticker_filter = "WHERE TICKER IN ({})".format(
+                ",".join(f":{i + 1}" for i in range(len(tickers)))
+            )
+            params = list(tickers)
+
+        sql = f"""
+            SELECT {", ".join(INSERT_COLUMNS)}
+            FROM (
+                SELECT
+                    T.*,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY TICKER
+                        ORDER BY BARTIMESTAMP DESC
+                    ) AS RN
+                FROM {self.table} T
+                {ticker_filter}
+            )
+            WHERE RN = 1
+        """
+
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        self.bars = {row[0]: list(row) for row in cursor.fetchall()}
+        cursor.close()
+
+        print(f"{self.table}: last bars cached for {len(self.bars)} tickers")
+
+    def get(self, ticker: str):
+        """
+        Latest stored bar of a ticker.
+
+        Returns:
+            tuple | None: row in "SELECT *" column order, None if no bar
+        """
+        row = self.bars.get(ticker)
+        return tuple(row) if row else None
+
+    # ------------------------------------------
+    # Write-through from BarSink
+    # ------------------------------------------
+    def record_insert(self, row: list) -> None:
+        """
+        Track an inserted bar (row in INSERT_COLUMNS order).
+        """
+        current = self.bars.get(row[0])
+        if current is None or row[BARTIMESTAMP] >= current[BARTIMESTAMP]:
+            self.bars[row[0]] = list(row)
+
+    def record_update(self, ticker: str, timestamp, columns: dict) -> None:
+        """
+        Track an update of an existing bar; only the latest bar is kept.
+        """
+        current = self.bars.get(ticker)
+        if current is None or current[BARTIMESTAMP] != timestamp:
+            return
+
+        for column, value in columns.items():
+            current[INSERT_COLUMNS.index(column)] = value
+
+    def record_delete(self, ticker: str, timestamp) -> None:
+        """
+        Track a deleted bar; the ticker's entry is dropped when it was the
+        cached latest bar (deletes are written first, so the bars of the
+        same batch take its place).
+        """
+        current = self.bars.get(ticker)
+        if current is not None and current[BARTIMESTAMP] == timestamp:
+            del self.bars[ticker]
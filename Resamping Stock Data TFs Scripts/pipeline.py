@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline
+--------
+Small thread pipeline for the resampling loops: stages run in their own
+threads and hand work to each other through bounded queues, so the next
+fetch overlaps the current compute and the previous write.
+
+    - Backpressure: ``put`` blocks while the downstream queue is full, so a
+      slow writer throttles the fetcher instead of piling up memory.
+    - Clean shutdown: ``stop`` (also on SIGINT / SIGTERM) tells the source
+      stage to finish; every stage drains its queue and forwards ``STOP``.
+    - A stage that crashes stops the whole pipeline; the process exits and
+      its supervisor restarts it from the saved watermarks.
+
+Author: Ahmad Elsayed
+"""
+
+import signal
+import threading
+import traceback
+from queue import Empty, Full, Queue
+
+
+# End-of-stream marker forwarded from stage to stage
+STOP = object()
+
+# Seconds between checks of the stop / failure flags while blocked
+POLL_INTERVAL = 0.5
+
+
+# ==================================================
+# Pipeline
+# ==================================================
+class Pipeline:
+    """
+    Threads connected by bounded queues.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stop_event = threading.Event()
+        self.failed = threading.Event()
+        self.threads = []
+
+    # ------------------------------------------
+    # Wiring
+    # ------------------------------------------
+    @staticmethod
+    def queue(maxsize: int) -> Queue:
+        """
+        Bounded hand-over queue between two stages.
+        """
+        return Queue(maxsize=maxsize)
+
+    def stage(self, name: str, target, *args) -> None:
+        """
+        Register a stage; ``target(*args)`` runs in its own thread.
+        """
+        thread = threading.Thread(
+            target=self._run_stage,
+            args=(name, target, args),
+            name=f"{self.name}-{name}",
+            daemon=True,
+        )
+        self.threads.append(thread)
+
+    def _run_stage(self, name: str, target, args) -> None:
+        try:
+            target(*args)
+        except Exception:
+            print(f"[{self.name}] stage {name} crashed:")
+            traceback.print_exc()
+            self.failed.set()
+            self.stop_event.set()
+
+    # ------------------------------------------
+    # Hand-over
+    # ------------------------------------------
+    def put(self, out_queue: Queue, item) -> bool:
+        """
+        Block until ``item`` fits in the queue (backpressure).
+
+        Returns:
+            bool: False if the pipeline failed meanwhile (item dropped)
+        """
+        while not self.failed.is_set():
+            try:
+                out_queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except Full:
+                continue
+        return False
+
+    def get(self, in_queue: Queue):
+        """
+        Next item of a queue; ``STOP`` once the pipeline failed.
+        """
+        while not self.failed.is_set():
+            try:
+                return in_queue.get(timeout=POLL_INTERVAL)
+            except Empty:
+                continue
+        return STOP
+
+    def wait(self, seconds: float) -> bool:
+        """
+        Sleep between source cycles.
+
+        Returns:
+            bool: True if a stop was requested meanwhile
+        """
+        return self.stop_event.wait(max(0.0, seconds))
+
+    # ------------------------------------------
+    # Lifecycle
+    # ------------------------------------------
+    def stop(self, *_) -> None:
+        """
+        Ask the source stage to finish; queued work is still written.
+        """
+        if not self.stop_event.is_set():
+            print(f"[{self.name}] stopping after the queued cycles ...")
+        self.stop_event.set()
+
+    def run(self) -> None:
+        """
+        Start every stage and block until all of them have finished.
+        """
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+
+        for thread in self.threads:
+            thread.start()
+
+        # Short joins keep the main thread responsive to signals
+        for thread in self.threads:
+            while thread.is_alive():
+                thread.join(timeout=POLL_INTERVAL)
+
+        if self.failed.is_set():
+            raise SystemExit(f"{self.name}: pipeline stage failed")
@@ -0,0 +1,663 @@
+# -*- coding: utf-8 -*-
+"""
+Resampling Benchmark
+--------------------
+Replays a synthetic EGX-like session through the bar paths of the loops,
+against a local SQLite stand-in database, and reports their throughput.
+
+    1min / 5min   STOCK.TRADES → OHLCV + VWAP bars (streaming builder,
+                  watermarks, upsert sink), as the 1-Min / 5-Min loops
+    sector        new CASE_SECTOR_INDEX ticks → 5-minute OHLC bars (tick
+                  watermarks, open bars in memory), as the Sector loop
+    ewi           constituent 5-minute bars → equal weighted indices with
+                  ``live_update_ewi_last`` of the EWI script
+
+Every cycle first appends the next ``--cycle-seconds`` of synthetic market
+data (untimed), then runs one loop cycle (timed). Each path runs in a fresh
+process so its peak memory is its own. Per path the report holds rows in
+(trades, ticks or constituent bars) and bars out per second, p50 / p99 /
+max cycle latency and peak RSS, saved as JSON for comparison across
+commits:
+
+    python resampling_benchmark.py --trades-per-second 50 --symbols 220
+    python resampling_benchmark.py --paths 1min ewi --compare before.json
+
+Author: Ahmad Elsayed
+"""
+
+import argparse
+import ast
+import json
+import multiprocessing
+import platform
+import resource
+import sqlite3
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bar_engine import BAR_COLUMNS
+from bar_sink import BarSink, stored
+from dirty_bars import stock_bars
+from index_ticks import IndexTickStream
+from last_bar_cache import LastBarCache
+from sharded_bars import default_workers
+from trade_stream import (
+    TRADES_SQL,
+    StreamingBarBuilder,
+    iter_frames,
+    trades_since,
+)
+from trade_watermark import TradeWatermarkStore
+from trading_calendar import SESSION_OPEN, TradingCalendar
+
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = SCRIPT_DIR / "benchmark_results"
+
+PATHS = ("1min", "5min", "sector", "ewi")
+
+# A regular Sunday session; the calendar is built for it (no holidays)
+SESSION_DAY = pd.Timestamp("2026-01-04")
+
+# Synthetic market defaults
+SYMBOLS = 220
+TRADES_PER_SECOND = 20
+SESSION_MINUTES = 270
+CYCLE_SECONDS = 30
+SECTOR_TICK_SECONDS = 5
+
+# Equal weighted indices: name → constituent count (most active symbols)
+EWI_INDICES = {"EGX30LASTEWI": 30, "EGX70LASTEWI": 70, "EGX100LASTEWI": 100}
+EWI_PRICE_COLUMNS = ["OPEN", "HIGH", "LOW", "CLOSE", "VWAP"]
+
+SECTORS = [
+    "Banks", "Basic Resources", "Building Materials",
+    "Contracting & Construction Engineering", "Education Services",
+    "Energy & Support Services", "Food, Beverages and Tobacco",
+    "Health Care & Pharmaceuticals",
+    "Industrial Goods, Services and Automobiles",
+    "IT, Media & Communication Services", "Non-bank financial services",
+    "Paper & Packaging", "Real Estate", "Shipping & Transportation Services",
+    "Textile & Durables", "Trade & Distributors", "Travel & Leisure",
+]
+
+# The Sector loop's tick query
+SECTORS_SQL = """
+    SELECT
+        REPLACE(SECTOR_DESC,' ','') AS SECTOR_CODE,
+        INDEXTIME,
+        INDEXVALUE
+    FROM CASE_SECTOR_INDEX
+    WHERE INDEXTIME >= :since
+    ORDER BY INDEXTIME
+"""
+
+BAR_TABLE_DDL = """
+    CREATE TABLE {table} (
+        TICKER TEXT, OPEN REAL, HIGH REAL, LOW REAL, CLOSE REAL,
+        VOLUME REAL, BARTIMESTAMP TIMESTAMP, ASSET INTEGER, VWAP REAL,
+        UNIQUE (TICKER, BARTIMESTAMP)
+    )
+"""
+
+
+# ==================================================
+# Synthetic Market
+# ==================================================
+class SyntheticMarket:
+    """
+    Reproducible EGX-like trades and sector index ticks.
+
+    Trading activity is skewed (a few symbols carry most trades), prices
+    follow per-symbol random walks on a 0.01 tick and volumes are
+    log-normal.
+    """
+
+    def __init__(
+        self,
+        symbols: int = SYMBOLS,
+        trades_per_second: float = TRADES_PER_SECOND,
+        seed: int = 0
+    ):
+        self.rng = np.random.default_rng(seed)
+        self.symbols = np.array([f"S{i:03d}.CA" for i in range(symbols)])
+        self.trades_per_second = trades_per_second
+
+        weights = 1.0 / np.arange(1, symbols + 1) ** 0.8
+        self.weights = weights / weights.sum()
+        self.log_prices = np.log(self.rng.uniform(1.0, 100.0, symbols))
+        self.sector_values = self.rng.uniform(1000.0, 5000.0, len(SECTORS))
+
+    def trades(self, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        """
+        Trades in [start, end): columns code, time, price, volume.
+        """
+        seconds = (end - start).total_seconds()
+        count = self.rng.poisson(self.trades_per_second * seconds)
+
+        ids = self.rng.choice(len(self.symbols), count, p=self.weights)
+        offsets = np.sort(self.rng.uniform(0.0, seconds, count))
+        returns = pd.Series(self.rng.normal(0.0, 0.002, count))
+
+        walk = returns.groupby(ids).cumsum().to_numpy()
+        prices = np.round(np.exp(self.log_prices[ids] + walk), 2)
+        np.add.at(self.log_prices, ids, returns.to_numpy())
+
+        return pd.DataFrame({
+            "code": self.symbols[ids],
+            "time": start + pd.to_timedelta(offsets, unit="s"),
+            "price": np.maximum(prices, 0.01),
+            "volume": np.maximum(
+                np.round(self.rng.lognormal(6.0, 1.2, count)), 1.0
+            ),
+        })
+
+    def sector_ticks(
+        self,
+        start: pd.Timestamp,
+        end: pd.Timestamp
+    ) -> pd.DataFrame:
+        """
+        One tick per sector every SECTOR_TICK_SECONDS in [start, end).
+        """
+        times = pd.date_range(
+            start, end, freq=f"{SECTOR_TICK_SECONDS}s", inclusive="left"
+        )
+        steps = self.rng.normal(0.0, 0.0005, (len(times), len(SECTORS)))
+        values = self.sector_values * np.exp(np.cumsum(steps, axis=0))
+        if len(times):
+            self.sector_values = values[-1]
+
+        return pd.DataFrame({
+            "SECTOR_DESC": np.tile(SECTORS, len(times)),
+            "INDEXTIME": np.repeat(times.to_pydatetime(), len(SECTORS)),
+            "INDEXVALUE": values.ravel(),
+        })
+
+
+# ==================================================
+# Stand-in Database
+# ==================================================
+def open_database(folder: Path, symbols) -> sqlite3.Connection:
+    """
+    SQLite database with the tables the benchmarked paths read and write
+    (the STOCK schema is an attached database).
+    """
+    path = Path(folder) / "bench.db"
+    connection = sqlite3.connect(
+        path, detect_types=sqlite3.PARSE_DECLTYPES
+    )
+    connection.execute(
+        f"ATTACH DATABASE '{Path(folder) / 'bench_stock.db'}' AS STOCK"
+    )
+
+    connection.executescript(f"""
+        CREATE TABLE STOCK.SYMBOLINFO (SYMBOL_CODE INTEGER, REUTERS TEXT);
+        CREATE TABLE STOCK.TRADES (
+            SYMBOL_CODE INTEGER, EXEC_TIME TIMESTAMP,
+            TRADE_PRICE REAL, VOLUME_TRADED REAL
+        );
+        CREATE INDEX STOCK.TRADES_TIME ON TRADES (EXEC_TIME);
+        CREATE TABLE CASE_SECTOR_INDEX (
+            SECTOR_DESC TEXT, INDEXTIME TIMESTAMP, INDEXVALUE REAL
+        );
+        {BAR_TABLE_DDL.format(table="STOCK.FILL_OHLCV")};
+        {BAR_TABLE_DDL.format(table="STOCK.FILL_OHLCV_1MIN")};
+    """)
+    connection.executemany(
+        "INSERT INTO STOCK.SYMBOLINFO VALUES (?, ?)",
+        list(enumerate(symbols)),
+    )
+    connection.commit()
+    return connection
+
+
+def insert_trades(connection, trades: pd.DataFrame, symbol_codes: dict):
+    """
+    Append synthetic trades to STOCK.TRADES.
+    """
+    connection.executemany(
+        "INSERT INTO STOCK.TRADES VALUES (?, ?, ?, ?)",
+        zip(
+            trades["code"].map(symbol_codes).tolist(),
+            trades["time"].dt.to_pydatetime().tolist(),
+            trades["price"].tolist(),
+            trades["volume"].tolist(),
+        ),
+    )
+    connection.commit()
+
+
+def script_functions(filename: str) -> dict:
+    """
+    The functions of a loop script, without running its loop.
+
+    The EWI and Sector scripts run their loop at import time, so only their
+    imports (except the Oracle pool) and definitions are executed.
+    """
+    path = SCRIPT_DIR / filename
+    tree = ast.parse(path.read_text(encoding="utf-8"), filename=str(path))
+
+    def keep(node):
+        if isinstance(node, ast.ImportFrom):
+            return node.module != "db_pool"
+        return isinstance(
+            node, (ast.Import, ast.FunctionDef, ast.ClassDef)
+        )
+
+    module = ast.Module(body=[n for n in tree.body if keep(n)], type_ignores=[])
+    namespace = {"__name__": path.stem}
+    exec(compile(module, str(path), "exec"), namespace)
+    return namespace
+
+
+# ==================================================
+# Benchmarked Paths (one cycle each)
+# ==================================================
+class TradeBarPath:
+    """
+    A 1-Min / 5-Min loop cycle: stream new trades, build bars, merge them.
+    """
+
+    def __init__(
+        self, connection, freq, table, calendar, workers, folder, session_day
+    ):
+        self.connection = connection
+        self.session_day = session_day
+        self.freq = freq
+        self.table = table
+        self.calendar = calendar
+        self.workers = workers
+        self.watermarks = TradeWatermarkStore(
+            f"bench_{freq}", freq, state_dir=folder
+        )
+
+    def cycle(self) -> tuple:
+        watermarks = self.watermarks
+        cursor = self.connection.cursor()
+
+        builder = StreamingBarBuilder(
+            self.freq,
+            watermarks.vwap_base,
+            workers=self.workers,
+            calendar=self.calendar,
+            track_minutes=True,
+        )
+        for chunk in iter_frames(
+            cursor, TRADES_SQL, {"since": trades_since(
+                watermarks.fetch_since(), self.calendar, now=self.session_day
+            )}
+        ):
+            builder.feed(watermarks.filter_new(chunk))
+
+        bars_df = watermarks.merge_open_bars(builder.result())
+        bar_sink = BarSink(self.table, mode="upsert")
+        bar_sink.insert_bars(stock_bars(bars_df), asset=1)
+
+        counts = bar_sink.flush(self.connection)
+        if stored(counts):
+            watermarks.advance_bars(bars_df, builder.trade_stats)
+            watermarks.save()
+
+        return builder.rows, counts["upserted"]
+
+
+class SectorPath:
+    """
+    A Sector loop cycle: fold the new CASE_SECTOR_INDEX ticks into 5-minute
+    bars, insert new / update the last stored bar per sector.
+    """
+
+    def __init__(self, connection, calendar, folder, session_day):
+        self.connection = connection
+        self.session_day = session_day
+        self.ticks = IndexTickStream(
+            "bench_sector",
+            SECTORS_SQL,
+            "5Min",
+            columns=["SECTOR_CODE", "time", "INDEXVALUE"],
+            code_column="SECTOR_CODE",
+            value_column="INDEXVALUE",
+            prepare=script_functions(
+                "Sector-Indicies-Resampling.py"
+            )["normalize_sector_codes"],
+            calendar=calendar,
+            state_dir=folder,
+        )
+        self.last_bars = LastBarCache("STOCK.FILL_OHLCV")
+
+    def cycle(self) -> tuple:
+        sector_bars = self.ticks.fetch(
+            self.connection.cursor(), now=self.session_day
+        )
+
+        bar_sink = BarSink("STOCK.FILL_OHLCV", cache=self.last_bars)
+        for sector, ohlc_df in sector_bars.groupby(level="code", sort=False):
+            ohlc_df = ohlc_df.droplevel("code")
+            last_record = self.last_bars.get(sector.upper())
+
+            if last_record:
+                to_insert = ohlc_df[ohlc_df.index > last_record[6]]
+                to_update = ohlc_df[ohlc_df.index == last_record[6]]
+                if len(to_update):
+                    bar_sink.update(
+                        sector.upper(),
+                        to_update.index[0],
+                        OPEN=to_update["open"].values[0],
+                        HIGH=to_update["high"].values[0],
+                        LOW=to_update["low"].values[0],
+                        CLOSE=to_update["close"].values[0],
+                        VOLUME=0,
+                    )
+            else:
+                to_insert = ohlc_df
+
+            for timestamp, row in to_insert.iterrows():
+                bar_sink.insert(
+                    sector.upper(), timestamp, row["open"], row["high"],
+                    row["low"], row["close"], 0, 0, 0
+                )
+
+        counts = bar_sink.flush(self.connection)
+        if stored(counts):
+            self.ticks.commit()
+        return self.ticks.rows, counts["inserted"] + counts["updated"]
+
+
+class EwiPath:
+    """
+    An EWI loop cycle: the constituent bars since the earliest open EWI bar
+    (``EwiPrices``), ``live_update_ewi_last`` once for the indices sharing a
+    last stored bar (one price panel), then insert new / update the last
+    bar of each.
+    """
+
+    def __init__(self, connection, symbols, session_open):
+        self.connection = connection
+        functions = script_functions("EWI Last Indicies.py")
+        self.live_update_ewi_last = functions["live_update_ewi_last"]
+        self.prices = functions["EwiPrices"]()
+        tickers = [symbol.replace(".CA", "") for symbol in symbols]
+        self.indices = {
+            name: tickers[:size] for name, size in EWI_INDICES.items()
+        }
+        self.last_times = {name: session_open for name in EWI_INDICES}
+
+    def cycle(self) -> tuple:
+        bar_sink = BarSink("STOCK.FILL_OHLCV")
+        rows_in = 0
+
+        # EWIs sharing a last bar time share one price panel
+        panels = {}
+        for name, constituents in self.indices.items():
+            panels.setdefault(self.last_times[name], {})[name] = constituents
+
+        window = self.prices.update(
+            self.connection,
+            set().union(*self.indices.values()),
+            min(panels).to_pydatetime(),
+        )
+
+        for last_time, members in panels.items():
+            ewi_bars = self.live_update_ewi_last(
+                members,
+                window[window.index >= last_time],
+                self.prices.prior(window, last_time),
+                EWI_PRICE_COLUMNS,
+            )
+            for name, df_ewi in ewi_bars.items():
+                if df_ewi.empty:
+                    continue
+
+                rows_in += len(df_ewi) * len(members[name])
+                for timestamp, row in df_ewi.iterrows():
+                    if timestamp == last_time:
+                        bar_sink.update(name, timestamp, VOLUME=row["VOLUME"])
+                    elif timestamp > last_time:
+                        bar_sink.insert(
+                            name, timestamp, row["OPEN"], row["HIGH"],
+                            row["LOW"], row["CLOSE"], row["VOLUME"], 0,
+                            row["VWAP"]
+                        )
+                self.last_times[name] = max(last_time, df_ewi.index.max())
+
+        counts = bar_sink.flush(self.connection)
+        return rows_in, counts["inserted"] + counts["updated"]
+
+
+# ==================================================
+# Runner
+# ==================================================
+def run_path(path: str, config: dict) -> dict:
+    """
+    Replay the session through one path (in its own process).
+
+    Returns:
+        dict: throughput, latency and memory figures of the path
+    """
+    started_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    open_time = pd.Timestamp(f"{SESSION_DAY:%Y-%m-%d} {SESSION_OPEN}")
+    close_time = open_time + pd.Timedelta(minutes=config["session_minutes"])
+    calendar = TradingCalendar(
+        close_time=f"{close_time:%H:%M}", open_time=SESSION_OPEN
+    )
+    step = pd.Timedelta(seconds=config["cycle_seconds"])
+
+    market = SyntheticMarket(
+        config["symbols"], config["trades_per_second"], config["seed"]
+    )
+    symbol_codes = {symbol: i for i, symbol in enumerate(market.symbols)}
+
+    with tempfile.TemporaryDirectory() as folder:
+        connection = open_database(folder, market.symbols)
+
+        if path in ("1min", "5min"):
+            freq, table = {
+                "1min": ("1Min", "STOCK.FILL_OHLCV_1MIN"),
+                "5min": ("5Min", "STOCK.FILL_OHLCV"),
+            }[path]
+            runner = TradeBarPath(
+                connection, freq, table, calendar, config["workers"], folder,
+                open_time,
+            )
+        elif path == "sector":
+            runner = SectorPath(connection, calendar, folder, open_time)
+        else:
+            runner = EwiPath(connection, market.symbols, open_time)
+            constituent_bars = StreamingBarBuilder("5Min", calendar=calendar)
+
+        latencies = []
+        rows_in = bars_out = 0
+        error = None
+
+        cycle_start = open_time
+        while cycle_start < close_time and (
+            config["cycles"] is None or len(latencies) < config["cycles"]
+        ):
+            cycle_end = min(cycle_start + step, close_time)
+
+            # Market data of the cycle (untimed)
+            if path == "sector":
+                ticks = market.sector_ticks(cycle_start, cycle_end)
+                ticks.to_sql(
+                    "CASE_SECTOR_INDEX", connection,
+                    if_exists="append", index=False
+                )
+            else:
+                trades = market.trades(cycle_start, cycle_end)
+                if path == "ewi":
+                    # Constituent bars as the 5-Min loop stores them
+                    constituent_bars.feed(trades.set_index("time"))
+                    bars = constituent_bars.result()
+                    touched = calendar.floor([cycle_start], "5Min")[0]
+                    bars = bars.loc[
+                        bars.index.get_level_values("time") >= touched
+                    ]
+                    bar_sink = BarSink("STOCK.FILL_OHLCV", mode="upsert")
+                    bars.index = bars.index.set_levels(
+                        bars.index.levels[0].str.replace(".CA", ""),
+                        level="code",
+                    )
+                    bar_sink.insert_bars(bars[BAR_COLUMNS], asset=1)
+                    bar_sink.flush(connection)
+                else:
+                    insert_trades(connection, trades, symbol_codes)
+            cycle_start = cycle_end
+
+            started = time.perf_counter()
+            try:
+                cycle_rows, cycle_bars = runner.cycle()
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+                break
+            latencies.append(time.perf_counter() - started)
+            rows_in += cycle_rows
+            bars_out += cycle_bars
+
+        connection.close()
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    seconds = float(np.sum(latencies)) if latencies else 0.0
+    latency_ms = np.array(latencies) * 1000.0 if latencies else np.zeros(1)
+
+    return {
+        "cycles": len(latencies),
+        "rows_in": rows_in,
+        "bars_out": bars_out,
+        "seconds": round(seconds, 4),
+        "rows_in_per_sec": round(rows_in / seconds, 1) if seconds else None,
+        "bars_per_sec": round(bars_out / seconds, 1) if seconds else None,
+        "latency_ms": {
+            "p50": round(float(np.percentile(latency_ms, 50)), 3),
+            "p99": round(float(np.percentile(latency_ms, 99)), 3),
+            "max": round(float(latency_ms.max()), 3),
+        },
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(peak_rss / 1024.0, 1),
+        "peak_rss_growth_mb": round((peak_rss - started_rss) / 1024.0, 1),
+        "error": error,
+    }
+
+
+def git_commit() -> str:
+    """
+    Current commit of the repository, "unknown" outside a checkout.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=SCRIPT_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmark(paths, config: dict) -> dict:
+    """
+    Run every path in a fresh process and collect the report.
+    """
+    report = {
+        "commit": git_commit(),
+        "created": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "config": config,
+        "paths": {},
+    }
+
+    context = multiprocessing.get_context("spawn")
+    for path in paths:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run_path, path, config).result()
+        report["paths"][path] = result
+        print_result(path, result)
+
+    return report
+
+
+def print_result(path: str, result: dict, baseline: dict = None) -> None:
+    """
+    One summary line per path (with the change against a baseline).
+    """
+    if result["error"]:
+        print(f"{path:>7}: FAILED after {result['cycles']} cycles "
+              f"({result['error']})")
+        return
+
+    line = (
+        f"{path:>7}: {result['rows_in_per_sec'] or 0:>12,.0f} rows/s "
+        f"{result['bars_per_sec'] or 0:>10,.0f} bars/s  "
+        f"p50 {result['latency_ms']['p50']:8.2f} ms  "
+        f"p99 {result['latency_ms']['p99']:8.2f} ms  "
+        f"peak {result['peak_rss_mb']:7.1f} MB"
+    )
+    if baseline and not baseline.get("error") and baseline["latency_ms"]["p50"]:
+        change = (
+            result["latency_ms"]["p50"] / baseline["latency_ms"]["p50"] - 1.0
+        )
+        line += f"  p50 {change:+.0%} vs {baseline.get('commit', 'baseline')}"
+    print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Synthetic-market benchmark of the resampling paths"
+    )
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=PATHS)
+    parser.add_argument("--symbols", type=int, default=SYMBOLS)
+    parser.add_argument(
+        "--trades-per-second", type=float, default=TRADES_PER_SECOND
+    )
+    parser.add_argument(
+        "--session-minutes", type=int, default=SESSION_MINUTES
+    )
+    parser.add_argument("--cycle-seconds", type=int, default=CYCLE_SECONDS)
+    parser.add_argument(
+        "--cycles", type=int, default=None,
+        help="stop each path after this many cycles (default: whole session)",
+    )
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", type=Path, default=None,
+        help="JSON report (default: benchmark_results/<commit>.json)",
+    )
+    parser.add_argument(
+        "--compare", type=Path, default=None,
+        help="earlier JSON report to compare the p50 latencies with",
+    )
+    args = parser.parse_args()
+
+    bench_config = {
+        "symbols": args.symbols,
+        "trades_per_second": args.trades_per_second,
+        "session_minutes": args.session_minutes,
+        "cycle_seconds": args.cycle_seconds,
+        "cycles": args.cycles,
+        "workers": args.workers,
+        "seed": args.seed,
+    }
+    bench_report = run_benchmark(args.paths, bench_config)
+
+    output = args.output or RESULTS_DIR / f"{bench_report['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(bench_report, indent=2), encoding="utf-8")
+    print(f"Report saved to {output}")
+
+    if args.compare:
+        earlier = json.loads(args.compare.read_text(encoding="utf-8"))
+        print(f"Compared with {earlier['commit']} ({args.compare}):")
+        for name, figures in bench_report["paths"].items():
+            if name in earlier["paths"]:
+                baseline_figures = dict(
+                    earlier["paths"][name], commit=earlier["commit"]
+                )
+                print_result(name, figures, baseline_figures)
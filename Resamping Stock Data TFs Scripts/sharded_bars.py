@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Sharded Bars
+------------
+Symbol-sharded bar building on a pool of worker processes.
+
+Bars of different symbols never interact, so a large trade batch is split
+into per-worker symbol shards (balanced by trade count), every worker runs
+``resample_trades`` on its shard and hands back compact NumPy arrays, and
+the calling process (the single DB writer) stitches them into one
+(code, time) indexed frame.
+
+Small batches are built serially: below ``PARALLEL_MIN_ROWS`` the pickling
+round trip costs more than the vectorized build itself.
+
+Workers are started by a fork server (spawned where there is none, e.g.
+Windows), never forked from the loop process: that process runs the
+pipeline threads and holds the cx_Oracle session pool, neither of which
+survives a fork. The worker function only receives NumPy arrays, the VWAP
+totals and the calendar, never a connection.
+
+Scripts using a pool must keep their loop under
+``if __name__ == "__main__":`` so spawned workers can import them safely.
+
+Author: Ahmad Elsayed
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bar_engine import BAR_COLUMNS, resample_trades
+
+
+# Batches smaller than this are built in-process
+PARALLEL_MIN_ROWS = 200000
+
+# How worker processes are started (never "fork", see above)
+START_METHOD = (
+    "forkserver"
+    if "forkserver" in multiprocessing.get_all_start_methods()
+    else "spawn"
+)
+
+# One pool per process, reused across cycles
+_executor = None
+_executor_workers = 0
+
+
+# ==================================================
+# Worker Pool
+# ==================================================
+def default_workers() -> int:
+    """
+    Worker count from BAR_WORKERS, else every core but one.
+    """
+    configured = os.environ.get("BAR_WORKERS")
+    if configured:
+        return max(1, int(configured))
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def get_executor(workers: int) -> ProcessPoolExecutor:
+    """
+    The shared process pool, (re)created when the worker count changes.
+    """
+    global _executor, _executor_workers
+
+    if _executor is None or _executor_workers != workers:
+        shutdown_executor()
+        context = multiprocessing.get_context(START_METHOD)
+        if START_METHOD == "forkserver":
+            # Workers fork from a server that already imported pandas
+            context.set_forkserver_preload(["sharded_bars"])
+        _executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=context
+        )
+        _executor_workers = workers
+
+    return _executor
+
+
+def shutdown_executor() -> None:
+    """
+    Stop the worker processes (end of run).
+    """
+    global _executor, _executor_workers
+
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        _executor_workers = 0
+
+
+# ==================================================
+# Sharding
+# ==================================================
+def shard_symbols(code_ids: np.ndarray, shards: int) -> list:
+    """
+    Split symbols into ``shards`` groups of similar trade count
+    (largest symbols first, each to the lightest shard).
+
+    Returns:
+        list: one array of symbol ids per non-empty shard
+    """
+    counts = np.bincount(code_ids)
+    loads = np.zeros(shards)
+    members = [[] for _ in range(shards)]
+
+    for code_id in np.argsort(counts)[::-1]:
+        if counts[code_id] == 0:
+            break
+        target = int(np.argmin(loads))
+        members[target].append(code_id)
+        loads[target] += counts[code_id]
+
+    return [np.array(ids) for ids in members if ids]
+
+
+def _build_shard(freq, codes, times, prices, volumes, vwap_base, calendar):
+    """
+    Worker: bars of one symbol shard as compact arrays.
+
+    Returns:
+        tuple: (codes, bucket times, float matrix in BAR_COLUMNS order)
+    """
+    trades_df = pd.DataFrame(
+        {"code": codes, "price": prices, "volume": volumes},
+        index=pd.DatetimeIndex(times, name="time"),
+    )
+    bars = resample_trades(
+        trades_df, freq, vwap_base=vwap_base, calendar=calendar
+    )
+
+    return (
+        bars.index.get_level_values("code").to_numpy(),
+        bars.index.get_level_values("time").to_numpy(),
+        bars[BAR_COLUMNS].to_numpy(dtype=np.float64),
+    )
+
+
+# ==================================================
+# Trades → OHLCV + VWAP (sharded)
+# ==================================================
+def resample_trades_sharded(
+    trades_df: pd.DataFrame,
+    freq: str,
+    vwap_base: dict = None,
+    workers: int = None,
+    min_rows: int = PARALLEL_MIN_ROWS,
+    calendar=None
+) -> pd.DataFrame:
+    """
+    ``resample_trades`` with the symbols spread over worker processes.
+
+    Parameters
+    ----------
+    trades_df : pd.DataFrame
+        Time-indexed trades with ``code``, ``price`` and ``volume`` columns
+    freq : str
+        Pandas bar frequency
+    vwap_base : dict, optional
+        Per-symbol (price x volume, volume) totals before these trades
+    workers : int, optional
+        Worker processes (default: ``default_workers()``); 1 means serial
+    min_rows : int
+        Batches smaller than this are built serially
+    calendar : TradingCalendar, optional
+        Anchor buckets to the session open
+
+    Returns:
+        pd.DataFrame: (code, time) indexed bars with BAR_COLUMNS
+    """
+    workers = default_workers() if workers is None else workers
+
+    if workers <= 1 or len(trades_df) < min_rows:
+        return resample_trades(
+            trades_df, freq, vwap_base=vwap_base, calendar=calendar
+        )
+
+    codes = trades_df["code"].to_numpy()
+    code_ids, code_values = pd.factorize(codes)
+    shards = shard_symbols(code_ids, workers)
+
+    if len(shards) <= 1:
+        return resample_trades(
+            trades_df, freq, vwap_base=vwap_base, calendar=calendar
+        )
+
+    times = trades_df.index.to_numpy()
+    prices = trades_df["price"].to_numpy(dtype=np.float64)
+    volumes = trades_df["volume"].to_numpy(dtype=np.float64)
+    vwap_base = vwap_base or {}
+
+    executor = get_executor(workers)
+    futures = []
+    for shard in shards:
+        rows = np.isin(code_ids, shard)
+        shard_base = {
+            code: vwap_base[code]
+            for code in code_values[shard] if code in vwap_base
+        }
+        futures.append(executor.submit(
+            _build_shard, freq, codes[rows], times[rows],
+            prices[rows], volumes[rows], shard_base, calendar
+        ))
+
+    parts = [future.result() for future in futures]
+
+    index = pd.MultiIndex.from_arrays(
+        [
+            np.concatenate([part[0] for part in parts]),
+            pd.DatetimeIndex(np.concatenate([part[1] for part in parts])),
+        ],
+        names=["code", "time"],
+    )
+    bars = pd.DataFrame(
+        np.vstack([part[2] for part in parts]),
+        index=index,
+        columns=BAR_COLUMNS,
+    )
+    return bars.sort_index()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures of the resampling tests.
+
+The scripts are flat modules next to this folder, imported as the loops
+import them.
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+SCRIPT_DIR = Path(__file__).resolve().parents[1]
+if str(SCRIPT_DIR) not in sys.path:
+    sys.path.insert(0, str(SCRIPT_DIR))
+
+from resampling_benchmark import insert_trades, open_database  # noqa: E402
+from trading_calendar import TradingCalendar  # noqa: E402
+
+
+# A regular Sunday session (10:00 to 14:30)
+SESSION_DAY = pd.Timestamp("2026-01-04")
+
+SYMBOLS = ["AAA.CA", "BBB.CA", "CCC.CA"]
+
+
+def add_trades(connection, rows) -> None:
+    """
+    (seconds after the SESSION_DAY open, code, price, volume) tuples →
+    STOCK.TRADES.
+    """
+    trades = pd.DataFrame(rows, columns=["seconds", "code", "price", "volume"])
+    trades["time"] = SESSION_DAY + pd.Timedelta("10:00:00") + pd.to_timedelta(
+        trades["seconds"], unit="s"
+    )
+    insert_trades(
+        connection, trades, {code: i for i, code in enumerate(SYMBOLS)}
+    )
+
+
+def trunc(value, unit):
+    """
+    Oracle's ``TRUNC(<timestamp>, 'MI')`` for the SQLite database.
+    """
+    return None if value is None else f"{value[:16]}:00"
+
+
+class BatchErrorCursor(sqlite3.Cursor):
+    """
+    sqlite3 cursor reporting rejected rows as Oracle batch errors
+    (``executemany(..., batcherrors=True)`` / ``getbatcherrors``).
+    """
+
+    def executemany(self, sql, rows, batcherrors=False):
+        self.errors = []
+        for offset, row in enumerate(rows):
+            try:
+                self.execute(sql, row)
+            except sqlite3.DatabaseError as error:
+                if not batcherrors:
+                    raise
+                self.errors.append(
+                    SimpleNamespace(offset=offset, message=str(error))
+                )
+        return self
+
+    def getbatcherrors(self):
+        return getattr(self, "errors", [])
+
+
+class BatchErrorConnection(sqlite3.Connection):
+    def cursor(self, factory=BatchErrorCursor):
+        return super().cursor(factory)
+
+
+def connect(folder, factory=sqlite3.Connection) -> sqlite3.Connection:
+    """
+    Another connection to the database ``open_database`` created in
+    ``folder``.
+    """
+    connection = sqlite3.connect(
+        Path(folder) / "bench.db",
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        factory=factory,
+    )
+    connection.execute(
+        f"ATTACH DATABASE '{Path(folder) / 'bench_stock.db'}' AS STOCK"
+    )
+    connection.create_function("TRUNC", 2, trunc)
+    return connection
+
+
+@pytest.fixture
+def calendar():
+    """
+    Regular weekly sessions, no holidays.
+    """
+    return TradingCalendar()
+
+
+@pytest.fixture
+def trades():
+    """
+    A fixed session of trades: three symbols, shared timestamps and a
+    print at the close.
+    """
+    rng = np.random.default_rng(7)
+    size = 600
+
+    offsets = np.sort(rng.integers(0, 270 * 60, size))
+    # Five trades sharing one EXEC_TIME (positions 298 to 302)
+    offsets[298:303] = offsets[300]
+    times = SESSION_DAY + pd.Timedelta("10:00:00") + pd.to_timedelta(
+        offsets, unit="s"
+    )
+    # And one print at the close
+    times = times.append(pd.DatetimeIndex(
+        [SESSION_DAY + pd.Timedelta("14:30:00")]
+    ))
+
+    frame = pd.DataFrame(
+        {
+            "code": rng.choice(SYMBOLS, size + 1),
+            "price": rng.uniform(10, 12, size + 1).round(2),
+            "volume": rng.integers(1, 500, size + 1).astype(float),
+        },
+        index=pd.DatetimeIndex(times, name="time"),
+    )
+    return frame.sort_index(kind="stable")
+
+
+@pytest.fixture
+def database(tmp_path):
+    """
+    The benchmark's SQLite stand-in database (STOCK.TRADES, the 1-minute
+    and 5-minute bar tables) with SYMBOLS.
+    """
+    open_database(tmp_path, SYMBOLS).close()
+    connection = connect(tmp_path)
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def oracle_like(tmp_path, database):
+    """
+    A second connection to ``database`` whose cursors report batch errors
+    the way cx_Oracle does.
+    """
+    connection = connect(tmp_path, factory=BatchErrorConnection)
+    yield connection
+    connection.close()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+BarAggregator: trade-by-trade bars against resample_trades, closing by
+trade and by clock, and the closed bar feed.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bar_aggregator import BarAggregator, ClosedBarFeed, bars_frame
+from bar_engine import resample_trades
+from conftest import SESSION_DAY
+
+
+T = SESSION_DAY + pd.Timedelta("10:00:00")
+CLOSE = SESSION_DAY + pd.Timedelta("14:30:00")
+
+
+@pytest.mark.parametrize("freq", ["1Min", "5Min", "60Min", "1D"])
+def test_matches_resample_trades(trades, calendar, freq):
+    # A pre-open print is left out like in resample_trades
+    early = pd.DataFrame(
+        {"code": ["AAA.CA"], "price": [99.0], "volume": [1.0]},
+        index=pd.DatetimeIndex([T - pd.Timedelta("5min")], name="time"),
+    )
+    fed = pd.concat([early, trades])
+    aggregator = BarAggregator([freq], calendar=calendar)
+
+    closed = aggregator.update_frame(fed)
+    closed += aggregator.advance(CLOSE + pd.Timedelta("1s"))
+
+    expected = resample_trades(
+        calendar.session_frame(fed), freq, calendar=calendar
+    )
+    got = bars_frame(closed, freq)[expected.columns]
+
+    assert aggregator.open == {}
+    assert got.index.equals(expected.index)
+    np.testing.assert_allclose(got.to_numpy(), expected.to_numpy())
+
+
+def test_closed_by_a_later_trade_or_the_clock(calendar):
+    aggregator = BarAggregator(["1Min", "5Min"], calendar=calendar)
+
+    assert aggregator.update("AAA.CA", T + pd.Timedelta("10s"), 10, 1) == []
+    closed = aggregator.update("AAA.CA", T + pd.Timedelta("70s"), 11, 2)
+    assert [(b["freq"], b["time"], b["volume"]) for b in closed] == [
+        ("1Min", T, 1.0),
+    ]
+
+    # The 10:01 bar ends at 10:02; the 5-minute one at 10:05
+    assert aggregator.advance(T + pd.Timedelta("119s")) == []
+    closed = aggregator.advance(T + pd.Timedelta("2min"))
+    assert [(b["freq"], b["close"]) for b in closed] == [("1Min", 11.0)]
+    assert [b["freq"] for b in aggregator.open_bars()] == ["5Min"]
+
+
+def test_last_bucket_waits_for_the_close_print(calendar):
+    aggregator = BarAggregator(["60Min"], calendar=calendar, grace_seconds=5)
+    aggregator.update("AAA.CA", CLOSE - pd.Timedelta("10min"), 10, 1)
+
+    assert aggregator.advance(CLOSE) == []
+    aggregator.update("AAA.CA", CLOSE, 12, 3)
+    (bar,) = aggregator.advance(CLOSE + pd.Timedelta("6s"))
+
+    # 10:00 → 14:30: the last hourly bucket starts at 14:00
+    assert (bar["time"], bar["close"], bar["volume"]) == (
+        SESSION_DAY + pd.Timedelta("14:00:00"), 12.0, 4.0,
+    )
+
+
+def test_late_trades_are_left_out():
+    aggregator = BarAggregator(["1Min"])
+    aggregator.update("AAA.CA", T + pd.Timedelta("70s"), 10, 1)
+    aggregator.advance(T + pd.Timedelta("2min"))
+
+    assert aggregator.update("AAA.CA", T + pd.Timedelta("80s"), 11, 1) == []
+    assert aggregator.late_trades == 1
+    # Still part of the session VWAP
+    closed = aggregator.update("AAA.CA", T + pd.Timedelta("130s"), 12, 2)
+    assert closed == []
+    assert aggregator.open[("AAA.CA", "1Min")]["vwap"] == pytest.approx(
+        (10 + 11 + 24) / 4
+    )
+
+
+def test_first_bucket_after_a_restart_is_not_published():
+    # AAA traded before the loop started, BBB did not
+    bases = {"AAA.CA": (100.0, 10.0), "BBB.CA": (0.0, 0.0)}
+    aggregator = BarAggregator(["1Min"], vwap_base=bases.get)
+
+    aggregator.update("AAA.CA", T + pd.Timedelta("30s"), 10, 10)
+    aggregator.update("BBB.CA", T + pd.Timedelta("30s"), 20, 1)
+    closed = aggregator.advance(T + pd.Timedelta("1min"))
+
+    assert [b["code"] for b in closed] == ["BBB.CA"]
+    aggregator.update("AAA.CA", T + pd.Timedelta("70s"), 12, 10)
+    bar = aggregator.open[("AAA.CA", "1Min")]
+    assert bar["bucket"] == (T + pd.Timedelta("1min")).value
+    # The session VWAP includes the trades before the restart
+    assert bar["vwap"] == pytest.approx((100 + 100 + 120) / 30)
+
+
+def test_restate_and_restore():
+    aggregator = BarAggregator(["1Min"])
+    aggregator.update("AAA.CA", T + pd.Timedelta("10s"), 10, 1)
+    state = aggregator.state()
+    aggregator.update("AAA.CA", T + pd.Timedelta("20s"), 11, 1)
+
+    aggregator.restore(state)
+    assert aggregator.open[("AAA.CA", "1Min")]["volume"] == 1.0
+
+    # Rebuilt up to 10:00:15: that minute is left to the stored bars
+    aggregator.restate("AAA.CA", {
+        "last_time": T + pd.Timedelta("15s"), "cum_pv": 30.0,
+        "cum_volume": 3.0,
+    })
+    assert aggregator.open == {}
+    assert aggregator.update("AAA.CA", T + pd.Timedelta("20s"), 11, 1) == []
+    aggregator.update("AAA.CA", T + pd.Timedelta("70s"), 12, 1)
+    assert aggregator.open[("AAA.CA", "1Min")]["vwap"] == pytest.approx(
+        53.0 / 5.0
+    )
+
+
+def test_closed_bar_feed(tmp_path):
+    aggregator = BarAggregator(["1Min"])
+    aggregator.update("AAA.CA", T, 10, 1)
+    feed = ClosedBarFeed("test", feed_dir=tmp_path)
+
+    feed(aggregator.advance(T + pd.Timedelta("1min")))
+
+    path = tmp_path / f"test-{SESSION_DAY.date().isoformat()}.jsonl"
+    (line,) = path.read_text().splitlines()
+    assert json.loads(line) == {
+        "code": "AAA.CA", "freq": "1Min", "time": T.isoformat(),
+        "open": 10.0, "high": 10.0, "low": 10.0, "close": 10.0,
+        "volume": 1.0, "vwap": 10.0,
+    }
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+bar_engine.resample_trades against a per-symbol pandas resample.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bar_engine import BAR_COLUMNS, resample_trades
+
+
+def pandas_bars(trades: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """
+    The scripts' original per-symbol resample: OHLC of the price, summed
+    volume and the cumulative session VWAP at the last trade of the bar.
+    """
+    frames = {}
+    for code, group in trades.groupby("code"):
+        group = group.assign(
+            cum_pv=(group["price"] * group["volume"]).cumsum(),
+            cum_volume=group["volume"].cumsum(),
+        )
+        resampled = group.resample(freq)
+        bars = resampled["price"].ohlc()
+        bars["volume"] = resampled["volume"].sum()
+        bars["vwap"] = (
+            resampled["cum_pv"].last() / resampled["cum_volume"].last()
+        )
+        frames[code] = bars.dropna()
+
+    bars = pd.concat(frames, names=["code", "time"])
+    return bars[BAR_COLUMNS]
+
+
+@pytest.mark.parametrize("freq", ["1Min", "5Min", "15Min"])
+def test_matches_pandas_resample(trades, freq):
+    # The close print opens a bar of its own without a calendar
+    expected = pandas_bars(trades, freq)
+    bars = resample_trades(trades, freq)
+
+    pd.testing.assert_frame_equal(bars, expected, check_freq=False)
+
+
+def test_vwap_base_continues_the_session(trades):
+    # Split between two trades sharing a timestamp
+    cut = trades.index[300]
+    first = trades.loc[trades.index < cut]
+    second = trades.loc[trades.index >= cut]
+
+    base = {
+        code: (
+            float((group["price"] * group["volume"]).sum()),
+            float(group["volume"].sum()),
+        )
+        for code, group in first.groupby("code")
+    }
+    later = resample_trades(second, "1Min", vwap_base=base)
+    whole = resample_trades(trades, "1Min")
+
+    np.testing.assert_allclose(
+        later["vwap"].to_numpy(),
+        whole.loc[later.index, "vwap"].to_numpy(),
+    )
+
+
+def test_session_anchored_buckets(trades, calendar):
+    bars = resample_trades(trades, "5Min", calendar=calendar)
+    times = bars.index.get_level_values("time")
+
+    # The close print lands in the last bar of the session
+    assert times.max() == pd.Timestamp("2026-01-04 14:25")
+    assert bars["volume"].sum() == trades["volume"].sum()
+
+
+def test_empty_trades():
+    bars = resample_trades(pd.DataFrame(), "1Min")
+
+    assert bars.empty
+    assert list(bars.columns) == BAR_COLUMNS
+    assert bars.index.names == ["code", "time"]
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+BarSink against the benchmark's SQLite stand-in database.
+"""
+
+import pandas as pd
+import pytest
+
+from bar_sink import BarSink, stored
+
+
+TABLE = "STOCK.FILL_OHLCV"
+T = pd.Timestamp("2026-01-04 10:00:00")
+
+
+def rows_in_table(connection) -> list:
+    return connection.execute(
+        f"SELECT TICKER, BARTIMESTAMP, CLOSE, VOLUME FROM {TABLE}"
+        " ORDER BY TICKER, BARTIMESTAMP"
+    ).fetchall()
+
+
+def bars_frame(rows) -> pd.DataFrame:
+    """
+    (ticker, time, close, volume) tuples → (code, time) indexed bars.
+    """
+    frame = pd.DataFrame(rows, columns=["code", "time", "close", "volume"])
+    frame = frame.assign(
+        open=frame["close"], high=frame["close"], low=frame["close"],
+        vwap=frame["close"],
+    )
+    return frame.set_index(["code", "time"])
+
+
+def test_upsert_merges_on_ticker_and_timestamp(database):
+    sink = BarSink(TABLE, mode="upsert")
+    sink.insert_bars(bars_frame([
+        ("AAA", T, 10.0, 100.0),
+        ("AAA", T + pd.Timedelta("5min"), 11.0, 50.0),
+    ]), asset=1)
+    assert sink.flush(database)["upserted"] == 2
+
+    # The open bar grows, a new bar follows; written twice
+    for _ in range(2):
+        sink = BarSink(TABLE, mode="upsert")
+        sink.insert_bars(bars_frame([
+            ("AAA", T + pd.Timedelta("5min"), 11.5, 80.0),
+            ("AAA", T + pd.Timedelta("10min"), 12.0, 10.0),
+        ]), asset=1)
+        counts = sink.flush(database)
+
+    assert counts["committed"]
+    assert counts["upserted"] == 2
+    assert rows_in_table(database) == [
+        ("AAA", T.to_pydatetime(), 10.0, 100.0),
+        ("AAA", (T + pd.Timedelta("5min")).to_pydatetime(), 11.5, 80.0),
+        ("AAA", (T + pd.Timedelta("10min")).to_pydatetime(), 12.0, 10.0),
+    ]
+
+
+def test_delete_update_and_insert_in_one_commit(database):
+    sink = BarSink(TABLE, mode="upsert")
+    sink.insert_bars(bars_frame([
+        ("AAA", T, 10.0, 100.0),
+        ("BBB", T, 20.0, 5.0),
+    ]), asset=1)
+    sink.flush(database)
+
+    sink = BarSink(TABLE, mode="upsert")
+    sink.delete("BBB", T)
+    sink.update("AAA", T, VOLUME=150.0)
+    counts = sink.flush(database)
+
+    assert (counts["deleted"], counts["updated"]) == (1, 1)
+    assert rows_in_table(database) == [
+        ("AAA", T.to_pydatetime(), 10.0, 150.0)
+    ]
+
+
+def test_failed_batch_is_rolled_back(database):
+    sink = BarSink(TABLE)
+    sink.insert("AAA", T, 10.0, 10.0, 10.0, 10.0, 100.0, 1, 10.0)
+    sink.flush(database)
+
+    # Without batch errors the duplicate aborts the whole batch
+    sink = BarSink(TABLE)
+    sink.insert("BBB", T, 20.0, 20.0, 20.0, 20.0, 5.0, 1, 20.0)
+    sink.insert("AAA", T, 11.0, 11.0, 11.0, 11.0, 1.0, 1, 11.0)
+    counts = sink.flush(database)
+
+    assert not counts["committed"]
+    assert counts["errors"] == 2
+    assert len(sink) == 0
+    assert rows_in_table(database) == [
+        ("AAA", T.to_pydatetime(), 10.0, 100.0)
+    ]
+
+
+def test_batch_errors_reject_single_rows(database, oracle_like, capsys):
+
+    sink = BarSink(TABLE)
+    sink.insert("AAA", T, 10.0, 10.0, 10.0, 10.0, 100.0, 1, 10.0)
+    sink.flush(oracle_like)
+
+    sink = BarSink(TABLE)
+    sink.insert("AAA", T, 11.0, 11.0, 11.0, 11.0, 1.0, 1, 11.0)
+    sink.insert("BBB", T, 20.0, 20.0, 20.0, 20.0, 5.0, 1, 20.0)
+    counts = sink.flush(oracle_like)
+
+    # The rest of the batch is committed, but not every row is stored
+    assert counts["committed"]
+    assert (counts["inserted"], counts["errors"]) == (1, 1)
+    assert not stored(counts)
+    assert f"{TABLE} insert failed for AAA" in capsys.readouterr().out
+    assert rows_in_table(database) == [
+        ("AAA", T.to_pydatetime(), 10.0, 100.0),
+        ("BBB", T.to_pydatetime(), 20.0, 5.0),
+    ]
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        BarSink(TABLE, mode="replace")
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+DirtyBarTracker against the SQLite stand-in database: late and busted
+trades, and repairs stopping at the bound of the fetch in flight.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bar_engine import resample_trades, trade_totals
+from conftest import SESSION_DAY, add_trades
+from dirty_bars import DirtyBarTracker
+from trade_stream import TRADES_SQL, iter_frames
+from trade_watermark import TradeWatermarkStore
+
+
+T = SESSION_DAY + pd.Timedelta("10:00:00")
+
+
+def at(seconds: float) -> pd.Timestamp:
+    return T + pd.Timedelta(seconds=seconds)
+
+
+def stored_trades(connection) -> pd.DataFrame:
+    chunks = list(iter_frames(
+        connection.cursor(), TRADES_SQL, {"since": T.to_pydatetime()}
+    ))
+    return pd.concat(chunks)
+
+
+@pytest.fixture
+def tracker(database, calendar):
+    """
+    A tracker whose ledger holds the trades stored so far (as the loop
+    records them), after its first (seeding) comparison.
+    """
+    add_trades(database, [
+        (10, "AAA.CA", 10.0, 100.0),
+        (70, "AAA.CA", 11.0, 50.0),
+        (130, "AAA.CA", 12.0, 10.0),
+        (20, "BBB.CA", 20.0, 5.0),
+    ])
+    tracker = DirtyBarTracker("1Min", calendar=calendar)
+    tracker.record(trade_totals(stored_trades(database)))
+    assert tracker.find_dirty(database.cursor(), at(180)) == {}
+    return tracker
+
+
+def test_late_trade_rebuilds_its_bar_and_the_later_ones(
+    database, tracker, calendar, tmp_path
+):
+    add_trades(database, [(40, "AAA.CA", 13.0, 20.0)])
+    cursor = database.cursor()
+
+    dirty = tracker.find_dirty(cursor, at(180))
+    repair = tracker.rebuild(cursor, dirty, at(180))
+
+    trades = stored_trades(database)
+    expected = resample_trades(
+        trades.loc[trades["code"] == "AAA.CA"], "1Min", calendar=calendar
+    )
+    assert dirty == {"AAA.CA": T}
+    assert repair["stale"] == []
+    np.testing.assert_allclose(
+        repair["bars"].to_numpy(), expected.to_numpy()
+    )
+
+    store = TradeWatermarkStore("test", "1Min", state_dir=tmp_path)
+    tracker.commit(repair, store)
+
+    assert store.symbols["AAA.CA"]["last_time"] == at(130)
+    assert tracker.find_dirty(cursor, at(180)) == {}
+    assert tracker.clean_until == at(180)
+
+
+def test_busted_trade_deletes_its_bar(database, tracker, tmp_path):
+    database.execute(
+        "DELETE FROM STOCK.TRADES WHERE EXEC_TIME = ?",
+        (at(70).to_pydatetime(),),
+    )
+    database.commit()
+    cursor = database.cursor()
+
+    dirty = tracker.find_dirty(cursor, at(180))
+    repair = tracker.rebuild(cursor, dirty, at(180))
+
+    assert dirty == {"AAA.CA": T + pd.Timedelta("1min")}
+    assert repair["stale"] == [("AAA.CA", T + pd.Timedelta("1min"))]
+    assert repair["bars"].index.tolist() == [
+        ("AAA.CA", T + pd.Timedelta("2min")),
+    ]
+    # The VWAP carries the bars before the rebuilt ones
+    assert repair["bars"]["vwap"].iloc[0] == pytest.approx(
+        (1000.0 + 120.0) / 110.0
+    )
+
+    tracker.commit(repair, TradeWatermarkStore(
+        "test", "1Min", state_dir=tmp_path
+    ))
+    assert tracker.find_dirty(cursor, at(180)) == {}
+
+
+def test_repair_stops_at_the_fetch_bound(database, tracker, tmp_path):
+    # BBB holds the fetch bound at 10:01:00 while AAA's 10:02:10 trade is
+    # in the ledger; a late AAA trade, then one committed after the fetch
+    # read from the bound
+    add_trades(database, [(40, "AAA.CA", 13.0, 20.0)])
+    until = at(60)
+    add_trades(database, [(140, "AAA.CA", 14.0, 1.0)])
+    cursor = database.cursor()
+
+    repair = tracker.rebuild(cursor, tracker.find_dirty(cursor, until), until)
+
+    # Only the trades before the bound: nothing after it is stale, and
+    # the restated watermark stays before it
+    assert repair["bars"].index.tolist() == [("AAA.CA", T)]
+    assert repair["stale"] == []
+    assert repair["stats"]["AAA.CA"]["last_time"] == at(40)
+
+    store = TradeWatermarkStore("test", "1Min", state_dir=tmp_path)
+    tracker.commit(repair, store)
+    store.reset_cycle()
+
+    # The fetch from the bound (and the next one) builds the rest
+    fetched = stored_trades(database)
+    fetched = fetched.loc[fetched.index >= until]
+    assert store.filter_new(fetched)["volume"].tolist() == [
+        50.0, 10.0, 1.0,
+    ]
+    assert store.since() <= until.to_pydatetime()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+fill_panel of the EWI script against the per-ticker pandas fills.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from resampling_benchmark import script_functions
+
+
+@pytest.fixture(scope="module")
+def fill_panel():
+    return script_functions("EWI Last Indicies.py")["fill_panel"]
+
+
+def pandas_fill(values: np.ndarray, prior: np.ndarray) -> np.ndarray:
+    """
+    The script's original gap filling: ffill, bfill, then the prior bar,
+    ticker by ticker.
+    """
+    frame = pd.DataFrame(values)
+    for column in frame:
+        frame[column] = (
+            frame[column].ffill().bfill().fillna(prior[column])
+        )
+    return frame.to_numpy()
+
+
+def test_matches_the_pandas_fills(fill_panel):
+    rng = np.random.default_rng(3)
+    values = rng.uniform(10, 20, (12, 8)).round(2)
+    values[rng.random(values.shape) < 0.4] = np.nan
+    # A ticker without any price in the window, one priced only once
+    values[:, 2] = np.nan
+    values[:, 5] = np.nan
+    values[7, 5] = 15.0
+
+    prior = rng.uniform(10, 20, 8).round(2)
+    prior[3] = np.nan
+
+    np.testing.assert_array_equal(
+        fill_panel(values, prior), pandas_fill(values, prior)
+    )
+
+
+def test_gaps_filled_in_order(fill_panel):
+    nan = np.nan
+    values = np.array([
+        [nan, 1.0, nan],
+        [2.0, nan, nan],
+        [nan, 3.0, nan],
+    ])
+    prior = np.array([9.0, 9.0, 9.0])
+
+    np.testing.assert_array_equal(fill_panel(values, prior), [
+        [2.0, 1.0, 9.0],
+        [2.0, 1.0, 9.0],
+        [2.0, 3.0, 9.0],
+    ])
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+IndexVolumeRollup: constituent volume loaded from the session's bars,
+then kept current by the bars the loop writes and deletes.
+"""
+
+import pandas as pd
+import pytest
+
+from conftest import SESSION_DAY
+from index_resampling import IndexVolumeRollup
+
+
+T = SESSION_DAY + pd.Timedelta("10:00:00")
+FIVE = pd.Timedelta("5min")
+
+
+def stock_bars(rows) -> pd.DataFrame:
+    """
+    (ticker, time, volume) tuples → (code, time) indexed bars.
+    """
+    return pd.DataFrame(
+        {"volume": [volume for _, _, volume in rows]},
+        index=pd.MultiIndex.from_tuples(
+            [(ticker, time) for ticker, time, _ in rows],
+            names=["code", "time"],
+        ),
+    )
+
+
+def volumes(rollup, symbols) -> dict:
+    frame = rollup.index_volume("EGX30", symbols)
+    return dict(zip(frame.index, frame["volume"]))
+
+
+@pytest.fixture
+def rollup(database):
+    """
+    A rollup warmed from FILL_OHLCV: session bars of three tickers, plus a
+    bar of the previous session and an index bar.
+    """
+    database.executemany(
+        "INSERT INTO STOCK.FILL_OHLCV (TICKER, VOLUME, BARTIMESTAMP, ASSET)"
+        " VALUES (?, ?, ?, ?)",
+        [
+            ("AAA", 100.0, T.to_pydatetime(), 1),
+            ("AAA", 50.0, (T + FIVE).to_pydatetime(), 1),
+            ("BBB", 5.0, T.to_pydatetime(), 1),
+            ("CCC", 7.0, T.to_pydatetime(), 1),
+            ("AAA", 999.0, (T - pd.Timedelta("1D")).to_pydatetime(), 1),
+            ("EGX30", 1000.0, T.to_pydatetime(), 0),
+        ],
+    )
+    database.commit()
+
+    rollup = IndexVolumeRollup("STOCK.FILL_OHLCV")
+    rollup.warm(database, session_start=SESSION_DAY)
+    return rollup
+
+
+def test_warm_sums_the_session_bars(rollup):
+    assert volumes(rollup, ["AAA", "BBB"]) == {T: 105.0, T + FIVE: 50.0}
+
+
+def test_written_and_deleted_bars_adjust_the_totals(rollup):
+    volumes(rollup, ["AAA", "BBB"])
+
+    # AAA's open bar grew, BBB got a new one
+    rollup.record(stock_bars([("AAA", T, 120.0), ("BBB", T + FIVE, 3.0)]))
+    assert volumes(rollup, ["AAA", "BBB"]) == {T: 125.0, T + FIVE: 53.0}
+
+    # CCC is not a member; an unknown bar is ignored
+    rollup.remove([("AAA", T + FIVE), ("CCC", T), ("DDD", T)])
+    assert volumes(rollup, ["AAA", "BBB"]) == {T: 125.0, T + FIVE: 3.0}
+
+    # The last member bar of a timestamp removes it
+    rollup.remove([("BBB", T + FIVE)])
+    assert volumes(rollup, ["AAA", "BBB"]) == {T: 125.0}
+
+
+def test_changed_members_are_summed_again(rollup):
+    volumes(rollup, ["AAA", "BBB"])
+
+    assert volumes(rollup, ["AAA", "CCC"]) == {T: 107.0, T + FIVE: 50.0}
+
+    # BBB left the index: its bars no longer count
+    rollup.record(stock_bars([("BBB", T, 6.0), ("CCC", T, 8.0)]))
+    assert volumes(rollup, ["AAA", "CCC"]) == {T: 108.0, T + FIVE: 50.0}
+
+
+def test_bars_of_a_later_session_reset_the_totals(rollup):
+    volumes(rollup, ["AAA", "BBB"])
+    tomorrow = T + pd.Timedelta("1D")
+
+    rollup.record(stock_bars([("AAA", tomorrow, 10.0)]))
+    assert volumes(rollup, ["AAA", "BBB"]) == {tomorrow: 10.0}
+
+    # A late bar of the previous session is left out
+    rollup.record(stock_bars([("BBB", T, 9.0)]))
+    assert volumes(rollup, ["AAA", "BBB"]) == {tomorrow: 10.0}
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+IndexTickStream against the SQLite stand-in CASE_SECTOR_INDEX table:
+incremental fetches match one resample of every tick.
+"""
+
+import pandas as pd
+
+from bar_engine import resample_ticks
+from conftest import SESSION_DAY
+from index_ticks import IndexTickStream
+
+
+T = SESSION_DAY + pd.Timedelta("10:00:00")
+
+TICKS_SQL = """
+    SELECT SECTOR_DESC, INDEXTIME, INDEXVALUE
+    FROM CASE_SECTOR_INDEX
+    WHERE INDEXTIME >= :since
+    ORDER BY INDEXTIME
+"""
+
+
+def add_ticks(connection, rows) -> None:
+    """
+    (seconds after the SESSION_DAY open, code, value) tuples →
+    CASE_SECTOR_INDEX.
+    """
+    connection.executemany(
+        "INSERT INTO CASE_SECTOR_INDEX VALUES (?, ?, ?)",
+        [
+            (code, (T + pd.Timedelta(seconds=seconds)).to_pydatetime(), value)
+            for seconds, code, value in rows
+        ],
+    )
+    connection.commit()
+
+
+def tick_stream(folder, calendar) -> IndexTickStream:
+    return IndexTickStream(
+        "test_index_ticks",
+        TICKS_SQL,
+        "5Min",
+        columns=["code", "time", "price"],
+        calendar=calendar,
+        state_dir=folder,
+    )
+
+
+def test_fetches_match_one_resample(database, calendar, tmp_path):
+    rows = [
+        (10, "Banks", 1.0), (50, "Energy", 5.0),
+        (100, "Banks", 2.0), (100, "Banks", 3.0),
+    ]
+    add_ticks(database, rows)
+    stream = tick_stream(tmp_path, calendar)
+    stream.fetch(database.cursor(), now=SESSION_DAY)
+    stream.commit()
+
+    # Another tick at the watermark time, committed late, and new ones
+    later = [
+        (100, "Banks", 4.0), (400, "Banks", 6.0), (350, "Energy", 7.0),
+    ]
+    add_ticks(database, later)
+    bars = stream.fetch(database.cursor(), now=SESSION_DAY)
+    stream.commit()
+
+    ticks = pd.DataFrame(
+        [(T + pd.Timedelta(seconds=s), code, v) for s, code, v in rows + later],
+        columns=["time", "code", "price"],
+    ).set_index("time")
+    expected = resample_ticks(ticks, "5Min", calendar=calendar)
+
+    assert stream.rows == 3
+    pd.testing.assert_frame_equal(bars, expected, check_freq=False)
+
+
+def test_watermarks_move_only_on_commit(database, calendar, tmp_path):
+    add_ticks(database, [(10, "Banks", 1.0), (20, "Banks", 2.0)])
+    stream = tick_stream(tmp_path, calendar)
+
+    first = stream.fetch(database.cursor(), now=SESSION_DAY)
+    # Not stored: the next fetch folds the same ticks again
+    again = stream.fetch(database.cursor(), now=SESSION_DAY)
+    assert stream.rows == 2
+    pd.testing.assert_frame_equal(again, first)
+
+    stream.commit()
+
+    # A restarted loop resumes from the saved state: only the open bar
+    restarted = tick_stream(tmp_path, calendar)
+    bars = restarted.fetch(database.cursor(), now=SESSION_DAY)
+    assert restarted.rows == 0
+    assert bars.index.tolist() == [("Banks", T)]
+    assert bars.loc[("Banks", T), "close"] == 2.0
+
+    # Another session starts from its own ticks
+    assert restarted.since(SESSION_DAY + pd.Timedelta("1D")) == (
+        SESSION_DAY + pd.Timedelta("1D")
+    ).to_pydatetime()
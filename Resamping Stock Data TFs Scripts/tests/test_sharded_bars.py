@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Symbol-sharded bar building on the worker pool.
+"""
+
+import numpy as np
+import pytest
+
+from bar_engine import resample_trades
+from sharded_bars import (
+    get_executor,
+    resample_trades_sharded,
+    shutdown_executor,
+)
+
+
+@pytest.fixture
+def pool():
+    yield get_executor(2)
+    shutdown_executor()
+
+
+def test_workers_are_not_forked(pool):
+    assert pool._mp_context.get_start_method() in ("forkserver", "spawn")
+
+
+def test_matches_the_serial_build(pool, trades, calendar):
+    base = {"AAA.CA": (1000.0, 100.0)}
+
+    sharded = resample_trades_sharded(
+        trades, "5Min", vwap_base=base, workers=2, min_rows=0,
+        calendar=calendar,
+    )
+    serial = resample_trades(trades, "5Min", vwap_base=base, calendar=calendar)
+
+    assert sharded.index.equals(serial.index)
+    np.testing.assert_allclose(sharded.to_numpy(), serial.to_numpy())
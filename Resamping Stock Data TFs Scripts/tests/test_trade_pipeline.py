@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+TradeBarLoop cycles against the SQLite stand-in database: the compute and
+write stages run one after the other on a fetched cycle.
+"""
+
+import functools
+import sqlite3
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("cx_Oracle")
+
+import trade_pipeline  # noqa: E402
+from bar_engine import BAR_COLUMNS  # noqa: E402
+from bar_sink import BarSink  # noqa: E402
+from conftest import SESSION_DAY, add_trades  # noqa: E402
+from cycle_metrics import CycleMetrics  # noqa: E402
+from pipeline import STOP, Pipeline  # noqa: E402
+from trade_stream import TRADES_SQL, iter_frames, trades_since  # noqa: E402
+from trade_watermark import TradeWatermarkStore  # noqa: E402
+
+
+TABLES = {"1Min": "STOCK.FILL_OHLCV_1MIN", "5Min": "STOCK.FILL_OHLCV"}
+T = SESSION_DAY + pd.Timedelta("10:00:00")
+NOW = SESSION_DAY + pd.Timedelta("12:00:00")
+
+
+def no_stored_bars(connection, table) -> pd.DataFrame:
+    return pd.DataFrame(
+        columns=["code", "time"] + BAR_COLUMNS
+    ).set_index(["code", "time"])
+
+
+@pytest.fixture
+def start_loop(tmp_path, monkeypatch, calendar):
+    """
+    ``start_loop(connection)``: a warmed loop whose pool hands out
+    ``connection``, with its state files under tmp_path.
+    """
+    monkeypatch.setattr(
+        trade_pipeline, "TradeWatermarkStore",
+        functools.partial(TradeWatermarkStore, state_dir=tmp_path),
+    )
+    monkeypatch.setattr(
+        trade_pipeline, "CycleMetrics",
+        functools.partial(CycleMetrics, metrics_dir=None, port=None),
+    )
+    # Nothing stored yet (the query reads TRUNC(SYSDATE))
+    monkeypatch.setattr(
+        trade_pipeline, "load_session_minute_bars", no_stored_bars
+    )
+    monkeypatch.setattr(trade_pipeline, "release", lambda connection: None)
+
+    def start(connection, **options):
+        monkeypatch.setattr(trade_pipeline, "acquire", lambda: connection)
+        loop = trade_pipeline.TradeBarLoop(
+            "test", TABLES, calendar=calendar, **options
+        )
+        loop.warm()
+        # Compare the ledger with the database every cycle
+        loop.tracker.reconcile_seconds = 0
+        return loop
+
+    return start
+
+
+def fetch_cycle(loop, connection, chunks) -> None:
+    """
+    Queue one fetch of the trades after the loop's watermark.
+    """
+    since = loop.feed.since
+    chunks.put(("start", (since, loop.metrics.start())))
+    for chunk in iter_frames(connection.cursor(), TRADES_SQL, {
+        "since": trades_since(since, loop.calendar, now=NOW),
+    }):
+        chunks.put(("chunk", chunk))
+    chunks.put(("end", None))
+
+
+def run_cycle(loop, connection, committed_after_fetch=()) -> None:
+    """
+    Fetch the trades after the loop's watermark, then compute and write
+    that cycle (``committed_after_fetch`` trades land in between).
+    """
+    pipeline = Pipeline("test")
+    chunks, cycles = pipeline.queue(0), pipeline.queue(0)
+
+    fetch_cycle(loop, connection, chunks)
+    chunks.put(STOP)
+    add_trades(connection, committed_after_fetch)
+
+    loop.compute_stage(pipeline, chunks, cycles)
+    loop.write_stage(pipeline, cycles)
+
+
+def stored_volumes(connection, table) -> dict:
+    return dict(
+        ((ticker, pd.Timestamp(time)), volume)
+        for ticker, time, volume in connection.execute(
+            f"SELECT TICKER, BARTIMESTAMP, VOLUME FROM {table}"
+        )
+    )
+
+
+def saved_watermarks(loop) -> dict:
+    return TradeWatermarkStore(
+        "test_trade_watermarks", "1Min", state_dir=loop.watermarks.path.parent
+    ).symbols
+
+
+def test_missing_and_disabled_tables_are_reported(database, capsys):
+    tables = trade_pipeline.available_tables(database, {
+        "1Min": "STOCK.FILL_OHLCV_1MIN",
+        "15Min": "STOCK.FILL_OHLCV_15MIN",
+        "1D": None,
+    })
+    out = capsys.readouterr().out
+
+    assert tables == {
+        "1Min": "STOCK.FILL_OHLCV_1MIN", "15Min": None, "1D": None,
+    }
+    assert "Warning: 15Min table STOCK.FILL_OHLCV_15MIN not available" in out
+    assert "Warning: 1D has no table configured" in out
+    assert "1Min" not in out
+
+
+def test_rejected_rows_hold_the_watermarks_back(
+    database, oracle_like, start_loop
+):
+    add_trades(database, [
+        (10, "AAA.CA", 10.0, 100.0),
+        (20, "BBB.CA", 20.0, 5.0),
+    ])
+    database.executescript("""
+        CREATE TRIGGER STOCK.REJECT_BBB BEFORE INSERT ON FILL_OHLCV_1MIN
+        WHEN NEW.TICKER = 'BBB'
+        BEGIN SELECT RAISE(ABORT, 'rejected'); END;
+    """)
+    loop = start_loop(oracle_like)
+
+    run_cycle(loop, oracle_like)
+
+    # AAA's bars are committed, BBB's 1-minute bar is not
+    assert stored_volumes(database, TABLES["1Min"]) == {("AAA", T): 100.0}
+    assert loop.feed.rewind.is_set()
+    assert saved_watermarks(loop) == {}
+
+    database.execute("DROP TRIGGER STOCK.REJECT_BBB")
+    # The cycle fetched before the rewind is skipped (still finished, with
+    # nothing built), the next one re-reads the session
+    cycles = loop.metrics.cycles
+    run_cycle(loop, oracle_like)
+    assert loop.metrics.cycles == cycles + 1
+    assert loop.metrics.last["counts"] == {"cycles_skipped": 1}
+    run_cycle(loop, oracle_like)
+
+    assert not loop.feed.rewind.is_set()
+    assert stored_volumes(database, TABLES["1Min"]) == {
+        ("AAA", T): 100.0, ("BBB", T): 5.0,
+    }
+    assert set(saved_watermarks(loop)) == {"AAA.CA", "BBB.CA"}
+
+
+def test_closed_bars_are_published_once_stored(
+    database, start_loop, monkeypatch
+):
+    add_trades(database, [
+        (10, "AAA.CA", 10.0, 100.0),
+        (20, "BBB.CA", 20.0, 5.0),
+        (70, "AAA.CA", 11.0, 50.0),
+        (250, "AAA.CA", 12.0, 10.0),
+    ])
+    monkeypatch.setattr(
+        trade_pipeline, "market_now", lambda: T + pd.Timedelta("250s")
+    )
+    published = []
+    loop = start_loop(database, publish=published.extend)
+
+    run_cycle(loop, database)
+
+    # 10:04 is still open; AAA's 10:00 bar closed by its 10:01 trade, the
+    # others by the clock (five seconds of grace)
+    assert {(b["freq"], b["code"], b["time"]) for b in published} == {
+        ("1Min", "AAA", T), ("1Min", "BBB", T),
+        ("1Min", "AAA", T + pd.Timedelta("1min")),
+    }
+    stored = stored_volumes(database, TABLES["1Min"])
+    for bar in published:
+        assert stored[(bar["code"], bar["time"])] == bar["volume"]
+
+
+def test_late_trades_are_repaired_up_to_the_fetch_bound(
+    database, start_loop
+):
+    add_trades(database, [
+        (10, "AAA.CA", 10.0, 100.0),
+        (70, "AAA.CA", 11.0, 50.0),
+        (20, "BBB.CA", 20.0, 5.0),
+        (80, "BBB.CA", 21.0, 6.0),
+    ])
+    loop = start_loop(database)
+    run_cycle(loop, database)
+
+    # A late AAA print; the next cycle seeds the ledger comparison
+    add_trades(database, [(40, "AAA.CA", 13.0, 20.0)])
+    run_cycle(loop, database)
+
+    # The repair runs from the fetch bound (AAA's 10:01:10 watermark):
+    # it takes the late print committed after the fetch, the trades the
+    # fetch read are built once, the later ones by the next cycle
+    add_trades(database, [(100, "AAA.CA", 12.0, 7.0)])
+    run_cycle(loop, database, committed_after_fetch=[
+        (50, "AAA.CA", 13.0, 1.0),
+        (130, "AAA.CA", 12.0, 10.0),
+        (140, "BBB.CA", 22.0, 1.0),
+    ])
+    run_cycle(loop, database)
+
+    minute = pd.Timedelta("1min")
+    assert stored_volumes(database, TABLES["1Min"]) == {
+        ("AAA", T): 121.0, ("AAA", T + minute): 57.0,
+        ("AAA", T + 2 * minute): 10.0,
+        ("BBB", T): 5.0, ("BBB", T + minute): 6.0,
+        ("BBB", T + 2 * minute): 1.0,
+    }
+    assert stored_volumes(database, TABLES["5Min"]) == {
+        ("AAA", T): 188.0, ("BBB", T): 12.0,
+    }
+
+
+def test_failed_write_rewinds_the_cycles_computed_behind_it(
+    database, start_loop, monkeypatch
+):
+    add_trades(database, [
+        (10, "AAA.CA", 10.0, 100.0),
+        (20, "BBB.CA", 20.0, 5.0),
+    ])
+    monkeypatch.setattr(
+        trade_pipeline, "market_now", lambda: T + pd.Timedelta("150s")
+    )
+    published = []
+    loop = start_loop(database, publish=published.extend)
+    run_cycle(loop, database)
+
+    flush = BarSink.flush
+    failures = iter([True])
+
+    def flaky_flush(sink, connection):
+        if next(failures, False):
+            raise sqlite3.OperationalError("connection lost")
+        return flush(sink, connection)
+
+    monkeypatch.setattr(BarSink, "flush", flaky_flush)
+
+    # Two fetches computed before the first one is written
+    pipeline = Pipeline("test")
+    chunks, cycles = pipeline.queue(0), pipeline.queue(0)
+    add_trades(database, [(70, "AAA.CA", 11.0, 50.0)])
+    fetch_cycle(loop, database, chunks)
+    add_trades(database, [(130, "AAA.CA", 12.0, 10.0)])
+    fetch_cycle(loop, database, chunks)
+    chunks.put(STOP)
+    loop.compute_stage(pipeline, chunks, cycles)
+    loop.write_stage(pipeline, cycles)
+
+    # Neither is saved: the second was built on the failed one
+    assert loop.feed.rewind.is_set()
+    assert saved_watermarks(loop)["AAA.CA"]["last_time"] == T + pd.Timedelta(
+        "10s"
+    )
+    assert len(published) == 2
+
+    # The cycle fetched before the rewind is skipped, the next one
+    # re-reads from the saved watermarks
+    run_cycle(loop, database)
+    run_cycle(loop, database)
+
+    assert not loop.feed.rewind.is_set()
+    assert stored_volumes(database, TABLES["1Min"]) == {
+        ("AAA", T): 100.0, ("AAA", T + pd.Timedelta("1min")): 50.0,
+        ("AAA", T + pd.Timedelta("2min")): 10.0, ("BBB", T): 5.0,
+    }
+    assert saved_watermarks(loop)["AAA.CA"]["last_time"] == T + pd.Timedelta(
+        "130s"
+    )
+    # Each closed bar is published once, from the restored aggregator
+    assert sorted((b["code"], b["time"]) for b in published) == [
+        ("AAA", T), ("AAA", T + pd.Timedelta("1min")), ("BBB", T),
+    ]
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+TradeWatermarkStore: persistence, trades sharing the watermark time and
+incremental cycles matching a single pass.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bar_engine import resample_trades
+from trade_stream import StreamingBarBuilder
+from trade_watermark import TradeWatermarkStore
+
+
+T = pd.Timestamp("2026-01-04 10:05:00")
+
+
+def trade_frame(rows) -> pd.DataFrame:
+    """
+    (time, code, price, volume) tuples → a trades chunk as streamed.
+    """
+    frame = pd.DataFrame(rows, columns=["time", "code", "price", "volume"])
+    return frame.set_index("time")
+
+
+def run_cycle(store, chunks, calendar=None) -> pd.DataFrame:
+    """
+    One loop cycle over fetched chunks: filter, build, merge the open
+    bars and advance the watermarks.
+    """
+    store.reset_cycle()
+    builder = StreamingBarBuilder("5Min", store.vwap_base, calendar=calendar)
+    for chunk in chunks:
+        builder.feed(store.filter_new(chunk))
+
+    bars = store.merge_open_bars(builder.result())
+    store.advance_bars(bars, builder.trade_stats)
+    return bars
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TradeWatermarkStore("test", "5Min", state_dir=tmp_path)
+
+
+def test_save_and_load_round_trip(store, tmp_path):
+    run_cycle(store, [trade_frame([
+        (T, "AAA.CA", 10.0, 100.0),
+        (T, "AAA.CA", 10.5, 50.0),
+        (T + pd.Timedelta("30s"), "BBB.CA", 20.0, 10.0),
+    ])])
+    store.save()
+
+    loaded = TradeWatermarkStore("test", "5Min", state_dir=tmp_path)
+
+    assert loaded.symbols == store.symbols
+    assert loaded.symbols["AAA.CA"]["last_count"] == 2
+    assert loaded.since() == T.to_pydatetime()
+
+
+def test_other_frequency_is_ignored(store, tmp_path):
+    run_cycle(store, [trade_frame([(T, "AAA.CA", 10.0, 100.0)])])
+    store.save()
+
+    other = TradeWatermarkStore("test", "1Min", state_dir=tmp_path)
+
+    assert other.symbols == {}
+
+
+def test_saved_snapshot_not_current_state(store, tmp_path):
+    run_cycle(store, [trade_frame([(T, "AAA.CA", 10.0, 100.0)])])
+    snapshot = store.snapshot()
+    run_cycle(store, [trade_frame([
+        (T + pd.Timedelta("1min"), "AAA.CA", 11.0, 100.0),
+    ])])
+    store.save(snapshot)
+
+    store.reload()
+
+    assert store.since() == T.to_pydatetime()
+
+
+def test_ties_at_the_watermark_are_skipped_by_count(store):
+    # Two of the three trades at T were read before the third arrived
+    run_cycle(store, [trade_frame([
+        (T, "AAA.CA", 10.0, 100.0),
+        (T, "AAA.CA", 10.1, 100.0),
+    ])])
+
+    fetched = trade_frame([
+        (T, "AAA.CA", 10.0, 100.0),
+        (T, "AAA.CA", 10.1, 100.0),
+        (T, "AAA.CA", 10.2, 7.0),
+        (T + pd.Timedelta("1s"), "AAA.CA", 10.3, 8.0),
+    ])
+    store.reset_cycle()
+    new = store.filter_new(fetched)
+
+    assert new["volume"].tolist() == [7.0, 8.0]
+
+
+def test_ties_accumulate_over_cycles(store):
+    ties = [(T, "AAA.CA", 10.0 + i / 10, 1.0 + i) for i in range(3)]
+
+    # The trades at T arrive one per cycle: each cycle sees one new trade
+    for seen in range(1, 4):
+        bars = run_cycle(store, [trade_frame(ties[:seen])])
+        assert bars["volume"].tolist() == [sum(t[3] for t in ties[:seen])]
+
+    assert store.symbols["AAA.CA"]["last_count"] == 3
+
+
+def test_ties_split_over_chunks(store):
+    run_cycle(store, [trade_frame([
+        (T, "AAA.CA", 10.0, 100.0),
+        (T, "AAA.CA", 10.1, 100.0),
+        (T, "BBB.CA", 20.0, 5.0),
+    ])])
+
+    store.reset_cycle()
+    first = store.filter_new(trade_frame([
+        (T, "AAA.CA", 10.0, 100.0),
+        (T, "BBB.CA", 20.0, 5.0),
+    ]))
+    second = store.filter_new(trade_frame([
+        (T, "AAA.CA", 10.1, 100.0),
+        (T, "AAA.CA", 10.2, 7.0),
+        (T, "BBB.CA", 20.1, 6.0),
+    ]))
+
+    assert first.empty
+    assert second["volume"].tolist() == [7.0, 6.0]
+
+
+def test_trades_committed_out_of_order_are_fetched(store):
+    # BBB's 10:05:10 trade is committed after AAA's 10:05:30 one
+    run_cycle(store, [trade_frame([
+        (T, "BBB.CA", 20.0, 5.0),
+        (T + pd.Timedelta("30s"), "AAA.CA", 10.0, 100.0),
+    ])])
+    since = store.since()
+    committed = trade_frame([
+        (T, "BBB.CA", 20.0, 5.0),
+        (T + pd.Timedelta("10s"), "BBB.CA", 20.5, 6.0),
+        (T + pd.Timedelta("30s"), "AAA.CA", 10.0, 100.0),
+        (T + pd.Timedelta("40s"), "AAA.CA", 10.1, 7.0),
+    ])
+
+    bars = run_cycle(store, [committed.loc[committed.index >= since]])
+
+    assert since == T.to_pydatetime()
+    assert bars["volume"].to_dict() == {
+        ("AAA.CA", T): 107.0,
+        ("BBB.CA", T): 11.0,
+    }
+
+
+def test_fetch_bound_overlap(store):
+    # A symbol that stopped trading does not hold the bound back
+    run_cycle(store, [trade_frame([
+        (T, "BBB.CA", 20.0, 5.0),
+        (T + pd.Timedelta("5min"), "AAA.CA", 10.0, 100.0),
+    ])])
+
+    assert store.since() == (
+        T + pd.Timedelta("5min") - store.overlap
+    ).to_pydatetime()
+
+
+def test_trades_of_a_new_day_reset_the_symbol(store):
+    run_cycle(store, [trade_frame([(T, "AAA.CA", 10.0, 100.0)])])
+
+    next_day = T + pd.Timedelta("1D")
+    new = store.filter_new(trade_frame([(next_day, "AAA.CA", 9.0, 10.0)]))
+
+    assert len(new) == 1
+    assert "AAA.CA" not in store.symbols
+    assert store.vwap_base("AAA.CA") == (0.0, 0.0)
+
+
+def test_incremental_cycles_match_a_single_pass(store, trades, calendar):
+    # Every cycle re-fetches from the watermark (">="), in two chunks;
+    # the cut points fall inside the run of trades sharing a timestamp
+    expected = resample_trades(trades, "5Min", calendar=calendar)
+
+    written = {}
+    for cut in (150, 299, 300, 301, 450, len(trades)):
+        since = store.since()
+        visible = trades.iloc[:cut]
+        if since is not None:
+            visible = visible.loc[visible.index >= since]
+
+        half = len(visible) // 2
+        chunks = [visible.iloc[:half], visible.iloc[half:]]
+        bars = run_cycle(store, chunks, calendar=calendar)
+        written.update(zip(bars.index, bars.to_numpy().tolist()))
+
+    got = pd.DataFrame.from_dict(
+        written, orient="index", columns=expected.columns
+    )
+    got.index = pd.MultiIndex.from_tuples(got.index, names=["code", "time"])
+    got = got.sort_index()
+
+    assert got.index.equals(expected.index)
+    np.testing.assert_allclose(got.to_numpy(), expected.to_numpy())
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+TradingCalendar sessions and session-anchored buckets.
+"""
+
+import json
+
+import pandas as pd
+import pytest
+
+from trading_calendar import MAX_IDLE_SECONDS, TradingCalendar
+
+
+SUNDAY = pd.Timestamp("2026-01-04")
+FRIDAY = pd.Timestamp("2026-01-09")
+
+
+def stamps(*times) -> pd.DatetimeIndex:
+    return pd.DatetimeIndex([pd.Timestamp(t) for t in times])
+
+
+@pytest.fixture
+def special():
+    """
+    Regular sessions plus a 10:30 - 13:30 day and a holiday.
+    """
+    return TradingCalendar(
+        holidays=["2026-01-07"],
+        special_sessions={"2026-01-05": ("10:30", "13:30")},
+    )
+
+
+def test_sessions(special):
+    assert special.session(SUNDAY + pd.Timedelta("12h")) == (
+        SUNDAY + pd.Timedelta("10:00:00"), SUNDAY + pd.Timedelta("14:30:00")
+    )
+    assert special.session("2026-01-05")[0] == pd.Timestamp("2026-01-05 10:30")
+    assert special.session("2026-01-07") is None
+    assert special.session(FRIDAY) is None
+
+
+def test_buckets_anchor_to_the_open(special):
+    times = stamps(
+        "2026-01-05 10:30", "2026-01-05 11:29:59", "2026-01-05 11:30",
+        "2026-01-05 12:45",
+    )
+
+    assert special.floor(times, "60Min").equals(stamps(
+        "2026-01-05 10:30", "2026-01-05 10:30", "2026-01-05 11:30",
+        "2026-01-05 12:30",
+    ))
+
+
+def test_close_print_joins_the_last_bucket(calendar):
+    times = stamps("2026-01-04 14:29:59", "2026-01-04 14:30")
+
+    assert calendar.floor(times, "5Min").equals(
+        stamps("2026-01-04 14:25", "2026-01-04 14:25")
+    )
+    # 10:00 → 14:30 is not a whole number of hours
+    assert calendar.floor(times, "60Min").equals(
+        stamps("2026-01-04 14:00", "2026-01-04 14:00")
+    )
+
+
+def test_daily_buckets_use_the_calendar_day(special):
+    times = stamps("2026-01-05 10:45", "2026-01-05 13:30")
+
+    assert special.floor(times, "1D").equals(
+        stamps("2026-01-05", "2026-01-05")
+    )
+
+
+def test_session_frame_drops_prints_outside_sessions(special):
+    times = stamps(
+        "2026-01-04 09:59:59", "2026-01-04 10:00", "2026-01-04 14:30",
+        "2026-01-04 14:30:01", "2026-01-05 10:15", "2026-01-07 11:00",
+        "2026-01-09 11:00",
+    )
+    frame = pd.DataFrame({"price": range(len(times))}, index=times)
+
+    assert special.session_frame(frame)["price"].tolist() == [1, 2]
+
+
+def test_idle_seconds(calendar):
+    assert calendar.idle_seconds(SUNDAY + pd.Timedelta("11h")) == 0.0
+    # Late prints are still polled shortly after the close
+    assert calendar.idle_seconds(SUNDAY + pd.Timedelta("14h35min")) == 0.0
+    assert calendar.idle_seconds(SUNDAY + pd.Timedelta("9h59min")) == 60.0
+    assert calendar.idle_seconds(FRIDAY + pd.Timedelta("12h")) == (
+        MAX_IDLE_SECONDS
+    )
+
+
+def test_load(tmp_path):
+    path = tmp_path / "calendar.json"
+    path.write_text(json.dumps({
+        "holidays": ["2026-01-07"],
+        "special_sessions": [
+            {"from": "2026-01-04", "to": "2026-01-05",
+             "open": "10:00", "close": "13:30"},
+        ],
+    }))
+
+    loaded = TradingCalendar.load(path)
+
+    assert loaded.session("2026-01-07") is None
+    assert loaded.session("2026-01-05")[1] == pd.Timestamp("2026-01-05 13:30")
+    assert loaded.session("2026-01-06")[1] == pd.Timestamp("2026-01-06 14:30")
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Timeframe Cascade
+-----------------
+Keeps the session's 1-minute bars in memory and rolls the buckets touched
+by each cycle's new 1-minute bars up into higher timeframes
+(5 / 15 / 30 / 60 minutes, daily ...), so STOCK.TRADES is resampled once
+for every timeframe.
+
+Author: Ahmad Elsayed
+"""
+
+import pandas as pd
+
+from bar_engine import BAR_COLUMNS, bucket_starts, rollup_bars
+
+
+# ==================================================
+# Timeframe Cascade
+# ==================================================
+class TimeframeCascade:
+    """
+    Session 1-minute bars plus their higher-timeframe roll-ups.
+    """
+
+    def __init__(self, freqs: list, calendar=None):
+        """
+        Parameters
+        ----------
+        freqs : list
+            Higher pandas frequencies to derive (e.g. ["5Min", "1D"])
+        calendar : TradingCalendar, optional
+            Anchor intraday buckets to the session open
+        """
+        self.freqs = list(freqs)
+        self.calendar = calendar
+        self.session = self._empty()
+
+    @staticmethod
+    def _empty() -> pd.DataFrame:
+        index = pd.MultiIndex.from_arrays(
+            [[], pd.DatetimeIndex([])], names=["code", "time"]
+        )
+        return pd.DataFrame(columns=BAR_COLUMNS, index=index, dtype=float)
+
+    def warm(self, minute_bars: pd.DataFrame) -> None:
+        """
+        Seed the session with 1-minute bars already stored today.
+        """
+        self.session = minute_bars[BAR_COLUMNS].sort_index()
+
+    def update(self, minute_bars: pd.DataFrame) -> dict:
+        """
+        Merge new / revised 1-minute bars and rebuild the higher-timeframe
+        buckets they fall in.
+
+        Parameters
+        ----------
+        minute_bars : pd.DataFrame
+            (code, time) indexed 1-minute bars touched this cycle
+
+        Returns:
+            dict: frequency → (code, time) indexed bars of touched buckets
+        """
+        if minute_bars.empty or not self.freqs:
+            # Without higher timeframes the session is not kept either
+            return {freq: self._empty() for freq in self.freqs}
+
+        times = minute_bars.index.get_level_values("time")
+        if not self.session.empty:
+            session_day = self.session.index.get_level_values("time").max()
+            if times.min().normalize() > session_day.normalize():
+                # First bars of a new trading day
+                self.session = self._empty()
+
+        self._merge(minute_bars)
+
+        return {
+            freq: self._roll(self._buckets(minute_bars.index, freq), freq)
+            for freq in self.freqs
+        }
+
+    def repair(self, minute_bars: pd.DataFrame, removed: pd.MultiIndex):
+        """
+        Apply rebuilt 1-minute bars and drop deleted ones (see
+        ``dirty_bars``), then rebuild every higher-timeframe bucket they
+        fall in.
+
+        Returns:
+            tuple: (frequency → rebuilt bars, frequency → (code, time)
+            index of higher-timeframe bars left without 1-minute bars)
+        """
+        if not self.freqs:
+            return {}, {}
+
+        self.session = self.session.loc[~self.session.index.isin(removed)]
+        self._merge(minute_bars)
+
+        touched = minute_bars.index.append(removed)
+        rolled = {}
+        stale = {}
+        for freq in self.freqs:
+            buckets = self._buckets(touched, freq)
+            rolled[freq] = self._roll(buckets, freq)
+            stale[freq] = buckets[~buckets.isin(rolled[freq].index)].unique()
+
+        return rolled, stale
+
+    # ------------------------------------------
+    # Helpers
+    # ------------------------------------------
+    def _merge(self, minute_bars: pd.DataFrame) -> None:
+        """
+        Replace / add 1-minute bars in the session.
+        """
+        kept = self.session.loc[~self.session.index.isin(minute_bars.index)]
+        self.session = pd.concat([kept, minute_bars[BAR_COLUMNS]]).sort_index()
+
+    def _buckets(self, keys: pd.MultiIndex, freq: str) -> pd.MultiIndex:
+        """
+        (code, bucket start) of every (code, time) key.
+        """
+        return pd.MultiIndex.from_arrays(
+            [
+                keys.get_level_values(0),
+                bucket_starts(
+                    pd.DatetimeIndex(keys.get_level_values(1)),
+                    freq,
+                    self.calendar
+                ),
+            ],
+            names=["code", "time"],
+        )
+
+    def _roll(self, buckets: pd.MultiIndex, freq: str) -> pd.DataFrame:
+        """
+        Roll the session bars of the given higher-timeframe buckets up.
+        """
+        session_buckets = self._buckets(self.session.index, freq)
+        return rollup_bars(
+            self.session.loc[session_buckets.isin(buckets)],
+            freq,
+            calendar=self.calendar
+        )
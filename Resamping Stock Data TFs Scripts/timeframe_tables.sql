@@ -0,0 +1,36 @@
+-- =============================================================================
+-- Timeframe Tables
+-- -----------------------------------------------------------------------------
+-- Bar tables of the 15, 30 and 60-minute and daily timeframes written by the
+-- Multi-TF daemon (TIMEFRAME_TABLES in Multi-TF-Resampling-Script.py).
+--
+-- Each one copies the column layout of STOCK.FILL_OHLCV (TICKER, OPEN, HIGH,
+-- LOW, CLOSE, VOLUME, BARTIMESTAMP, ASSET, VWAP) and is keyed on
+-- (TICKER, BARTIMESTAMP), the key every bar is merged on. Daily bars are
+-- stamped at midnight of their session day.
+--
+-- Run once as the STOCK schema owner, then restart the daemon; a configured
+-- table that does not exist yet is reported and skipped at startup.
+--
+-- Author: Ahmad Elsayed
+-- =============================================================================
+
+CREATE TABLE STOCK.FILL_OHLCV_15MIN AS
+    SELECT * FROM STOCK.FILL_OHLCV WHERE 1 = 0;
+ALTER TABLE STOCK.FILL_OHLCV_15MIN
+    ADD CONSTRAINT FILL_OHLCV_15MIN_UK UNIQUE (TICKER, BARTIMESTAMP);
+
+CREATE TABLE STOCK.FILL_OHLCV_30MIN AS
+    SELECT * FROM STOCK.FILL_OHLCV WHERE 1 = 0;
+ALTER TABLE STOCK.FILL_OHLCV_30MIN
+    ADD CONSTRAINT FILL_OHLCV_30MIN_UK UNIQUE (TICKER, BARTIMESTAMP);
+
+CREATE TABLE STOCK.FILL_OHLCV_60MIN AS
+    SELECT * FROM STOCK.FILL_OHLCV WHERE 1 = 0;
+ALTER TABLE STOCK.FILL_OHLCV_60MIN
+    ADD CONSTRAINT FILL_OHLCV_60MIN_UK UNIQUE (TICKER, BARTIMESTAMP);
+
+CREATE TABLE STOCK.FILL_OHLCV_1D AS
+    SELECT * FROM STOCK.FILL_OHLCV WHERE 1 = 0;
+ALTER TABLE STOCK.FILL_OHLCV_1D
+    ADD CONSTRAINT FILL_OHLCV_1D_UK UNIQUE (TICKER, BARTIMESTAMP);
@@ -0,0 +1,730 @@
+# -*- coding: utf-8 -*-
+"""
+Trade Pipeline
+--------------
+The trade resampling loop behind the Multi-TF daemon (and the 1-Min /
+5-Min scripts, which run it with fewer timeframes), as a three-stage
+pipeline (see ``pipeline``):
+
+    fetch    streams new trades from STOCK.TRADES every ``poll_seconds``
+             during sessions (see ``trading_calendar``)
+    compute  folds them into 1-minute OHLCV + VWAP bars, rolls the touched
+             buckets up into every higher timeframe with a table
+             (``timeframe_cascade``) and, every minute, rebuilds the bars
+             hit by late or corrected trades (``dirty_bars``)
+    write    merges every timeframe into its table, saves the watermarks
+             once all of them are committed, publishes the bars that
+             closed (``bar_aggregator``) and refreshes the 5-minute
+             CASEINDEX bars every ``index_poll_seconds``
+
+so the next fetch overlaps the current compute and the previous write.
+Each cycle carries its stage timers and counters (``cycle_metrics``) from
+fetch to write, where they are logged and exported. Bars are always merged
+(upsert), which keeps every write idempotent while several cycles are in
+flight.
+
+Author: Ahmad Elsayed
+"""
+
+import threading
+import time
+import traceback
+
+import pandas as pd
+
+from bar_aggregator import BarAggregator
+from bar_engine import BAR_COLUMNS
+from bar_sink import BarSink, stored
+from cycle_metrics import CycleMetrics
+from db_pool import acquire, release
+from dirty_bars import (
+    DirtyBarTracker,
+    repair_frames,
+    stock_bars,
+    stock_ticker,
+)
+from index_resampling import (
+    INDEX_SQL_MAP,
+    IndexVolumeRollup,
+    caseindex_stream,
+    queue_index_bars,
+)
+from last_bar_cache import LastBarCache
+from pipeline import STOP, Pipeline
+from timeframe_cascade import TimeframeCascade
+from trade_stream import (
+    TRADES_SQL,
+    StreamingBarBuilder,
+    iter_frames,
+    trades_since,
+)
+from trade_watermark import TradeWatermarkStore
+from trading_calendar import market_now
+
+
+# Trades are polled often; CASEINDEX only feeds the 5-minute index bars
+# (read incrementally, see index_ticks), so every 30 s keeps them current
+POLL_SECONDS = 2
+INDEX_POLL_SECONDS = 30
+
+# A bar is published once its bucket ended this long before a fetch
+CLOSE_GRACE_SECONDS = 5
+
+# Hand-over queue sizes: trade chunks (fetch → compute) and finished
+# cycles (compute → write); full queues throttle the stage upstream
+CHUNK_QUEUE_SIZE = 8
+CYCLE_QUEUE_SIZE = 2
+
+TABLE_CHECK_SQL = "SELECT * FROM {table} WHERE 1 = 0"
+
+
+# ==================================================
+# Startup Helpers
+# ==================================================
+def available_tables(connection, timeframe_tables: dict) -> dict:
+    """
+    Timeframe tables with every table the database does not have disabled
+    (None), so a missing table cannot fail every flush and hold the trade
+    watermarks back. Every disabled timeframe is reported.
+    """
+    cursor = connection.cursor()
+    tables = {}
+    for freq, table in timeframe_tables.items():
+        if table is None:
+            print(f"Warning: {freq} has no table configured, skipped")
+        else:
+            try:
+                cursor.execute(TABLE_CHECK_SQL.format(table=table))
+            except Exception as e:
+                print(
+                    f"Warning: {freq} table {table} not available, skipped "
+                    f"({e}; see timeframe_tables.sql)"
+                )
+                table = None
+        tables[freq] = table
+    cursor.close()
+    return tables
+
+
+def load_session_minute_bars(connection, table: str) -> pd.DataFrame:
+    """
+    Today's stored 1-minute stock bars, used to seed the cascade.
+
+    Returns:
+        pd.DataFrame: (code, time) indexed bars with BAR_COLUMNS
+    """
+    cursor = connection.cursor()
+    cursor.execute(
+        f"""
+        SELECT TICKER, BARTIMESTAMP, OPEN, HIGH, LOW, CLOSE, VOLUME, VWAP
+        FROM {table}
+        WHERE ASSET = 1
+          AND BARTIMESTAMP >= TRUNC(SYSDATE)
+        """
+    )
+    bars_df = pd.DataFrame(
+        cursor.fetchall(),
+        columns=["code", "time"] + BAR_COLUMNS
+    )
+    cursor.close()
+
+    bars_df["time"] = pd.to_datetime(bars_df["time"])
+    return bars_df.set_index(["code", "time"]).astype(float)
+
+
+# ==================================================
+# Shared Stage State
+# ==================================================
+class TradeFeed:
+    """
+    What the stages tell each other outside the queues.
+    """
+
+    def __init__(self, since):
+        # Fetch bound published by compute after every cycle
+        self.since = since
+        # Set by write when a cycle could not be stored
+        self.rewind = threading.Event()
+        # Bumped by compute on every rewind; write only saves watermark
+        # snapshots taken after the last failed cycle
+        self.generation = 0
+        self.failed_generation = -1
+
+
+# ==================================================
+# Trade Bar Loop
+# ==================================================
+class TradeBarLoop:
+    """
+    Trades → 1-minute bars → higher timeframes, one table per timeframe.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeframe_tables: dict,
+        index_tables=(),
+        calendar=None,
+        mirror=None,
+        membership=None,
+        workers: int = 1,
+        poll_seconds: float = POLL_SECONDS,
+        index_poll_seconds: float = INDEX_POLL_SECONDS,
+        publish=None
+    ):
+        """
+        Parameters
+        ----------
+        name : str
+            Loop name: metrics label and prefix of the state files
+            (``<name>_trade_watermarks``, ``<name>_index_ticks``)
+        timeframe_tables : dict
+            Bar frequency → target table ("1Min" first); None disables a
+            timeframe, and tables missing from the database are disabled
+            at startup (``available_tables``)
+        index_tables : iterable
+            Tables receiving the 5-minute CASEINDEX bars (each must also
+            be a timeframe table, its constituent bars give the volume)
+        calendar : TradingCalendar, optional
+            Sessions: polling stops outside them, bars anchor to the open
+        mirror : BarMirror, optional
+            Local Parquet copy of the written bars
+        membership : IndexMembership, optional
+            Index constituents (required with index tables)
+        workers : int
+            Worker processes for symbol-sharded bar building
+        poll_seconds, index_poll_seconds : float
+            Trade and CASEINDEX polling intervals
+        publish : callable, optional
+            Receives the bars of every timeframe as they close (list of
+            ``BarAggregator`` bars, stored tickers), once they are
+            committed (e.g. a ``ClosedBarFeed``)
+        """
+        self.name = name
+        self.timeframe_tables = dict(timeframe_tables)
+        self.index_tables = list(index_tables)
+        self.calendar = calendar
+        self.mirror = mirror
+        self.membership = membership
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.index_poll_seconds = index_poll_seconds
+        self.publish = publish
+
+        self.tables = {}
+        self.watermarks = None
+        self.tracker = None
+        self.tracker_state = None
+        self.aggregator = None
+        self.aggregator_state = None
+        self.cascade = None
+        self.feed = None
+        self.metrics = None
+        self.index_ticks = None
+        self.index_last_bars = {}
+        self.index_volumes = {}
+
+    # ------------------------------------------
+    # Startup
+    # ------------------------------------------
+    def warm(self) -> None:
+        """
+        Check the tables, restore the watermarks and seed the cascade and
+        the index caches.
+        """
+        con = acquire()
+        try:
+            self.tables = available_tables(con, self.timeframe_tables)
+            stored_tables = [
+                t for t in self.tables.values() if t is not None
+            ]
+            self.index_tables = [
+                t for t in self.index_tables if t in stored_tables
+            ]
+
+            self.watermarks = TradeWatermarkStore(
+                f"{self.name}_trade_watermarks", "1Min"
+            )
+            self.tracker = DirtyBarTracker("1Min", calendar=self.calendar)
+            self.tracker_state = self.tracker.state()
+            self.cascade = TimeframeCascade(
+                [
+                    freq for freq, table in self.tables.items()
+                    if freq != "1Min" and table is not None
+                ],
+                calendar=self.calendar,
+            )
+
+            if self.tables.get("1Min") is not None:
+                self.cascade.warm(
+                    load_session_minute_bars(con, self.tables["1Min"])
+                )
+            elif self.cascade.freqs:
+                # Nothing to seed the cascade from: read the session from
+                # its open
+                self.watermarks.clear()
+
+            # Index bars follow the insert-after-last-bar logic; their
+            # volume is kept in memory from the constituent bars written
+            for table in self.index_tables:
+                self.index_last_bars[table] = LastBarCache(table)
+                self.index_last_bars[table].warm(
+                    con, tickers=list(INDEX_SQL_MAP)
+                )
+                self.index_volumes[table] = IndexVolumeRollup(table)
+                self.index_volumes[table].warm(con)
+
+            # Index ticks: only those after the per-index watermarks
+            if self.index_tables:
+                self.index_ticks = caseindex_stream(
+                    con, f"{self.name}_index_ticks", "5Min",
+                    calendar=self.calendar,
+                )
+        finally:
+            release(con)
+
+        # Trade by trade open bars, only to publish the closed ones
+        if self.publish is not None:
+            self.aggregator = BarAggregator(
+                [f for f, table in self.tables.items() if table is not None],
+                vwap_base=self.watermarks.vwap_base,
+                calendar=self.calendar,
+                grace_seconds=CLOSE_GRACE_SECONDS,
+            )
+            self.aggregator_state = self.aggregator.state()
+
+        self.feed = TradeFeed(self.watermarks.since())
+
+        # Stage timers / counters: JSON log line, Prometheus textfile
+        self.metrics = CycleMetrics(self.name)
+
+    def run(self) -> None:
+        """
+        Warm up, then run the fetch / compute / write pipeline until
+        stopped (Ctrl+C or SIGTERM finish the queued cycles first).
+        """
+        self.warm()
+
+        pipeline = Pipeline(self.name)
+        chunks = pipeline.queue(CHUNK_QUEUE_SIZE)
+        cycles = pipeline.queue(CYCLE_QUEUE_SIZE)
+
+        pipeline.stage("fetch", self.fetch_stage, pipeline, chunks)
+        pipeline.stage(
+            "compute", self.compute_stage, pipeline, chunks, cycles
+        )
+        pipeline.stage("write", self.write_stage, pipeline, cycles)
+
+        pipeline.run()
+
+    # ------------------------------------------
+    # Stage 1: Fetch
+    # ------------------------------------------
+    def fetch_stage(self, pipeline, chunks) -> None:
+        """
+        Stream the trades at/after the published watermark, cycle after
+        cycle.
+        """
+        feed = self.feed
+
+        while not pipeline.stop_event.is_set():
+
+            # Nights, weekends and holidays: sleep until the next session
+            idle = self.calendar.idle_seconds() if self.calendar else 0
+            if idle:
+                pipeline.wait(idle)
+                continue
+
+            started = time.monotonic()
+            since = feed.since
+            cycle = self.metrics.start()
+
+            if not pipeline.put(chunks, ("start", (since, cycle))):
+                return
+
+            con = acquire()
+            try:
+                for chunk in cycle.timed("fetch", iter_frames(
+                    con.cursor(),
+                    TRADES_SQL,
+                    {"since": trades_since(since, self.calendar)},
+                )):
+                    cycle.count("rows_fetched", len(chunk))
+                    if not pipeline.put(chunks, ("chunk", chunk)):
+                        return
+                end = ("end", None)
+            except Exception as e:
+                print(f"Trade fetch failed: {e}")
+                cycle.error()
+                end = ("abort", None)
+            finally:
+                release(con)
+
+            if not pipeline.put(chunks, end):
+                return
+
+            pipeline.wait(self.poll_seconds - (time.monotonic() - started))
+
+        pipeline.put(chunks, STOP)
+
+    # ------------------------------------------
+    # Stage 2: Compute
+    # ------------------------------------------
+    def compute_stage(self, pipeline, chunks, cycles) -> None:
+        """
+        Fold streamed trade chunks into bars; one finished cycle per fetch.
+        """
+        watermarks = self.watermarks
+        feed = self.feed
+        aggregator = self.aggregator
+        builder = None
+        cycle = None
+        skipped = False
+        closed = []
+
+        while True:
+            item = pipeline.get(chunks)
+            if item is STOP:
+                break
+
+            kind, payload = item
+
+            if kind == "start":
+                since, cycle = payload
+
+                if feed.rewind.is_set():
+                    # A cycle was not stored: restart from the saved
+                    # watermarks and the ledger of the trades behind them
+                    watermarks.reload()
+                    self.tracker.restore(self.tracker_state)
+                    if aggregator is not None:
+                        aggregator.restore(self.aggregator_state)
+                    feed.generation += 1
+                    feed.since = watermarks.since()
+                    feed.rewind.clear()
+
+                watermarks.reset_cycle()
+
+                # A fetch bound past the watermark (raced with a rewind or
+                # a restated symbol) would leave a gap: skip that cycle,
+                # the next one fetches from since
+                current = watermarks.since()
+                if since is not None and (current is None or since > current):
+                    feed.since = current
+                    builder = None
+                    # Finished with its fetch, nothing built
+                    skipped = True
+                    cycle.count("cycles_skipped")
+                    continue
+
+                if self.tracker.due():
+                    try:
+                        repair = self.build_repair(since, cycle)
+                    except Exception:
+                        traceback.print_exc()
+                        cycle.error()
+                        repair = None
+                    if repair and not pipeline.put(cycles, repair):
+                        return
+
+                builder = StreamingBarBuilder(
+                    "1Min",
+                    watermarks.vwap_base,
+                    workers=self.workers,
+                    calendar=self.calendar,
+                    track_minutes=True,
+                )
+                fetched_at = market_now()
+                closed = []
+                if aggregator is not None:
+                    # Undone if the fetch is aborted
+                    started_state = aggregator.state()
+
+            elif builder is None:
+                # Failed cycles are finished where they failed
+                if skipped and kind in ("end", "abort"):
+                    skipped = False
+                    self.metrics.finish(cycle)
+                continue
+
+            elif kind == "chunk":
+                try:
+                    with cycle.stage("resample"):
+                        new_trades = watermarks.filter_new(payload)
+                        builder.feed(new_trades)
+                    if aggregator is not None:
+                        with cycle.stage("aggregate"):
+                            closed += aggregator.update_frame(new_trades)
+                except Exception:
+                    traceback.print_exc()
+                    feed.rewind.set()
+                    builder = None
+                    cycle.error()
+                    self.metrics.finish(cycle)
+
+            elif kind == "abort":
+                builder = None
+                if aggregator is not None:
+                    aggregator.restore(started_state)
+                self.metrics.finish(cycle)
+
+            elif kind == "end":
+                try:
+                    if aggregator is not None:
+                        closed += aggregator.advance(fetched_at)
+                    finished = self.build_cycle(builder, cycle, closed)
+                except Exception:
+                    traceback.print_exc()
+                    feed.rewind.set()
+                    builder = None
+                    cycle.error()
+                    self.metrics.finish(cycle)
+                    continue
+
+                builder = None
+                feed.since = watermarks.since()
+
+                if not pipeline.put(cycles, finished):
+                    return
+
+        pipeline.put(cycles, STOP)
+
+    def build_cycle(self, builder, cycle, closed=()) -> dict:
+        """
+        Queue the bars of one fetch cycle, every timeframe, on sinks and
+        move the in-memory watermarks past its trades; ``closed`` are the
+        aggregator's bars that closed meanwhile.
+        """
+        watermarks = self.watermarks
+
+        with cycle.stage("resample"):
+            bars_1m = watermarks.merge_open_bars(builder.result())
+
+        with cycle.stage("lookup"):
+            minute_bars = stock_bars(bars_1m)
+            watermarks.advance_bars(bars_1m, builder.trade_stats)
+        cycle.count(
+            "symbols", bars_1m.index.get_level_values("code").nunique()
+        )
+
+        with cycle.stage("rollup"):
+            bars = {"1Min": minute_bars}
+            bars.update(self.cascade.update(minute_bars))
+
+        self.tracker.record(builder.minute_totals)
+
+        # How far the bars trail the market clock
+        since = watermarks.since()
+        if since is not None:
+            cycle.gauge(
+                "watermark_lag_seconds", (market_now() - since).total_seconds()
+            )
+
+        return self._cycle(
+            cycle, bars, {}, trades=builder.rows, closed=closed
+        )
+
+    def build_repair(self, since, checked):
+        """
+        Rebuild the bars of symbols hit by late or corrected trades, every
+        timeframe, from the trades before ``since`` (the bound of the
+        fetch in flight, whose trades the next cycle builds).
+
+        The comparison is timed on ``checked`` (that fetch's cycle); a
+        repair is a cycle of its own.
+
+        Returns:
+            dict | None: a cycle for the write stage, None if nothing is
+            dirty
+        """
+        con = acquire()
+        try:
+            cursor = con.cursor()
+            with checked.stage("repair"):
+                dirty = self.tracker.find_dirty(cursor, since)
+            if not dirty:
+                return None
+
+            cycle = self.metrics.start()
+            with cycle.stage("repair"):
+                repair = self.tracker.rebuild(cursor, dirty, since)
+        finally:
+            release(con)
+
+        with cycle.stage("repair"):
+            minute_bars, removed = repair_frames(repair)
+            bars, stale = self.cascade.repair(minute_bars, removed)
+            bars["1Min"] = minute_bars
+            stale["1Min"] = removed
+
+        self.tracker.commit(repair, self.watermarks)
+        if self.aggregator is not None:
+            for symbol, stats in repair["stats"].items():
+                self.aggregator.restate(symbol, stats)
+        cycle.count("symbols_repaired", len(repair["totals"]))
+
+        return self._cycle(cycle, bars, stale, repaired=len(repair["totals"]))
+
+    def _cycle(
+        self,
+        cycle,
+        bars: dict,
+        stale: dict,
+        trades: int = 0,
+        repaired: int = 0,
+        closed=()
+    ) -> dict:
+        """
+        A finished cycle for the write stage: one upsert sink per stored
+        timeframe (stale bars deleted, bars merged) and the bars to
+        publish once they are stored.
+        """
+        sinks = {}
+        for freq, table in self.tables.items():
+            if table is None:
+                continue
+            sink = BarSink(table, mode="upsert", mirror=self.mirror)
+            for ticker, bucket in stale.get(freq, ()):
+                sink.delete(ticker, bucket)
+            sink.insert_bars(bars[freq], asset=1)
+            sinks[freq] = sink
+
+        closed = [dict(bar, code=stock_ticker(bar["code"])) for bar in closed]
+        cycle.count("bars_closed", len(closed))
+        aggregator = self.aggregator
+
+        return {
+            "sinks": sinks,
+            "bars": bars,
+            "stale": stale,
+            "trades": trades,
+            "repaired": repaired,
+            "snapshot": self.watermarks.snapshot(),
+            "tracker": self.tracker.state(),
+            "closed": closed,
+            "aggregator": aggregator.state() if aggregator else None,
+            "generation": self.feed.generation,
+            "metrics": cycle,
+        }
+
+    # ------------------------------------------
+    # Stage 3: Write
+    # ------------------------------------------
+    def write_stage(self, pipeline, cycles) -> None:
+        """
+        Store finished cycles in order; watermarks are saved only once the
+        bars of every table are committed.
+        """
+        feed = self.feed
+        table_freqs = {table: freq for freq, table in self.tables.items()}
+        last_index_run = None
+
+        while True:
+            cycle = pipeline.get(cycles)
+            if cycle is STOP:
+                break
+
+            timers = cycle["metrics"]
+
+            con = acquire()
+            try:
+                # One array-DML batch and a single commit per table; rows
+                # rejected by batch errors count as not stored
+                committed = True
+                for freq, sink in cycle["sinks"].items():
+                    with timers.stage("write"):
+                        counts = sink.flush(con)
+                    timers.count_sink(counts)
+                    committed = committed and stored(counts)
+                    self._report(freq, sink.table, cycle, counts)
+
+                if not committed:
+                    feed.failed_generation = cycle["generation"]
+                    feed.rewind.set()
+                else:
+                    for table in self.index_tables:
+                        freq = table_freqs[table]
+                        self.index_volumes[table].record(cycle["bars"][freq])
+                        self.index_volumes[table].remove(
+                            cycle["stale"].get(freq, ())
+                        )
+                    if cycle["generation"] > feed.failed_generation:
+                        self.watermarks.save(cycle["snapshot"])
+                        self.tracker_state = cycle["tracker"]
+                        self.aggregator_state = cycle["aggregator"]
+                        self.publish_closed(cycle["closed"])
+
+                if self.index_tables and (
+                    last_index_run is None
+                    or time.monotonic() - last_index_run
+                    >= self.index_poll_seconds
+                ):
+                    last_index_run = time.monotonic()
+                    with timers.stage("index"):
+                        self.write_index_bars(con, timers)
+
+            except Exception as e:
+                print(f"Bar write failed: {e}")
+                feed.failed_generation = cycle["generation"]
+                feed.rewind.set()
+                timers.error()
+            finally:
+                release(con)
+                self.metrics.finish(timers)
+
+    def publish_closed(self, bars: list) -> None:
+        """
+        Hand the stored bars that closed to ``publish``; a failing
+        subscriber never holds the loop back.
+        """
+        if self.publish is None or not bars:
+            return
+        try:
+            self.publish(bars)
+        except Exception as e:
+            print(f"Closed bar publish failed: {e}")
+
+    @staticmethod
+    def _report(freq: str, table: str, cycle: dict, counts: dict) -> None:
+        if cycle["trades"]:
+            print(
+                f"{freq}: {cycle['trades']} trades → "
+                f"{counts['upserted']} bars merged into {table}"
+            )
+        if cycle["repaired"]:
+            print(
+                f"{freq}: {cycle['repaired']} symbols repaired, "
+                f"{counts['upserted']} bars merged, "
+                f"{counts['deleted']} deleted in {table}"
+            )
+
+    def write_index_bars(self, con, timers) -> None:
+        """
+        Every CASEINDEX series as 5-minute OHLC bars with constituent
+        volume, in every index table; the index watermarks move once all
+        of them have the bars.
+        """
+        cursor = con.cursor()
+
+        self.membership.update(con)
+        index_bars = self.index_ticks.fetch(cursor)
+
+        written = True
+        for table in self.index_tables:
+            index_sink = BarSink(
+                table,
+                cache=self.index_last_bars[table],
+                mode="upsert",
+                mirror=self.mirror,
+            )
+            queued = queue_index_bars(
+                cursor, index_bars, table, index_sink,
+                self.index_last_bars[table], self.membership,
+                volumes=self.index_volumes[table],
+            )
+            counts = index_sink.flush(con)
+            timers.count_sink(counts)
+            written = written and queued and stored(counts)
+
+        if written:
+            self.index_ticks.commit()
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Trade Stream
+------------
+Reads trades (or index ticks) from an open cursor in bounded chunks and
+folds every chunk into bars as it arrives.
+
+Nothing is capped: the cursor is drained completely with
+``arraysize``/``prefetchrows`` tuned round trips, and memory is bounded by
+the chunk size plus the bars built so far, not by the day's volume.
+
+Author: Ahmad Elsayed
+"""
+
+import pandas as pd
+
+from bar_engine import (
+    add_totals,
+    merge_bars,
+    resample_ticks,
+    resample_trades,
+    trade_totals,
+)
+from sharded_bars import PARALLEL_MIN_ROWS, resample_trades_sharded
+from trading_calendar import market_now
+
+
+# Rows per fetch round trip (and per chunk handed to the bar builder)
+FETCH_ARRAYSIZE = 20000
+
+TRADE_COLUMNS = ["code", "time", "price", "volume"]
+
+# The loops' trade query: every symbol from a lower EXEC_TIME bound on
+# (see ``trades_since``), a plain range so the EXEC_TIME index is used
+TRADES_SQL = """
+    SELECT
+        T2.REUTERS,
+        T1.EXEC_TIME,
+        T1.TRADE_PRICE,
+        T1.VOLUME_TRADED
+    FROM STOCK.TRADES T1
+    JOIN STOCK.SYMBOLINFO T2
+        ON T2.SYMBOL_CODE = T1.SYMBOL_CODE
+    WHERE T1.EXEC_TIME >= :since
+    ORDER BY T1.EXEC_TIME
+"""
+
+
+# ==================================================
+# Fetch Bound
+# ==================================================
+def trades_since(since, calendar=None, now=None):
+    """
+    Lower EXEC_TIME bound of ``TRADES_SQL``.
+
+    Parameters
+    ----------
+    since : datetime | None
+        Loop watermark (``TradeWatermarkStore.since``)
+    calendar : TradingCalendar, optional
+        Session calendar; without a watermark the fetch starts at the open
+        of the day's session (midnight without a calendar or a session)
+    now : datetime, optional
+        Market clock (default ``market_now``)
+
+    Returns:
+        datetime: the watermark, else the start of the trading day
+    """
+    if since is not None:
+        return since
+
+    now = market_now() if now is None else pd.Timestamp(now)
+    session = calendar.session(now) if calendar is not None else None
+    start = session[0] if session is not None else now.normalize()
+    return start.to_pydatetime()
+
+
+# ==================================================
+# Cursor Streaming
+# ==================================================
+def iter_frames(
+    cursor,
+    sql: str,
+    params=None,
+    columns: list = TRADE_COLUMNS,
+    arraysize: int = FETCH_ARRAYSIZE
+):
+    """
+    Execute a query and yield its rows as time-indexed DataFrame chunks.
+
+    The ``time`` column becomes the index and incomplete rows are dropped,
+    as the scripts did for the full result set.
+    """
+    cursor.arraysize = arraysize
+    if hasattr(cursor, "prefetchrows"):
+        cursor.prefetchrows = arraysize + 1
+
+    cursor.execute(sql, params or {})
+
+    while True:
+        rows = cursor.fetchmany(arraysize)
+        if not rows:
+            break
+
+        chunk = pd.DataFrame(rows, columns=columns)
+        chunk.set_index("time", inplace=True)
+        chunk.index = pd.to_datetime(chunk.index)
+        chunk.dropna(inplace=True)
+
+        yield chunk
+
+
+# ==================================================
+# Incremental Bar Builders
+# ==================================================
+class StreamingBarBuilder:
+    """
+    Folds ordered trade chunks into OHLCV + VWAP bars.
+
+    Per symbol it also tracks what the trade watermark needs: running
+    VWAP totals, last EXEC_TIME and the number of trades at that time.
+    """
+
+    def __init__(
+        self,
+        freq: str,
+        vwap_base_lookup=None,
+        workers: int = 1,
+        calendar=None,
+        track_minutes: bool = False
+    ):
+        """
+        Parameters
+        ----------
+        freq : str
+            Pandas bar frequency (e.g. "1Min")
+        vwap_base_lookup : callable, optional
+            symbol → (price x volume, volume) totals before this stream,
+            queried the first time a symbol shows up
+        workers : int
+            Worker processes for symbol-sharded building (see
+            ``sharded_bars``); 1 builds every chunk in-process
+        calendar : TradingCalendar, optional
+            Session calendar: trades outside a session are dropped and
+            buckets are anchored to the session open
+        track_minutes : bool
+            Also keep per-minute ``trade_totals`` of the trades fed, for
+            dirty-bar tracking (see ``dirty_bars``)
+        """
+        self.freq = freq
+        self.vwap_base_lookup = vwap_base_lookup
+        self.workers = workers
+        self.calendar = calendar
+        self.track_minutes = track_minutes
+        self.minute_totals = None
+        self.bars = None
+        self.totals = {}
+        self.last_times = {}
+        self.rows = 0
+        self.pending = []
+        self.pending_rows = 0
+
+    def feed(self, trades_df: pd.DataFrame) -> None:
+        """
+        Add the next chunk of trades (ordered by EXEC_TIME).
+        """
+        if self.calendar is not None:
+            trades_df = self.calendar.session_frame(trades_df)
+
+        if trades_df.empty:
+            return
+
+        self.rows += len(trades_df)
+
+        if self.track_minutes:
+            self.minute_totals = add_totals(
+                self.minute_totals, trade_totals(trades_df)
+            )
+
+        if self.workers <= 1:
+            self._fold(trades_df)
+            return
+
+        # Sharded mode: gather chunks until the batch is worth the workers
+        self.pending.append(trades_df)
+        self.pending_rows += len(trades_df)
+        if self.pending_rows >= PARALLEL_MIN_ROWS:
+            self._fold_pending()
+
+    def _fold_pending(self) -> None:
+        if self.pending:
+            batch = pd.concat(self.pending)
+            self.pending = []
+            self.pending_rows = 0
+            self._fold(batch)
+
+    def _fold(self, trades_df: pd.DataFrame) -> None:
+        """
+        Turn one ordered batch of trades into bars and running totals.
+        """
+        for code in trades_df["code"].unique():
+            if code not in self.totals:
+                self.totals[code] = (
+                    self.vwap_base_lookup(code)
+                    if self.vwap_base_lookup else (0.0, 0.0)
+                )
+
+        chunk_bars = resample_trades_sharded(
+            trades_df,
+            self.freq,
+            vwap_base=self.totals,
+            workers=self.workers,
+            calendar=self.calendar
+        )
+        self.bars = merge_bars(self.bars, chunk_bars)
+
+        # Running totals for the next chunk's VWAP
+        frame = pd.DataFrame({
+            "code": trades_df["code"].to_numpy(),
+            "time": trades_df.index,
+            "pv": (trades_df["price"] * trades_df["volume"]).to_numpy(),
+            "volume": trades_df["volume"].to_numpy(dtype=float),
+        })
+        sums = frame.groupby("code")[["pv", "volume"]].sum()
+        for code, pv, volume in sums.itertuples():
+            base_pv, base_volume = self.totals[code]
+            self.totals[code] = (base_pv + pv, base_volume + volume)
+
+        # Last trade time per symbol and how many trades share it
+        last = frame.groupby("code")["time"].max()
+        at_last = frame["time"].to_numpy() == frame["code"].map(last).to_numpy()
+        counts = frame.loc[at_last].groupby("code").size()
+        for code, last_time in last.items():
+            previous = self.last_times.get(code)
+            count = int(counts[code])
+            if previous is not None and previous[0] == last_time:
+                count += previous[1]
+            self.last_times[code] = (last_time, count)
+
+    def trade_stats(self, code: str) -> dict:
+        """
+        Watermark inputs of a symbol after every chunk fed so far.
+        """
+        self._fold_pending()
+        cum_pv, cum_volume = self.totals[code]
+        last_time, last_count = self.last_times[code]
+        return {
+            "last_time": last_time,
+            "last_count": last_count,
+            "cum_pv": cum_pv,
+            "cum_volume": cum_volume,
+        }
+
+    def result(self) -> pd.DataFrame:
+        """
+        Bars built so far, indexed by (code, time).
+        """
+        self._fold_pending()
+        if self.bars is None:
+            return resample_trades(pd.DataFrame(), self.freq)
+        return self.bars
+
+
+def stream_index_bars(
+    cursor,
+    sql: str,
+    freq: str,
+    columns: list,
+    calendar=None
+) -> pd.DataFrame:
+    """
+    Stream index ticks and build their OHLC bars chunk by chunk.
+
+    Parameters
+    ----------
+    columns : list
+        Result column names; must contain "time", "code" and "price"
+    calendar : TradingCalendar, optional
+        Drop ticks outside a session and anchor buckets to the session open
+
+    Returns:
+        pd.DataFrame: (code, time) indexed OHLC bars
+    """
+    bars = None
+    for chunk in iter_frames(cursor, sql, columns=columns):
+        if calendar is not None:
+            chunk = calendar.session_frame(chunk)
+        bars = merge_bars(bars, resample_ticks(chunk, freq, calendar=calendar))
+
+    if bars is None:
+        return resample_ticks(pd.DataFrame(), freq)
+    return bars
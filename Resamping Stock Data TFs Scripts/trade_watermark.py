@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+"""
+Trade Watermark Store
+---------------------
+Remembers, per symbol, how far STOCK.TRADES has already been consumed by a
+resampling loop, so every cycle only fetches the trades that arrived since
+the previous one.
+
+For each symbol the store keeps:
+    - the last EXEC_TIME processed and how many trades carried that time
+    - the running price x volume / volume totals used by the session VWAP
+    - the partial (still open) bar the last trades landed in
+
+The state is saved as JSON next to the scripts and survives restarts.
+A symbol is reset automatically when its trades roll over to a new day.
+
+Author: Ahmad Elsayed
+"""
+
+import copy
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# ==================================================
+# Configuration
+# ==================================================
+STATE_DIR = Path(__file__).resolve().parent / "state"
+
+# Values kept of the partial (still open) bar of every symbol
+OPEN_BAR_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+# How far the fetch bound stays behind the most recent watermark, for
+# symbols whose trades are committed after later trades of other symbols
+FETCH_OVERLAP = pd.Timedelta("1Min")
+
+
+# ==================================================
+# Watermark Store
+# ==================================================
+class TradeWatermarkStore:
+    """
+    Persisted per-symbol trade watermarks for one bar timeframe.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        freq: str,
+        state_dir: Path = STATE_DIR,
+        overlap: pd.Timedelta = FETCH_OVERLAP
+    ):
+        """
+        Parameters
+        ----------
+        name : str
+            State file name (without extension), one per loop/timeframe
+        freq : str
+            Pandas bar frequency handled by the loop (e.g. "1Min", "5Min")
+        state_dir : Path
+            Folder holding the JSON state files
+        overlap : pd.Timedelta
+            How far the fetch bound may stay behind the latest watermark
+            (see ``since``)
+        """
+        self.freq = freq
+        self.overlap = overlap
+        self.path = Path(state_dir) / f"{name}.json"
+        self.symbols = {}
+        self.skipped = {}
+        self.load()
+
+    # ------------------------------------------
+    # Persistence
+    # ------------------------------------------
+    def load(self) -> None:
+        """
+        Load the saved watermarks, if any.
+        """
+        if not self.path.exists():
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as state_file:
+                saved = json.load(state_file)
+        except (OSError, ValueError) as error:
+            print(f"Ignoring unreadable watermark file {self.path}: {error}")
+            return
+
+        if saved.get("freq") != self.freq:
+            return
+
+        for symbol, state in saved.get("symbols", {}).items():
+            state["last_time"] = pd.Timestamp(state["last_time"])
+            if state.get("open_bar"):
+                state["open_bar"]["time"] = pd.Timestamp(
+                    state["open_bar"]["time"]
+                )
+            self.symbols[symbol] = state
+
+    def reload(self) -> None:
+        """
+        Drop the in-memory state and go back to the last saved watermarks.
+        """
+        self.symbols = {}
+        self.skipped = {}
+        self.load()
+
+    def clear(self) -> None:
+        """
+        Forget every watermark: the next cycle reads the session from its
+        open.
+        """
+        self.symbols = {}
+        self.skipped = {}
+
+    def snapshot(self) -> dict:
+        """
+        Copy of the per-symbol state, to be saved later (see ``save``).
+        """
+        return copy.deepcopy(self.symbols)
+
+    def save(self, symbols: dict = None) -> None:
+        """
+        Atomically write the watermarks (or an earlier ``snapshot``) to disk.
+        """
+        if symbols is None:
+            symbols = self.symbols
+
+        payload = {"freq": self.freq, "symbols": {}}
+
+        for symbol, state in symbols.items():
+            entry = dict(state)
+            entry["last_time"] = state["last_time"].isoformat()
+            if state.get("open_bar"):
+                entry["open_bar"] = dict(state["open_bar"])
+                entry["open_bar"]["time"] = state["open_bar"]["time"].isoformat()
+            payload["symbols"][symbol] = entry
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as state_file:
+            json.dump(payload, state_file)
+        tmp_path.replace(self.path)
+
+    # ------------------------------------------
+    # Fetch Window
+    # ------------------------------------------
+    def fetch_since(self):
+        """
+        Lower EXEC_TIME bound for the next trades query.
+
+        Called once at the start of every cycle; it also resets the count
+        of already-processed trades skipped so far in the cycle.
+
+        Returns:
+            datetime | None: None means no watermark yet (see
+            ``trade_stream.trades_since``)
+        """
+        self.reset_cycle()
+        return self.since()
+
+    def since(self):
+        """
+        Lower EXEC_TIME bound covering every symbol (no cycle reset).
+
+        The earliest symbol watermark, but never more than ``overlap``
+        behind the latest one: a symbol whose trades are committed late
+        (EXEC_TIME before another symbol's watermark) is still fetched,
+        while a symbol that stopped trading does not pin the bound to its
+        last trade. Trades fetched again are dropped by ``filter_new``;
+        later commits are left to the dirty-bar check (``dirty_bars``).
+        """
+        if not self.symbols:
+            return None
+        last_times = [s["last_time"] for s in self.symbols.values()]
+        since = max(min(last_times), max(last_times) - self.overlap)
+        return since.to_pydatetime()
+
+    def reset_cycle(self) -> None:
+        """
+        Start a new fetch cycle (trades at the watermark are skipped anew).
+        """
+        self.skipped = {}
+
+    # ------------------------------------------
+    # Delta
+    # ------------------------------------------
+    def filter_new(self, trades_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Drop the trades of a fetched chunk that were already processed.
+
+        The fetch uses ">=" on the watermark time, so trades sharing the last
+        processed EXEC_TIME come back again; the stored count skips them,
+        even when they are spread over several fetched chunks. Every symbol
+        is filtered with one mask built from its watermark.
+        """
+        if not self.symbols or trades_df.empty:
+            return trades_df
+
+        codes = trades_df["code"]
+        self._roll_over(codes, trades_df.index)
+
+        states = self.symbols
+        last_times = pd.DatetimeIndex(codes.map(
+            {code: state["last_time"] for code, state in states.items()}
+        ))
+
+        same = trades_df.index == last_times
+        keep = last_times.isna() | (trades_df.index > last_times)
+
+        if same.any():
+            # Position of each trade among its symbol's trades at the
+            # watermark: the first last_count of them were processed
+            same_codes = codes[same]
+            seen = same_codes.map(self.skipped).fillna(0).to_numpy(dtype=int)
+            position = same_codes.groupby(same_codes).cumcount().to_numpy()
+            last_counts = same_codes.map(
+                {code: state["last_count"] for code, state in states.items()}
+            ).to_numpy(dtype=int)
+            keep[same] = position + seen >= last_counts
+
+            for code, count in same_codes.value_counts().items():
+                self.skipped[code] = min(
+                    self.skipped.get(code, 0) + count,
+                    states[code]["last_count"],
+                )
+
+        return trades_df.loc[keep]
+
+    def _roll_over(self, codes: pd.Series, times: pd.DatetimeIndex) -> None:
+        """
+        Forget the symbols whose trades in a chunk all fall on a later day
+        than their watermark: they start the new day from scratch.
+        """
+        first = pd.Series(times, index=codes.to_numpy()).groupby(
+            level=0, sort=False
+        ).min()
+        last_times = pd.DatetimeIndex(first.index.map(
+            {code: state["last_time"] for code, state in self.symbols.items()}
+        ))
+
+        rolled = first.dt.normalize().to_numpy() > last_times.normalize()
+        for code in first.index[rolled]:
+            del self.symbols[code]
+            self.skipped.pop(code, None)
+
+    def vwap_base(self, symbol: str):
+        """
+        Running (price x volume, volume) totals before the new trades.
+        """
+        state = self.symbols.get(symbol)
+        if state is None:
+            return 0.0, 0.0
+        return state["cum_pv"], state["cum_volume"]
+
+    def merge_open_bars(self, bars_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Fold the stored partial bars into the bars built from new trades
+        that fall in the same bucket.
+
+        Parameters
+        ----------
+        bars_df : pd.DataFrame
+            (code, time) indexed bars of every symbol
+            (``StreamingBarBuilder.result``)
+        """
+        open_bars = self._open_bars()
+        if open_bars.empty or bars_df.empty:
+            return bars_df
+
+        stored = open_bars.reindex(bars_df.index)
+        matched = stored["open"].notna().to_numpy()
+        if not matched.any():
+            return bars_df
+
+        bars_df = bars_df.copy()
+        bars_df["open"] = np.where(matched, stored["open"], bars_df["open"])
+        bars_df["high"] = np.fmax(bars_df["high"], stored["high"])
+        bars_df["low"] = np.fmin(bars_df["low"], stored["low"])
+        bars_df["volume"] += stored["volume"].fillna(0.0)
+        return bars_df
+
+    def _open_bars(self) -> pd.DataFrame:
+        """
+        Stored partial bars as a (code, time) indexed frame.
+        """
+        open_bars = [
+            (symbol, state["open_bar"])
+            for symbol, state in self.symbols.items()
+            if state.get("open_bar")
+        ]
+        index = pd.MultiIndex.from_arrays(
+            [
+                [symbol for symbol, _ in open_bars],
+                pd.DatetimeIndex([bar["time"] for _, bar in open_bars]),
+            ],
+            names=["code", "time"],
+        )
+        return pd.DataFrame(
+            [[bar[c] for c in OPEN_BAR_COLUMNS] for _, bar in open_bars],
+            index=index,
+            columns=OPEN_BAR_COLUMNS,
+            dtype=float,
+        )
+
+    # ------------------------------------------
+    # Advance
+    # ------------------------------------------
+    def advance_bars(self, bars_df: pd.DataFrame, trade_stats) -> None:
+        """
+        ``advance`` every symbol of a (code, time) indexed bar frame,
+        already merged with the open bars (``merge_open_bars``).
+
+        Parameters
+        ----------
+        trade_stats : callable
+            symbol → watermark inputs (``StreamingBarBuilder.trade_stats``)
+        """
+        if bars_df.empty:
+            return
+
+        last_bars = bars_df.groupby(level="code", sort=False).tail(1)
+        for (symbol, bar_time), values in zip(
+            last_bars.index,
+            last_bars[OPEN_BAR_COLUMNS].to_numpy(dtype=float).tolist(),
+        ):
+            self._advance(symbol, trade_stats(symbol), bar_time, values)
+
+    def advance(
+        self,
+        symbol: str,
+        trade_stats: dict,
+        ohlc_df: pd.DataFrame
+    ) -> None:
+        """
+        Move the symbol watermark past the trades just turned into bars.
+
+        Parameters
+        ----------
+        symbol : str
+            Symbol code as returned by the trades query
+        trade_stats : dict
+            ``last_time`` / ``last_count`` of the new trades and the running
+            ``cum_pv`` / ``cum_volume`` totals including them
+            (see ``StreamingBarBuilder.trade_stats``)
+        ohlc_df : pd.DataFrame
+            Bars built from those trades, already merged with the open bar
+        """
+        if ohlc_df.empty:
+            return
+
+        self._advance(
+            symbol,
+            trade_stats,
+            ohlc_df.index[-1],
+            ohlc_df[OPEN_BAR_COLUMNS].iloc[-1].to_numpy(dtype=float).tolist(),
+        )
+
+    def _advance(
+        self,
+        symbol: str,
+        trade_stats: dict,
+        bar_time,
+        bar_values: list
+    ) -> None:
+        """
+        Store the new watermark and open bar (OPEN_BAR_COLUMNS values) of
+        a symbol.
+        """
+        state = self.symbols.get(symbol, {})
+
+        last_count = trade_stats["last_count"]
+        if state.get("last_time") == trade_stats["last_time"]:
+            last_count += state["last_count"]
+
+        self.symbols[symbol] = {
+            "last_time": trade_stats["last_time"],
+            "last_count": last_count,
+            "cum_pv": float(trade_stats["cum_pv"]),
+            "cum_volume": float(trade_stats["cum_volume"]),
+            "open_bar": {
+                "time": bar_time,
+                **dict(zip(OPEN_BAR_COLUMNS, bar_values)),
+            },
+        }
+
+    def restate(
+        self,
+        symbol: str,
+        trade_stats: dict,
+        ohlc_df: pd.DataFrame
+    ) -> None:
+        """
+        Replace the symbol watermark after its bars were rebuilt from
+        STOCK.TRADES (see ``dirty_bars``); None stats forget the symbol.
+        """
+        self.symbols.pop(symbol, None)
+        self.skipped.pop(symbol, None)
+        if trade_stats is not None:
+            self.advance(symbol, trade_stats, ohlc_df)
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Trading Calendar
+----------------
+EGX trading sessions for the resampling loops.
+
+    - Regular session: Sunday to Thursday, 10:00 to 14:30 Cairo time.
+    - Holidays and special sessions (Ramadan hours, half-days) are read
+      from egx_calendar.json (or the file named by EGX_CALENDAR_FILE).
+
+Bars are anchored to the session open and trades outside the session are
+left out, so the first and last bars of a day are never built from pre-open
+or post-close prints. The loops use ``idle_seconds`` to sleep through
+nights, weekends and holidays instead of re-scanning unchanged tables.
+
+Times are naive Cairo local time, like EXEC_TIME / INDEXTIME.
+
+Author: Ahmad Elsayed
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+TIMEZONE = "Africa/Cairo"
+
+# pandas weekday numbers (Monday = 0): Sunday to Thursday
+SESSION_DAYS = (6, 0, 1, 2, 3)
+SESSION_OPEN = "10:00"
+SESSION_CLOSE = "14:30"
+
+# Polling continues this long after the close for late-reported trades
+POST_CLOSE_MINUTES = 10
+
+# Longest single sleep while the market is closed
+MAX_IDLE_SECONDS = 3600
+
+CALENDAR_FILE = Path(os.environ.get(
+    "EGX_CALENDAR_FILE", Path(__file__).with_name("egx_calendar.json")
+))
+
+DAY = pd.Timedelta("1D")
+
+
+# ==================================================
+# Helpers
+# ==================================================
+def market_now() -> pd.Timestamp:
+    """
+    Current Cairo wall-clock time as a naive timestamp.
+    """
+    return pd.Timestamp.now(tz=TIMEZONE).tz_localize(None)
+
+
+def _clock(value: str) -> pd.Timedelta:
+    """
+    "HH:MM" → offset from midnight.
+    """
+    hours, minutes = value.split(":")
+    return pd.Timedelta(hours=int(hours), minutes=int(minutes))
+
+
+# ==================================================
+# Trading Calendar
+# ==================================================
+class TradingCalendar:
+    """
+    Session days, hours and holidays of one exchange.
+    """
+
+    def __init__(
+        self,
+        holidays=(),
+        special_sessions: dict = None,
+        session_days=SESSION_DAYS,
+        open_time: str = SESSION_OPEN,
+        close_time: str = SESSION_CLOSE
+    ):
+        """
+        Parameters
+        ----------
+        holidays : iterable
+            Dates without a session
+        special_sessions : dict, optional
+            date → ("HH:MM" open, "HH:MM" close) for days with other hours
+        session_days : iterable
+            pandas weekday numbers with a regular session
+        open_time, close_time : str
+            Regular session hours ("HH:MM")
+        """
+        self.session_days = set(session_days)
+        self.hours = (_clock(open_time), _clock(close_time))
+        self.holidays = {pd.Timestamp(day).normalize() for day in holidays}
+        self.special = {
+            pd.Timestamp(day).normalize(): (_clock(start), _clock(end))
+            for day, (start, end) in (special_sessions or {}).items()
+        }
+
+    @classmethod
+    def load(cls, path: Path = CALENDAR_FILE) -> "TradingCalendar":
+        """
+        Calendar with the holidays / special sessions of a JSON file.
+
+        The file holds ``holidays`` (list of dates) and
+        ``special_sessions`` (list of {"from", "to", "open", "close"};
+        "to" defaults to "from"). A missing file gives the regular weekly
+        sessions only.
+        """
+        path = Path(path)
+        if not path.exists():
+            print(f"Trading calendar {path} not found: no holidays loaded")
+            return cls()
+
+        with path.open() as f:
+            config = json.load(f)
+
+        special = {}
+        for entry in config.get("special_sessions", []):
+            days = pd.date_range(entry["from"], entry.get("to", entry["from"]))
+            for day in days:
+                special[day] = (entry["open"], entry["close"])
+
+        return cls(
+            holidays=config.get("holidays", []), special_sessions=special
+        )
+
+    # ------------------------------------------
+    # Sessions
+    # ------------------------------------------
+    def _hours(self, day: pd.Timestamp):
+        """
+        (open offset, close offset, trading?) of a normalized date.
+        """
+        start, end = self.special.get(day, self.hours)
+        trading = (
+            day.weekday() in self.session_days and day not in self.holidays
+        )
+        return start, end, trading
+
+    def session(self, day):
+        """
+        Open / close of the session on a date.
+
+        Returns:
+            tuple | None: (open, close) timestamps, None without a session
+        """
+        day = pd.Timestamp(day).normalize()
+        start, end, trading = self._hours(day)
+        if not trading:
+            return None
+        return day + start, day + end
+
+    def next_session(self, now=None):
+        """
+        The session in progress at ``now`` or the next one after it.
+
+        Returns:
+            tuple: (open, close) timestamps
+        """
+        now = market_now() if now is None else pd.Timestamp(now)
+        day = now.normalize()
+
+        # A year without a single session means a broken calendar file
+        for _ in range(366):
+            session = self.session(day)
+            if session is not None and now <= session[1]:
+                return session
+            day += DAY
+
+        raise ValueError("No trading session within a year")
+
+    def idle_seconds(
+        self,
+        now=None,
+        post_close_minutes: float = POST_CLOSE_MINUTES
+    ) -> float:
+        """
+        How long a polling loop should sleep before its next cycle.
+
+        Returns:
+            float: 0 during a session (and ``post_close_minutes`` after its
+            close), else the time to the next open, capped at
+            MAX_IDLE_SECONDS
+        """
+        now = market_now() if now is None else pd.Timestamp(now)
+        grace = pd.Timedelta(minutes=post_close_minutes)
+
+        session = self.session(now)
+        if session is not None and session[0] <= now <= session[1] + grace:
+            return 0.0
+
+        start, _ = self.next_session(now)
+        return min((start - now).total_seconds(), MAX_IDLE_SECONDS)
+
+    # ------------------------------------------
+    # Vectorized Time Helpers
+    # ------------------------------------------
+    def _bounds(self, times: pd.DatetimeIndex):
+        """
+        Session open, close and trading flag for every timestamp.
+        """
+        day_ids, days = pd.factorize(times.normalize())
+        hours = [self._hours(day) for day in days]
+
+        opens = days + pd.TimedeltaIndex([h[0] for h in hours])
+        closes = days + pd.TimedeltaIndex([h[1] for h in hours])
+        trading = np.array([h[2] for h in hours], dtype=bool)
+
+        return opens[day_ids], closes[day_ids], trading[day_ids]
+
+    def in_session(self, times) -> np.ndarray:
+        """
+        Boolean mask of the timestamps inside a session (close included).
+        """
+        times = pd.DatetimeIndex(times)
+        if times.empty:
+            return np.zeros(0, dtype=bool)
+
+        opens, closes, trading = self._bounds(times)
+        return trading & (times >= opens) & (times <= closes)
+
+    def session_frame(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        Rows of a time-indexed frame that fall inside a session.
+        """
+        if frame.empty:
+            return frame
+        return frame.loc[self.in_session(frame.index)]
+
+    def floor(self, times, freq: str) -> pd.DatetimeIndex:
+        """
+        Session-anchored bucket start of every timestamp.
+
+        Intraday buckets count from the session open; a print at the close
+        goes into the last bucket instead of opening a bar of its own.
+        Daily and longer frequencies keep the plain calendar floor.
+        """
+        times = pd.DatetimeIndex(times)
+        step = pd.Timedelta(freq)
+        if step >= DAY or times.empty:
+            return times.floor(freq)
+
+        opens, closes, _ = self._bounds(times)
+
+        buckets = opens + ((times - opens) // step) * step
+        last_offset = closes - opens - pd.Timedelta(1, "us")
+        last = opens + (last_offset // step) * step
+
+        return pd.DatetimeIndex(buckets.where(buckets <= last, last))
@@ -1,10 +1,18 @@
 # -*- coding: utf-8 -*-
 
-import cx_Oracle
 import pandas as pd
 import csv
 import os
+import sys
 from datetime import date
+from pathlib import Path
+
+# Shared Oracle session pool (db_pool) lives with the resampling modules
+sys.path.insert(
+    0, str(Path(__file__).resolve().parents[1] / "Resamping Stock Data TFs Scripts")
+)
+
+from db_pool import acquire, release  # noqa: E402
 
 # ==============================================================================
 # Configuration
@@ -53,13 +61,6 @@ def clean_flow_dataframe(df, columns):
     return df
 
 
-def db_connect():
-    con = cx_Oracle.connect(
-        'STOCK/P3rXdM5HbSgQRmCS@10.1.20.41:1521/STOCK'
-    )
-    return con
-
-
 # ==============================================================================
 # 1️⃣ Process 1 – Clean Raw TickerChart Data
 # ==============================================================================
@@ -146,7 +147,7 @@ print("2nd Process done – NetFlow CSVs generated")
 # 3️⃣ Process 3 – Insert Latest NetFlow into Oracle DB
 # ==============================================================================
 
-con = db_connect()
+con = acquire()
 cursor = con.cursor()
 
 files = [
@@ -190,4 +191,6 @@ for file in files:
             print(f"Insert failed for {row['TICKER']}")
             print(e)
 
+release(con)
+
 print("3rd Process done – Database insertion completed")
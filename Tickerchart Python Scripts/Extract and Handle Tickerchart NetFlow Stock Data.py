@@ -1,8 +1,17 @@
 import os
+import sys
 import csv
 from datetime import date
+from pathlib import Path
 import pandas as pd
-import cx_Oracle
+
+# Shared Oracle session pool (db_pool) lives with the resampling modules
+sys.path.insert(
+    0, str(Path(__file__).resolve().parents[1] / "Resamping Stock Data TFs Scripts")
+)
+
+from db_pool import pooled_connection  # noqa: E402
+from index_membership import IndexMembership  # noqa: E402
 
 # =============================================================================
 # Configuration
@@ -118,39 +127,16 @@ def export_ticker_standalone_files():
 # =============================================================================
 # Stage 3 – Index (EGX) Aggregation
 # =============================================================================
-def fetch_index_symbols(sql: str, connection) -> list:
-    df = pd.read_sql(sql, connection)
-    return df["REUTERS"].apply(lambda x: x.split(".")[0]).unique()
-
-
 def export_index_netflows():
-    con = cx_Oracle.connect("STOCK/P3rXdM5HbSgQRmCS@10.1.20.41:1521/STOCK")
-
-    EGX50 = [
-        "ABUK","EMFD","ALCN","AMOC","COMI","SWDY","EAST","EKHO","EKHOA","ETEL",
-        "ORWE","ORAS","EFIH","EFID","PHDC","BTFH","FAITA","FAIT","CIEB","BINV",
-        "JUFO","GBCO","ESRS","SKPC","CLHO","FWRY","HRHO","TMGH","MASR","HELI",
-        "MFPC","ADIB","CCAP","CIRA","EFIC","EGAL","EGCH","HDBK","ISPH","MCQE",
-        "OIH","OLFI","PHAR","RMDA","SAUD","TALM","ZMID","ASCM","OCDI","ARCC"
-    ]
-
-    EGX70 = fetch_index_symbols("""
-        SELECT SYMBOLINFO.REUTERS
-        FROM EGX70_SYMBOLS
-        LEFT JOIN SYMBOLINFO ON EGX70_SYMBOLS.SYMBOL_CODE = SYMBOLINFO.SYMBOL_CODE
-    """, con)
-
-    EGX100 = fetch_index_symbols("""
-        SELECT SYMBOLINFO.REUTERS
-        FROM EGX100_SYMBOLS
-        LEFT JOIN SYMBOLINFO ON EGX100_SYMBOLS.SYMBOL_CODE = SYMBOLINFO.SYMBOL_CODE
-    """, con)
-
-    SHARIAH = fetch_index_symbols("""
-        SELECT SYMBOLINFO.REUTERS
-        FROM EGX_SHARIAH_SYMBOLS
-        LEFT JOIN SYMBOLINFO ON EGX_SHARIAH_SYMBOLS.SYMBOL_CODE = SYMBOLINFO.SYMBOL_CODE
-    """, con)
+    # Constituents from the shared resolver (one query, TTL snapshot)
+    membership = IndexMembership()
+    with pooled_connection() as con:
+        membership.update(con)
+
+    EGX50 = membership.members("EGX50")
+    EGX70 = membership.members("EGX70")
+    EGX100 = membership.members("EGX100")
+    SHARIAH = membership.members("SHARIAH")
 
     index_configs = [
         ("EGX50EWI FLOW ", "EGX50LASTEWI FLOW ", EGX50),